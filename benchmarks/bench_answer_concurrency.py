@@ -0,0 +1,191 @@
+"""
+Конкурентная проверка ответов: N пользователей одновременно отвечают на одно
+и то же задание.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_answer_concurrency [--users 200] [--rtt-ms 2]
+
+БД эмулируется сессией с построчными блокировками: SELECT ... FOR UPDATE
+держит блокировку строки до конца транзакции, каждый запрос стоит один RTT.
+Режим legacy повторяет старый путь (блокировка строки Task на всю транзакцию),
+режим current вызывает текущий check_answer, который блокирует только строки
+статистики самого пользователя.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from core.database.hooks import discard_after_rollback, run_after_commit
+from core.database.models import (
+    Task, User, UserStat, UserProgress, UserStatus, Complexity, PartNumber
+)
+from core.services.answer_checker import check_answer
+from core.services.task_catalog import task_catalog
+
+TASK_ID = 1
+
+
+class FakeResult:
+    def scalars(self):
+        return self
+
+    def all(self):
+        return []
+
+    def scalar_one_or_none(self):
+        return None
+
+    def scalar(self):
+        return None
+
+
+class FakeDatabase:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.locks = defaultdict(asyncio.Lock)
+        self.rows = {}
+
+    def session(self):
+        return FakeSession(self)
+
+
+class FakeSession:
+    """Минимальная замена AsyncSession с блокировками строк до конца транзакции"""
+
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.held = []
+        self.info = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._release()
+
+    async def _round_trip(self):
+        await asyncio.sleep(self.db.rtt)
+
+    def _release(self):
+        while self.held:
+            self.held.pop().release()
+
+    @asynccontextmanager
+    async def begin(self):
+        try:
+            yield self
+            await self._round_trip()  # COMMIT
+            run_after_commit(self)
+        finally:
+            self._release()
+
+    async def get(self, model, pk, with_for_update=False, options=None):
+        if with_for_update:
+            lock = self.db.locks[(model.__tablename__, pk)]
+            await lock.acquire()
+            self.held.append(lock)
+        await self._round_trip()
+        return self.db.rows.get((model, pk))
+
+    async def execute(self, stmt):
+        await self._round_trip()
+        return FakeResult()
+
+    async def scalar(self, stmt):
+        await self._round_trip()
+        return None
+
+    async def flush(self):
+        await self._round_trip()
+
+    def add(self, obj):
+        pass
+
+    def add_all(self, objs):
+        pass
+
+    async def rollback(self):
+        discard_after_rollback(self)
+        self._release()
+
+
+def make_task():
+    return Task(
+        id=TASK_ID,
+        type_number=1,
+        topic_id=1,
+        subtopic_id=None,
+        part_number=PartNumber.PART_ONE,
+        complexity=Complexity.BASIC,
+        correct_answer="2",
+        answer_options=["1", "2", "3", "4"]
+    )
+
+
+def populate(db: FakeDatabase, users: int):
+    db.rows[(Task, TASK_ID)] = make_task()
+    for user_id in range(1, users + 1):
+        db.rows[(User, user_id)] = User(id=user_id, status=UserStatus.NO_SUB)
+        db.rows[(UserStat, user_id)] = UserStat(
+            user_id=user_id, subtopics_stats={}, correct_answers=0,
+            total_attempts=0, percentage=0.0)
+        db.rows[(UserProgress, user_id)] = UserProgress(
+            user_id=user_id, daily_record=0, weekly_points=0,
+            total_points=0, current_streak=0)
+
+
+async def answer(db: FakeDatabase, user_id: int, legacy: bool) -> float:
+    started = time.perf_counter()
+    async with db.session() as session:
+        async with session.begin():
+            if legacy:
+                # Старый handle_button_answer: Task с FOR UPDATE на всю транзакцию
+                await session.get(Task, TASK_ID, with_for_update=True)
+            await check_answer(session, TASK_ID, "2", user_id)
+    return time.perf_counter() - started
+
+
+async def run(users: int, rtt: float, legacy: bool):
+    db = FakeDatabase(rtt)
+    populate(db, users)
+
+    if legacy:
+        task_catalog.build([])
+    else:
+        task_catalog.build([db.rows[(Task, TASK_ID)]])
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(
+        answer(db, user_id, legacy) for user_id in range(1, users + 1)
+    ))
+    total = time.perf_counter() - started
+
+    latencies = sorted(latencies)
+    return SimpleNamespace(
+        total=total,
+        p50=statistics.median(latencies),
+        p95=latencies[int(len(latencies) * 0.95) - 1],
+        throughput=users / total
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{args.users} users answering task {TASK_ID}, RTT {args.rtt_ms} ms")
+    print(f"{'mode':>8} | {'total, s':>8} | {'p50, ms':>8} | {'p95, ms':>8} | {'answers/s':>9}")
+    for name, legacy in (("legacy", True), ("current", False)):
+        r = asyncio.run(run(args.users, args.rtt_ms / 1000, legacy))
+        print(f"{name:>8} | {r.total:>8.2f} | {r.p50 * 1000:>8.1f} | "
+              f"{r.p95 * 1000:>8.1f} | {r.throughput:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Пропускная способность рассылки на поддельном боте.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_broadcast [--users 3000] [--limit 300] [--latency-ms 40]
+
+FakeBot ведет себя как Telegram: каждый вызов занимает latency, больше limit
+сообщений за скользящую секунду - ответ 429 с retry_after, часть пользователей
+заблокировала бота. Лимит по умолчанию завышен в 10 раз относительно реальных
+30 сообщений/с, чтобы прогон занимал секунды; движок настраивается на тот же лимит.
+
+Режим legacy повторяет старый /broadcast (последовательная отправка, 429
+считается ошибкой), режим engine - BroadcastEngine с пулом и ведром токенов.
+"""
+import argparse
+import asyncio
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from core.services.broadcast import BroadcastEngine, BroadcastReport
+from core.services.delivery import RateLimitedSender
+
+
+class FakeBot:
+    def __init__(self, limit: int, latency: float, blocked_every: int = 20):
+        self.limit = limit
+        self.latency = latency
+        self.blocked_every = blocked_every
+        self.window = deque()
+        self.flood_errors = 0
+        self.delivered = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        now = time.monotonic()
+        while self.window and now - self.window[0] >= 1.0:
+            self.window.popleft()
+        if len(self.window) >= self.limit:
+            self.flood_errors += 1
+            raise TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=1)
+        self.window.append(now)
+
+        await asyncio.sleep(self.latency)
+        if chat_id % self.blocked_every == 0:
+            raise TelegramForbiddenError(method=None, message="bot was blocked by the user")
+        self.delivered += 1
+
+
+class MemoryStore:
+    def __init__(self, users: int):
+        self.user_ids = list(range(1, users + 1))
+        self.blocked = set()
+        self.row = None
+
+    async def create(self, text):
+        self.row = BroadcastReport(broadcast_id=1, text=text)
+        return self.row
+
+    async def get(self, broadcast_id=None):
+        return self.row
+
+    async def fetch_user_ids(self, after_id, limit):
+        return [u for u in self.user_ids if u > after_id][:limit]
+
+    async def save_checkpoint(self, report, blocked_ids=()):
+        self.blocked.update(blocked_ids)
+
+
+async def run_legacy(users: int, limit: int, latency: float, max_seconds: float):
+    bot = FakeBot(limit, latency)
+    started = time.monotonic()
+    sent = failed = 0
+    for user_id in range(1, users + 1):
+        if time.monotonic() - started > max_seconds:
+            break
+        try:
+            await bot.send_message(user_id, "hi")
+            sent += 1
+        except Exception:
+            failed += 1
+    elapsed = time.monotonic() - started
+    return sent + failed, sent, failed, bot.flood_errors, elapsed
+
+
+async def run_engine(users: int, limit: int, latency: float, concurrency: int):
+    bot = FakeBot(limit, latency)
+    sender = RateLimitedSender(bot, rate=limit * 0.9, per_chat_rate=1)
+    engine = BroadcastEngine(store=MemoryStore(users), sender=sender, concurrency=concurrency)
+    started = time.monotonic()
+    report = await engine.start("hi")
+    elapsed = time.monotonic() - started
+    return report.processed, report.sent, report.failed + report.blocked, bot.flood_errors, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--limit", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--concurrency", type=int, default=25)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    print(f"{args.users} users, limit {args.limit} msg/s, latency {args.latency_ms} ms")
+    print(f"{'mode':>8} | {'done':>6} | {'sent':>6} | {'not sent':>8} | {'429s':>5} | {'time, s':>7} | {'msg/s':>6}")
+
+    engine = await run_engine(args.users, args.limit, latency, args.concurrency)
+    # Старый цикл упирается в latency; ограничиваем его тем же временем
+    legacy = await run_legacy(args.users, args.limit, latency, max_seconds=engine[4])
+
+    for mode, (done, sent, not_sent, floods, elapsed) in (("legacy", legacy), ("engine", engine)):
+        print(f"{mode:>8} | {done:6d} | {sent:6d} | {not_sent:8d} | {floods:5d} | "
+              f"{elapsed:7.2f} | {done / elapsed:6.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+"""
+Сравнение выбора случайного задания: старая схема (выгрузка всей таблицы +
+random.choice) против COUNT + OFFSET и кэшированного массива ID из TaskCatalog.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_random_task [--sizes 1000 10000 100000] [--calls 50]
+
+Используется SQLite в памяти и синхронная сессия с теми же запросами, что и в
+core/services/task_utils.py: важна форма запроса и объем выгрузки, а не драйвер.
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import Session, selectinload
+
+from core.database.models import Base, Task, Topic, PartNumber, Complexity
+from core.services.task_catalog import TaskCatalog
+
+TASK_TEXT = "Тело движется равноускоренно из состояния покоя. " * 10
+
+
+def populate(session: Session, size: int):
+    session.add(Topic(id=1, name="mechanics", title_ru="Механика"))
+    session.add_all(
+        Task(
+            id=i,
+            type_number=i % 25 + 1,
+            topic_id=1,
+            part_number=PartNumber.PART_ONE if i % 25 < 20 else PartNumber.PART_TWO,
+            complexity=Complexity.BASIC,
+            task_content={"text": TASK_TEXT, "image": f"https://example.com/{i}.png"},
+            correct_answer="1",
+            answer_options=["1", "2", "3", "4"]
+        )
+        for i in range(1, size + 1)
+    )
+    session.commit()
+
+
+def legacy(session: Session, task_type: int) -> Task:
+    """Как было: select(Task) со всеми строками и JSON, затем random.choice"""
+    stmt = select(Task).where(Task.type_number == task_type).options(
+        selectinload(Task.topic))
+    tasks = session.execute(stmt).scalars().all()
+    return random.choice(tasks)
+
+
+def count_offset(session: Session, task_type: int) -> Task:
+    """COUNT(*) + одна строка по случайному OFFSET, затем загрузка одной задачи"""
+    where = Task.type_number == task_type
+    total = session.scalar(select(func.count(Task.id)).where(where))
+    task_id = session.scalar(
+        select(Task.id).where(where).order_by(Task.id)
+        .offset(random.randrange(total)).limit(1)
+    )
+    return session.get(Task, task_id, options=[selectinload(Task.topic)])
+
+
+def cached_ids(session: Session, catalog: TaskCatalog, task_type: int) -> Task:
+    """Случайный ID из индекса каталога, затем загрузка одной задачи"""
+    task_id = random.choice(catalog.lookup(task_type=task_type))
+    return session.get(Task, task_id, options=[selectinload(Task.topic)])
+
+
+def measure(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn(random.randint(1, 25))
+    return (time.perf_counter() - started) / calls * 1000
+
+
+def run(size: int, calls: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        populate(session, size)
+
+    catalog = TaskCatalog(session_factory=None)
+    with Session(engine) as session:
+        rows = session.execute(select(
+            Task.id, Task.type_number, Task.topic_id, Task.subtopic_id,
+            Task.part_number, Task.complexity, Task.correct_answer,
+            Task.answer_options
+        )).all()
+    catalog.build(rows)
+
+    results = {}
+    for name, fn in (
+        ("legacy", lambda s, t: legacy(s, t)),
+        ("count_offset", lambda s, t: count_offset(s, t)),
+        ("cached_ids", lambda s, t: cached_ids(s, catalog, t)),
+    ):
+        # Новая сессия на каждый вызов, как в боте (без identity map между вызовами)
+        def call(task_type, fn=fn):
+            with Session(engine) as session:
+                return fn(session, task_type)
+        results[name] = measure(call, calls)
+
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1_000, 10_000, 100_000])
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'tasks':>8} | {'legacy, ms':>11} | {'count+offset, ms':>16} | {'cached ids, ms':>14}")
+    for size in args.sizes:
+        r = run(size, args.calls)
+        print(f"{size:>8} | {r['legacy']:>11.2f} | {r['count_offset']:>16.2f} | {r['cached_ids']:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Время отправки напоминаний на поддельном боте.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_reminders [--users 50000] [--limit 3000] [--latency-ms 40]
+
+FakeBot из bench_broadcast: задержка на каждый вызов, 429 сверх limit сообщений
+за скользящую секунду. Лимит завышен, чтобы 50k напоминаний уходили за секунды;
+в выводе есть пересчет на реальные 30 сообщений/с.
+
+Режим legacy повторяет старый send_reminders (последовательная отправка внутри
+открытого сеанса) и прогоняется на выборке с экстраполяцией, режим engine -
+ReminderService.deliver с общим ведром токенов и лимитами по типам.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.bench_broadcast import FakeBot
+from core.services.delivery import RateLimitedSender
+from core.services.reminder_service import ReminderService
+
+
+def make_users(count: int) -> dict:
+    # Примерно как в проде: неактивных больше, чем промо
+    promo = count // 3
+    return {
+        'promo': [(i, f"user{i}") for i in range(1, promo + 1)],
+        'inactive': [(i, f"user{i}") for i in range(promo + 1, count + 1)]
+    }
+
+
+async def run_legacy(users: dict, limit: int, latency: float, sample: int):
+    bot = FakeBot(limit, latency)
+    started = time.monotonic()
+    done = 0
+    for reminder_type, user_list in users.items():
+        for user_id, _ in user_list[:sample // len(users)]:
+            try:
+                await bot.send_message(chat_id=user_id, text=reminder_type)
+            except Exception:
+                pass
+            done += 1
+    elapsed = time.monotonic() - started
+    total = sum(len(user_list) for user_list in users.values())
+    return done, bot.flood_errors, elapsed, elapsed / done * total
+
+
+async def run_engine(users: dict, limit: int, latency: float):
+    bot = FakeBot(limit, latency)
+    sender = RateLimitedSender(bot, rate=limit * 0.9, per_chat_rate=1)
+    service = ReminderService(bot, session_factory=None, sender=sender)
+    started = time.monotonic()
+    outcomes = await service.deliver(users, {'promo': 'promo', 'inactive': 'inactive'})
+    elapsed = time.monotonic() - started
+    done = sum(len(ids) for by_outcome in outcomes.values() for ids in by_outcome.values())
+    return done, bot.flood_errors, elapsed, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--limit", type=int, default=3000)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--legacy-sample", type=int, default=200)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+    users = make_users(args.users)
+
+    print(f"{args.users} reminders, limit {args.limit} msg/s, latency {args.latency_ms} ms")
+    print(f"{'mode':>8} | {'done':>6} | {'429s':>5} | {'time, s':>7} | {'50k, s':>8} | {'msg/s':>6}")
+
+    engine = await run_engine(users, args.limit, latency)
+    legacy = await run_legacy(users, args.limit, latency, args.legacy_sample)
+
+    for mode, (done, floods, elapsed, projected) in (("legacy", legacy), ("engine", engine)):
+        print(f"{mode:>8} | {done:6d} | {floods:5d} | {elapsed:7.2f} | "
+              f"{projected:8.1f} | {done / elapsed:6.0f}")
+
+    # При реальном лимите движок упирается в 30 сообщений/с, старый цикл - в задержку
+    print(f"at 30 msg/s: engine ~{args.users / 30 / 60:.0f} min, "
+          f"legacy ~{args.users * max(latency, 1 / 30) / 60:.0f} min")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
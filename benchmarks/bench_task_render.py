@@ -0,0 +1,66 @@
+"""
+Стоимость отрисовки задания: текст + клавиатура ответов через
+InlineKeyboardBuilder на каждый показ против готового TaskRender из кэша.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_task_render [--tasks 2000] [--shows 50000] [--options 4]
+
+Показы выбираются по закону Ципфа: популярные задания показываются чаще,
+как в реальных сессиях по типам. Кэш меньше числа заданий, чтобы в замер
+попадали и вытеснения.
+"""
+import argparse
+import random
+import time
+
+from core.database.models import Complexity, PartNumber, Task
+from core.services.task_catalog import TaskCatalog
+from core.services.task_render import TaskRenderCache, render_task
+
+TASK_TEXT = "Тело движется равноускоренно из состояния покоя. " * 10
+
+
+def make_tasks(count: int, options: int) -> dict:
+    return {
+        i: Task(
+            id=i,
+            type_number=i % 25 + 1,
+            part_number=PartNumber.PART_ONE,
+            complexity=Complexity.HIGH if i % 3 == 0 else Complexity.BASIC,
+            task_content={"text": TASK_TEXT, "image": f"https://example.com/{i}.png" if i % 2 else None},
+            answer_options=[f"Вариант {n}" for n in range(1, options + 1)]
+        )
+        for i in range(1, count + 1)
+    }
+
+
+def main(args) -> None:
+    tasks = make_tasks(args.tasks, args.options)
+    rng = random.Random(1)
+    weights = [1 / rank for rank in range(1, args.tasks + 1)]
+    shows = rng.choices(list(tasks), weights=weights, k=args.shows)
+
+    started = time.perf_counter()
+    for task_id in shows:
+        render_task(tasks[task_id])
+    uncached = (time.perf_counter() - started) / args.shows
+
+    catalog = TaskCatalog(session_factory=None)
+    renders = TaskRenderCache(maxsize=args.tasks // 2, catalog=catalog)
+    started = time.perf_counter()
+    for task_id in shows:
+        if renders.get(task_id) is None:
+            renders.task(tasks[task_id])
+    cached = (time.perf_counter() - started) / args.shows
+
+    print(f"render per show:  {uncached * 1e6:.1f} µs")
+    print(f"cached per show:  {cached * 1e6:.1f} µs "
+          f"(hit rate {renders.hits / args.shows:.0%}, x{uncached / cached:.0f})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--shows', type=int, default=50000)
+    parser.add_argument('--options', type=int, default=4)
+    main(parser.parse_args())
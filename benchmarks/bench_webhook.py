@@ -0,0 +1,143 @@
+"""
+Пропускная способность приема апдейтов: long polling против webhook.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_webhook [--updates 5000] [--users 200] [--handler-ms 20] [--latency-ms 50]
+
+Один и тот же записанный поток апдейтов проходит через Dispatcher с обработчиком,
+который ждет handler-ms (запрос к БД/Telegram).
+
+polling - штатный dp.start_polling с поддельной сессией: getUpdates отдает по 100
+апдейтов с сетевой задержкой latency-ms. webhook - WebhookServer на локальном
+порту, апдейты каждого пользователя отправляются последовательно, пользователи -
+параллельно (до 100 соединений, как max_connections у Telegram).
+
+Polling в aiogram запускает задачу на каждый апдейт без ограничений и без порядка
+внутри чата, поэтому на одной машине он быстрее; у webhook потолок задают число
+обработчиков (workers / handler-ms) и HTTP-клиент бенчмарка. Выигрыш webhook -
+ограниченная нагрузка на БД, порядок апдейтов пользователя, отсутствие задержки
+getUpdates и несколько реплик за балансировщиком.
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, GetUpdates
+from aiogram.types import Message, Update, User
+from aiohttp.test_utils import TestClient, TestServer
+
+from core.webhook import SECRET_HEADER, WebhookServer, update_routing_key
+from tests.test_webhook import TOKEN, captured_updates
+
+SECRET = 'bench-secret'
+
+
+def make_dispatcher(handler_delay: float, done: asyncio.Event, total: int) -> Dispatcher:
+    router = Router()
+    handled = 0
+
+    @router.message()
+    async def handle(message: Message):
+        nonlocal handled
+        await asyncio.sleep(handler_delay)
+        handled += 1
+        if handled == total:
+            done.set()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+class ReplaySession(BaseSession):
+    """Сессия бота, которая отвечает на getUpdates записанными апдейтами"""
+
+    def __init__(self, updates: list, latency: float):
+        super().__init__()
+        self.updates = [Update(**update) for update in updates]
+        self.latency = latency
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency)
+        if isinstance(method, GetMe):
+            return User(id=1, is_bot=True, first_name='Bench')
+        if isinstance(method, GetUpdates):
+            offset = method.offset or 0
+            batch = [update for update in self.updates if update.update_id >= offset][:method.limit or 100]
+            if not batch:
+                # Новых апдейтов нет - long polling висит до таймаута
+                await asyncio.sleep(3600)
+            return batch
+        raise NotImplementedError(type(method).__name__)
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+        yield
+
+    async def close(self):
+        pass
+
+
+async def bench_polling(updates: list, handler_delay: float, latency: float) -> float:
+    done = asyncio.Event()
+    dp = make_dispatcher(handler_delay, done, len(updates))
+    bot = Bot(TOKEN, session=ReplaySession(updates, latency))
+
+    started = time.perf_counter()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await dp.stop_polling()
+    await asyncio.gather(polling, return_exceptions=True)
+    return elapsed
+
+
+async def bench_webhook(updates: list, handler_delay: float, workers: int) -> float:
+    done = asyncio.Event()
+    dp = make_dispatcher(handler_delay, done, len(updates))
+    server = WebhookServer(dp, Bot(TOKEN), secret_token=SECRET, workers=workers,
+                           queue_size=len(updates))
+    client = TestClient(TestServer(server.create_app()))
+    await client.start_server()
+
+    streams = {}
+    for update in updates:
+        streams.setdefault(update_routing_key(update), []).append(update)
+    connections = asyncio.Semaphore(100)
+
+    async def replay(stream):
+        for update in stream:
+            async with connections:
+                await client.post('/webhook', json=update, headers={SECRET_HEADER: SECRET})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(replay(stream) for stream in streams.values()))
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await client.close()
+    return elapsed
+
+
+async def main(args) -> None:
+    updates = captured_updates(args.updates, args.users)
+    handler_delay = args.handler_ms / 1000
+
+    elapsed = await bench_polling(updates, handler_delay, args.latency_ms / 1000)
+    print(f"polling:  {len(updates)} updates in {elapsed:.2f}s, {len(updates) / elapsed:.0f} updates/s")
+
+    for workers in args.workers:
+        elapsed = await bench_webhook(updates, handler_delay, workers)
+        print(f"webhook ({workers} workers): {len(updates)} updates in {elapsed:.2f}s, "
+              f"{len(updates) / elapsed:.0f} updates/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--handler-ms', type=float, default=20)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--workers', type=int, nargs='+', default=[16, 64])
+    asyncio.run(main(parser.parse_args()))
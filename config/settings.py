@@ -1,4 +1,5 @@
 import os
+import socket
 import ssl
 from os import getenv
 from dotenv import load_dotenv
@@ -17,3 +18,102 @@ LEADS_TOKEN = getenv('LEADS_TOKEN')
 REMINDER_INTERVAL_MINUTES = 4320  # Интервал проверки
 # Минимальный интервал между напоминаниями одному пользователю (в минутах)
 MIN_REMINDER_GAP = 30
+# Сколько напоминаний каждого типа отправляется параллельно
+REMINDER_CONCURRENCY = {'promo': 10, 'inactive': 20}
+
+
+# Планировщик задач (напоминания, недельный сброс)
+# Хранилище задач; по умолчанию та же БД через синхронный драйвер PyMySQL
+SCHEDULER_JOBSTORE_URL = getenv('SCHEDULER_JOBSTORE_URL')
+# Часовой пояс расписаний: недельный сброс - понедельник 00:00 по нему
+SCHEDULER_TIMEZONE = getenv('SCHEDULER_TIMEZONE', 'UTC')
+# Срок аренды роли ведущего (секунды); продлевается каждую треть срока
+SCHEDULER_LEASE_TTL = 60
+
+
+# Настройки каталога заданий
+# Как часто (в секундах) сверять версию каталога с БД
+CATALOG_CHECK_INTERVAL = 300
+# Сколько отрисованных заданий и теорий держать в памяти
+TASK_RENDER_CACHE_SIZE = 5000
+# Сколько следующих заданий сессии заранее загружать, пока пользователь отвечает
+TASK_PREFETCH_DEPTH = 2
+
+# Сколько скомпилированных ключей ответов держать в памяти
+ANSWER_KEY_CACHE_SIZE = 5000
+# Допуск при сравнении числовых ответов ("2,5" и "2.50 м/с" считаются равными)
+ANSWER_REL_TOLERANCE = 1e-6
+ANSWER_ABS_TOLERANCE = 1e-9
+
+# Как часто (в секундах) каждая реплика перечитывает рейтинги из БД: очки, набранные
+# на других репликах, и недельный сброс (его выполняет только ведущая реплика)
+LEADERBOARD_REFRESH_INTERVAL = int(getenv('LEADERBOARD_REFRESH_INTERVAL', 300))
+
+# Кэш экрана статистики (секунды), сбрасывается при ответе пользователя
+STATS_CACHE_TTL = 30
+
+# Отложенная запись статистики ответов (write-behind). Выключена по умолчанию
+STATS_WRITE_BEHIND = getenv('STATS_WRITE_BEHIND', '0') == '1'
+# Сброс накопленных ответов в БД: раз в N миллисекунд или при M событиях в очереди
+STATS_FLUSH_INTERVAL_MS = 500
+STATS_FLUSH_MAX_EVENTS = 200
+# Сколько событий записывать за один сброс (остальные ждут следующего)
+STATS_FLUSH_MAX_BATCH = 1000
+# Пауза после неудачной записи: от 1 секунды, удваивается до 60 секунд
+STATS_FLUSH_RETRY_BACKOFF_MS = 1000
+STATS_FLUSH_MAX_BACKOFF_MS = 60_000
+# После стольких неудач подряд пачка пишется по пользователям, а ответы тех,
+# чья запись все равно падает, откладываются в файл <журнал>.failed
+STATS_FLUSH_MAX_RETRIES = 5
+# Журнал еще не записанных ответов, проигрывается при перезапуске. У каждого
+# процесса свой журнал (занятый другим процессом журнал не открывается);
+# несколько процессов на одном хосте должны задавать разные пути
+STATS_JOURNAL_PATH = getenv('STATS_JOURNAL_PATH', f"stats_journal.{socket.gethostname()}.log")
+STATS_JOURNAL_FSYNC = getenv('STATS_JOURNAL_FSYNC', '0') == '1'
+
+# Ограничение частоты нажатий: секунды между вызовами одного обработчика одним
+# пользователем для роутеров без явного @throttle (по имени роутера)
+THROTTLE_ROUTER_RATES = {'reply': 0.5, 'inline': 0.5}
+# Сколько ведер (пользователь, обработчик) держать в памяти
+THROTTLE_CACHE_SIZE = 100000
+
+# Хранилище состояний FSM: memory, sqlite (файл) или redis
+FSM_STORAGE = getenv('FSM_STORAGE', 'sqlite')
+FSM_SQLITE_PATH = getenv('FSM_SQLITE_PATH', 'fsm.sqlite3')
+FSM_REDIS_URL = getenv('FSM_REDIS_URL', 'redis://localhost:6379/0')
+# Состояние пользователя, неактивного дольше этого срока, сбрасывается (секунды)
+FSM_TTL = 3 * 24 * 3600
+
+# Кэш пользователя и его роли для middleware и фильтров (секунды)
+USER_CONTEXT_TTL = 60
+# last_interaction_time пишется не чаще раза в этот интервал на пользователя (секунды)
+LAST_INTERACTION_WRITE_INTERVAL = 300
+
+# Массовые рассылки: лимиты Telegram (~30 сообщений/с на бота, 1 сообщение/с в чат)
+BROADCAST_RATE = 30
+BROADCAST_PER_CHAT_RATE = 1
+BROADCAST_CONCURRENCY = 25
+BROADCAST_PAGE_SIZE = 1000
+
+# Режим получения апдейтов: polling (long polling) или webhook (aiohttp-сервер)
+BOT_MODE = getenv('BOT_MODE', 'polling')
+# Публичный адрес, на который Telegram шлет апдейты (без пути); пустой - webhook не регистрируется
+WEBHOOK_BASE_URL = getenv('WEBHOOK_BASE_URL', '')
+WEBHOOK_PATH = getenv('WEBHOOK_PATH', '/webhook')
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token: A-Z, a-z, 0-9, _ и -.
+# Не задан - генерируется при регистрации webhook (без WEBHOOK_BASE_URL обязателен)
+WEBHOOK_SECRET = getenv('WEBHOOK_SECRET')
+WEBHOOK_HOST = getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(getenv('WEBHOOK_PORT', 8080))
+# Параллельные обработчики апдейтов; апдейты одного пользователя идут по порядку
+WEBHOOK_WORKERS = int(getenv('WEBHOOK_WORKERS', 16))
+# Сколько принятых апдейтов может ждать обработки (на все обработчики)
+WEBHOOK_QUEUE_SIZE = 1000
+# Сколько ждать обработки принятых апдейтов при остановке (секунды)
+WEBHOOK_DRAIN_TIMEOUT = 30
+
+# Чат, в который /preload_media загружает картинки заданий ради file_id
+# (по умолчанию - чат администратора, вызвавшего команду)
+MEDIA_CACHE_CHAT_ID = int(getenv('MEDIA_CACHE_CHAT_ID')) if getenv('MEDIA_CACHE_CHAT_ID') else None
+# Загрузок в секунду при предзагрузке (лимит Telegram - около 1 сообщения/с в чат)
+MEDIA_UPLOAD_RATE = 1
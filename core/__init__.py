@@ -1,3 +1,2 @@
-from .bot import bot, dp, register_handlers, run_bot
-
-__all__ = ['bot', 'dp', 'register_handlers', 'run_bot']
+# Бот создается при импорте core.bot, а не пакета core: сервисы и тесты
+# импортируют core.* без токена и хранилища FSM. Точка входа - start_bot.py
@@ -1,12 +1,23 @@
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
-from config.settings import BOT_TOKEN
-from core.utils.reminder_scheduler import ReminderScheduler
+from config.settings import BOT_MODE, BOT_TOKEN, STATS_WRITE_BEHIND, WEBHOOK_HOST, WEBHOOK_PORT
+from core.utils.scheduler import JobScheduler
+from core.fsm.storage import create_storage
+from core.middlewares.user_middleware import UserMiddleware
+from core.middlewares.throttling_middleware import ThrottlingMiddleware
+from core.services.task_catalog import task_catalog
+from core.services.rank_index import leaderboard
+from core.services.stats_aggregator import stats_aggregator
+from core.services.task_prefetch import task_prefetcher
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Инициализация бота
 bot = Bot(token=BOT_TOKEN, parse_mode=ParseMode.HTML)
-dp = Dispatcher()
-reminder_scheduler = None
+# Состояния FSM переживают перезапуск (см. FSM_STORAGE)
+dp = Dispatcher(storage=create_storage())
+job_scheduler = None
 
 
 async def register_handlers():
@@ -18,6 +29,14 @@ async def register_handlers():
     from core.handlers.inline_handlers import router as inline_router
     from core.handlers.reply_handlers import router as reply_router
 
+    # Пользователь и роль определяются один раз на апдейт, до фильтров
+    dp.message.outer_middleware(UserMiddleware())
+    dp.callback_query.outer_middleware(UserMiddleware())
+    # Частота нажатий ограничивается для каждого пользователя отдельно
+    throttling = ThrottlingMiddleware()
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
+
     dp.include_router(common_router)
     dp.include_router(teacher_router)
     dp.include_router(moderator_router)
@@ -28,20 +47,63 @@ async def register_handlers():
 
 async def on_startup():
     """Действия при запуске бота"""
-    global reminder_scheduler
-    reminder_scheduler = ReminderScheduler(bot)
-    await reminder_scheduler.start()
+    global job_scheduler
+
+    # Загружаем каталог заданий один раз, дальше выборка идет из памяти
+    try:
+        await task_catalog.load()
+    except Exception as e:
+        logger.error(f"Task catalog preload failed: {e}")
+
+    # Рейтинги строим при старте, дальше они обновляются инкрементально и
+    # периодически перестраиваются из БД (очки с других реплик, недельный сброс)
+    try:
+        await leaderboard.rebuild()
+    except Exception as e:
+        logger.error(f"Leaderboard rebuild failed: {e}")
+    await leaderboard.start()
+
+    # Отложенная запись статистики: сначала проигрываем журнал прошлого запуска
+    if STATS_WRITE_BEHIND:
+        stats_aggregator.notify = notify_achievements
+        await stats_aggregator.start()
+
+    # Напоминания и недельный сброс; задачи выполняет только ведущая реплика
+    job_scheduler = JobScheduler(bot)
+    await job_scheduler.start()
     await register_handlers()
 
 
 async def on_shutdown():
     """Действия при остановке бота"""
-    if reminder_scheduler:
-        await reminder_scheduler.stop()
+    if job_scheduler:
+        await job_scheduler.stop()
+    if stats_aggregator.running:
+        await stats_aggregator.stop()
+    await leaderboard.stop()
+    await task_prefetcher.close()
+
 
+async def notify_achievements(user_id: int, achievements: list):
+    """Сообщает о достижениях, открытых при отложенной записи статистики"""
+    for achievement in achievements:
+        await bot.send_message(
+            user_id,
+            f"🎉 Новое достижение!\n"
+            f"🏆 {achievement.name}\n"
+            f"📝 {achievement.description}"
+        )
 
-def run_bot():
-    """Запускает бота"""
+
+def run_bot(mode: str = BOT_MODE):
+    """Запускает бота в режиме long polling или webhook (см. BOT_MODE)"""
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
-    dp.run_polling(bot)
+
+    if mode == 'webhook':
+        from core.webhook import run_webhook
+        run_webhook(dp, bot, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    elif mode == 'polling':
+        dp.run_polling(bot)
+    else:
+        raise ValueError(f"Unknown BOT_MODE: {mode}")
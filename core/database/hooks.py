@@ -0,0 +1,39 @@
+import logging
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_CALLBACKS = 'after_commit_callbacks'
+_STATE = 'transaction_state'
+
+
+def after_commit(session, callback: Callable[[], None]) -> None:
+    """
+    Выполняет callback после успешного коммита транзакции session, при откате
+    он отбрасывается. Для кэшей в памяти: они не должны видеть незакоммиченные данные
+    """
+    session.info.setdefault(_CALLBACKS, []).append(callback)
+
+
+def transaction_state(session, key: str) -> dict:
+    """Словарь, который живёт до коммита или отката текущей транзакции session"""
+    return session.info.setdefault(_STATE, {}).setdefault(key, {})
+
+
+@event.listens_for(Session, 'after_commit')
+def run_after_commit(session) -> None:
+    session.info.pop(_STATE, None)
+    for callback in session.info.pop(_CALLBACKS, ()):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Error in after-commit callback: {e}", exc_info=True)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_after_rollback(session) -> None:
+    session.info.pop(_STATE, None)
+    session.info.pop(_CALLBACKS, None)
@@ -1,12 +1,41 @@
 from sqlalchemy import Column, Integer, String, ForeignKey, Enum, JSON, Text, DateTime, Date, Float, Boolean
+from sqlalchemy.dialects import mysql
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
+from sqlalchemy.schema import FetchedValue
+from sqlalchemy.sql.functions import FunctionElement
 from enum import Enum as PyEnum
 import datetime
 
 Base = declarative_base()
 
 
+class server_timestamp(FunctionElement):
+    """
+    Время правки строки, которое ставит сама БД (как в миграции c5a1e7d3f902).
+    В MySQL - DATETIME(6) с ON UPDATE, в остальных БД (SQLite в тестах) - CURRENT_TIMESTAMP
+    """
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(server_timestamp)
+def _server_timestamp(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(server_timestamp, 'mysql')
+def _server_timestamp_mysql(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)'
+
+
+def updated_at_column(**kwargs) -> Column:
+    """Колонка updated_at: значение ставит только БД, чтобы все правки шли по одним часам"""
+    return Column(DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql'),
+                  server_default=server_timestamp(), server_onupdate=FetchedValue(), **kwargs)
+
+
 # Enums для сложности и статусов
 
 
@@ -44,6 +73,7 @@ class Topic(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(50), unique=True)  # Английское название (для кода)
     title_ru = Column(String(100))  # Русское название
+    updated_at = updated_at_column()
 
     subtopics = relationship("Subtopic", back_populates="topic")
     tasks = relationship("Task", back_populates="topic")
@@ -56,6 +86,7 @@ class Subtopic(Base):
     topic_id = Column(Integer, ForeignKey('topics.id'))
     name = Column(String(50))
     title_ru = Column(String(100))
+    updated_at = updated_at_column()
 
     topic = relationship("Topic", back_populates="subtopics")
     tasks = relationship("Task", back_populates="subtopic")
@@ -75,6 +106,8 @@ class Task(Base):
     answer_options = Column(JSON)  # ["Вариант 1", "Вариант 2"]
     theory_id = Column(Integer, ForeignKey('theories.id'), nullable=True)
     video_analysis_url = Column(String(255), nullable=True)
+    # Время последней правки (входит в отпечаток каталога заданий)
+    updated_at = updated_at_column(index=True)
 
     topic = relationship("Topic", back_populates="tasks")
     subtopic = relationship("Subtopic", back_populates="tasks")
@@ -89,6 +122,7 @@ class Theory(Base):
     complexity = Column(Enum(Complexity))
     content = Column(Text)  # Markdown
     examples = Column(JSON)  # [{"task": "...", "solution": "..."}]
+    updated_at = updated_at_column()
 
     topic = relationship("Topic", back_populates="theories")
     subtopic = relationship("Subtopic", back_populates="theories")
@@ -106,9 +140,12 @@ class User(Base):
     status = Column(Enum(UserStatus), default=UserStatus.NO_SUB)
     phone = Column(String(20), nullable=True)
     city = Column(String(50), nullable=True)
-    last_interaction_time = Column(DateTime)  # Когда последний раз был активен
+    # Когда последний раз был активен (индекс - для выборки напоминаний)
+    last_interaction_time = Column(DateTime, index=True)
     # Когда последний раз отправляли напоминание
     last_reminder_time = Column(DateTime, nullable=True)
+    # Когда пользователь заблокировал бота (рассылки его пропускают)
+    blocked_at = Column(DateTime, nullable=True)
 
     stats = relationship("UserStat", back_populates="user")
     progress = relationship(
@@ -122,6 +159,7 @@ class UserStat(Base):
 
     user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
     # {"subtopic_id": {"correct": X, "wrong": Y}}
+    # Устарело: счетчики хранятся в user_subtopic_stats, поле нужно только для переноса
     subtopics_stats = Column(JSON, default={})
     correct_answers = Column(Integer, default=0)
     total_attempts = Column(Integer, default=0)
@@ -130,12 +168,23 @@ class UserStat(Base):
     user = relationship("User", back_populates="stats")
 
 
+class UserSubtopicStat(Base):
+    """Счетчики ответов пользователя по подтеме (заменяют UserStat.subtopics_stats)"""
+    __tablename__ = 'user_subtopic_stats'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    subtopic_id = Column(Integer, ForeignKey(
+        'subtopics.id'), primary_key=True)
+    correct = Column(Integer, nullable=False, default=0)
+    wrong = Column(Integer, nullable=False, default=0)
+
+
 class UserProgress(Base):
     __tablename__ = 'user_progress'
     user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
     daily_record = Column(Integer, default=0)
-    weekly_points = Column(Integer, default=0)
-    total_points = Column(Integer, default=0)
+    weekly_points = Column(Integer, default=0, index=True)
+    total_points = Column(Integer, default=0, index=True)
     current_streak = Column(Integer, default=0)
     last_active_day = Column(Date)
 
@@ -159,12 +208,32 @@ class WeeklyXP(Base):
     __tablename__ = 'weekly_xp'
 
     user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
-    week_start_date = Column(Date)  # Дата начала недели (понедельник)
+    # Дата начала недели (понедельник); по строке на пользователя и неделю
+    week_start_date = Column(Date, primary_key=True)
     xp_earned = Column(Integer, default=0)
 
     user = relationship("User", back_populates="weekly_xp")
 
 
+class SchedulerLease(Base):
+    """Аренда роли ведущего: задачи по расписанию выполняет только владелец"""
+    __tablename__ = 'scheduler_leases'
+
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(100), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class TaskMedia(Base):
+    """file_id, который Telegram выдал для картинки задания: повторно картинка не скачивается"""
+    __tablename__ = 'task_media'
+
+    url_hash = Column(String(64), primary_key=True)  # sha256 от url
+    url = Column(Text, nullable=False)
+    file_id = Column(String(255), nullable=False)
+    uploaded_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
 # Достижения и напоминания
 
 
@@ -181,6 +250,20 @@ class Achievement(Base):
         "UserAchievement", back_populates="achievement")
 
 
+class Broadcast(Base):
+    """Массовая рассылка и ее контрольная точка для продолжения после сбоя"""
+    __tablename__ = 'broadcasts'
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    # Все пользователи с id <= last_user_id уже обработаны
+    last_user_id = Column(Integer, default=0, nullable=False)
+    sent = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    blocked = Column(Integer, default=0, nullable=False)
+
+
 class Reminder(Base):
     __tablename__ = 'reminders'
     id = Column(Integer, primary_key=True)
@@ -1,38 +1,29 @@
+from typing import Optional
 from aiogram.filters import BaseFilter
 from aiogram.types import Message
-from sqlalchemy import select
-from config.database import AsyncSessionLocal
-from core.database.models import User, UserStatus
+from core.services.user_context import UserContext, user_contexts
 
 
-class IsTeacherFilter(BaseFilter):
-    async def __call__(self, message: Message) -> bool:
-        async with AsyncSessionLocal() as session:
-            user = await session.scalar(
-                select(User)
-                .where(User.id == message.from_user.id)
-            )
+async def _user_context(message: Message, user_context: Optional[UserContext]) -> Optional[UserContext]:
+    """Контекст из UserMiddleware, иначе из общего кэша"""
+    if user_context is not None and user_context.id == message.from_user.id:
+        return user_context
+    return await user_contexts.get(message.from_user.id)
+
 
-            return user is not None and (user.status == UserStatus.ADMIN or user.status == UserStatus.MODERATOR or user.status == UserStatus.TEACHER)
+class IsTeacherFilter(BaseFilter):
+    async def __call__(self, message: Message, user_context: Optional[UserContext] = None) -> bool:
+        user = await _user_context(message, user_context)
+        return user is not None and user.is_teacher
 
 
 class IsModeratorFilter(BaseFilter):
-    async def __call__(self, message: Message) -> bool:
-        async with AsyncSessionLocal() as session:
-            user = await session.scalar(
-                select(User)
-                .where(User.id == message.from_user.id)
-            )
-
-            return user is not None and (user.status == UserStatus.ADMIN or user.status == UserStatus.MODERATOR)
+    async def __call__(self, message: Message, user_context: Optional[UserContext] = None) -> bool:
+        user = await _user_context(message, user_context)
+        return user is not None and user.is_moderator
 
 
 class IsAdminFilter(BaseFilter):
-    async def __call__(self, message: Message) -> bool:
-        async with AsyncSessionLocal() as session:
-            user = await session.scalar(
-                select(User)
-                .where(User.id == message.from_user.id)
-            )
-
-            return user is not None and (user.status == UserStatus.ADMIN)
+    async def __call__(self, message: Message, user_context: Optional[UserContext] = None) -> bool:
+        user = await _user_context(message, user_context)
+        return user is not None and user.is_admin
@@ -0,0 +1,225 @@
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config.settings import FSM_REDIS_URL, FSM_SQLITE_PATH, FSM_STORAGE, FSM_TTL
+
+# Списки целых короче этого хранятся обычным JSON - упаковка не окупается
+PACK_MIN_LENGTH = 8
+# Беззнаковые типы элементов массива от меньшего к большему
+PACK_TYPECODES = sorted('HILQ', key=lambda typecode: array(typecode).itemsize)
+
+
+def _pack_ints(values: list) -> Optional[dict]:
+    if len(values) < PACK_MIN_LENGTH:
+        return None
+    if not all(type(value) is int and value >= 0 for value in values):
+        return None
+    largest = max(values)
+    for typecode in PACK_TYPECODES:
+        # Наименьший тип, в который помещаются все значения
+        if largest < 1 << (8 * array(typecode).itemsize):
+            packed = array(typecode, values)
+            return {'__ints__': typecode + base64.b64encode(packed.tobytes()).decode()}
+    return None
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, list):
+        return _pack_ints(value) or [_encode(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and '__ints__' in value:
+            packed = value['__ints__']
+            values = array(packed[0])
+            values.frombytes(base64.b64decode(packed[1:]))
+            return values.tolist()
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def pack_data(data: Dict[str, Any]) -> str:
+    """
+    Данные FSM в компактный JSON: длинные списки неотрицательных целых
+    (TASK_LIST) хранятся упакованным массивом в base64. В данных допустимы
+    только типы JSON - перечисления и объекты нужно сохранять значениями
+    """
+    return json.dumps(_encode(data), ensure_ascii=False, separators=(',', ':'))
+
+
+def unpack_data(raw: Optional[str]) -> Dict[str, Any]:
+    if not raw:
+        return {}
+    return _decode(json.loads(raw))
+
+
+def key_string(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.destiny}"
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM в локальном файле SQLite: переживает перезапуск процесса.
+    Запросы выполняются в отдельном потоке, чтобы не блокировать цикл событий.
+    Записи, не обновлявшиеся дольше ttl секунд, считаются пустыми
+    """
+
+    def __init__(self, path: str = FSM_SQLITE_PATH, ttl: Optional[float] = FSM_TTL,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_fsm_updated_at ON fsm (updated_at)")
+        self._conn.commit()
+
+    def _expired_before(self) -> float:
+        return self.clock() - self.ttl if self.ttl else float('-inf')
+
+    def _read(self, key: str) -> tuple[Optional[str], Optional[str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, data FROM fsm WHERE key = ? AND updated_at >= ?",
+                (key, self._expired_before())
+            ).fetchone()
+        return row if row else (None, None)
+
+    def _write(self, key: str, column: str, value: Optional[str]) -> None:
+        now = self.clock()
+        with self._lock:
+            self._upsert(key, column, value, now)
+            if self.ttl and now - self._last_purge > self.ttl:
+                self._last_purge = now
+                self._conn.execute("DELETE FROM fsm WHERE updated_at < ?", (self._expired_before(),))
+            self._conn.commit()
+
+    def _upsert(self, key: str, column: str, value: Optional[str], now: float) -> None:
+        # Истекшая запись начинается заново: вторая колонка сбрасывается
+        other = 'data' if column == 'state' else 'state'
+        self._conn.execute(
+            f"INSERT INTO fsm (key, {column}, updated_at) VALUES (?, ?, ?) "
+            f"ON CONFLICT(key) DO UPDATE SET {column} = excluded.{column}, "
+            f"{other} = CASE WHEN fsm.updated_at < ? THEN NULL ELSE fsm.{other} END, "
+            f"updated_at = excluded.updated_at",
+            (key, value, now, self._expired_before())
+        )
+
+    async def set_state(self, bot: Bot, key: StorageKey, state: StateType = None) -> None:
+        await asyncio.to_thread(self._write, key_string(key), 'state', _state_name(state))
+
+    async def get_state(self, bot: Bot, key: StorageKey) -> Optional[str]:
+        state, _ = await asyncio.to_thread(self._read, key_string(key))
+        return state
+
+    async def set_data(self, bot: Bot, key: StorageKey, data: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._write, key_string(key), 'data', pack_data(data))
+
+    async def get_data(self, bot: Bot, key: StorageKey) -> Dict[str, Any]:
+        _, data = await asyncio.to_thread(self._read, key_string(key))
+        return unpack_data(data)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisStorage(BaseStorage):
+    """
+    FSM в Redis (или совместимом хранилище): общее состояние для нескольких
+    процессов. Нужен асинхронный клиент с методами get, set(ex=) и delete -
+    например redis.asyncio.Redis. Состояние и данные лежат в одном ключе,
+    срок жизни продлевается при каждой записи
+    """
+
+    def __init__(self, client, ttl: Optional[float] = FSM_TTL, prefix: str = 'fsm'):
+        self.client = client
+        self.ttl = int(ttl) if ttl else None
+        self.prefix = prefix
+
+    def _key(self, key: StorageKey) -> str:
+        return f"{self.prefix}:{key_string(key)}"
+
+    async def _read(self, key: StorageKey) -> dict:
+        raw = await self.client.get(self._key(key))
+        if raw is None:
+            return {}
+        if isinstance(raw, bytes):
+            raw = raw.decode()
+        return json.loads(raw)
+
+    async def _write(self, key: StorageKey, record: dict) -> None:
+        if record.get('s') is None and not record.get('d'):
+            await self.client.delete(self._key(key))
+        else:
+            await self.client.set(self._key(key), json.dumps(record, separators=(',', ':')), ex=self.ttl)
+
+    async def set_state(self, bot: Bot, key: StorageKey, state: StateType = None) -> None:
+        record = await self._read(key)
+        record['s'] = _state_name(state)
+        await self._write(key, record)
+
+    async def get_state(self, bot: Bot, key: StorageKey) -> Optional[str]:
+        return (await self._read(key)).get('s')
+
+    async def set_data(self, bot: Bot, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._read(key)
+        record['d'] = _encode(data) if data else None
+        await self._write(key, record)
+
+    async def get_data(self, bot: Bot, key: StorageKey) -> Dict[str, Any]:
+        return _decode((await self._read(key)).get('d') or {})
+
+    async def close(self) -> None:
+        close = getattr(self.client, 'aclose', None) or getattr(self.client, 'close', None)
+        if close is not None:
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+
+
+def create_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    """Хранилище FSM по настройке FSM_STORAGE: memory, sqlite или redis"""
+    if kind == 'memory':
+        return MemoryStorage()
+    if kind == 'sqlite':
+        return SQLiteStorage()
+    if kind == 'redis':
+        try:
+            from redis.asyncio import Redis
+        except ImportError:
+            raise RuntimeError("FSM_STORAGE=redis requires the 'redis' package")
+        return RedisStorage(Redis.from_url(FSM_REDIS_URL))
+    raise ValueError(f"Unknown FSM storage: {kind}")
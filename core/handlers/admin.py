@@ -19,20 +19,30 @@ from core.database.models import (
     Task,
     UserProgress,
     UserAchievement,
-    Achievement
+    Achievement,
+    UserStatus
 )
 
 from core.services.stats_service import reset_all_weekly_points
+from core.services.task_catalog import task_catalog
+from core.services.achievement_rules import achievement_rules
+from core.services.subtopic_stats import backfill_subtopic_stats
+from core.services.stats_aggregator import stats_aggregator
+from core.services.user_service import set_user_status
+from core.services.broadcast import BroadcastEngine, BroadcastReport
+from core.services.media_cache import media_cache, task_image_urls
 
 from config.database import AsyncSessionLocal
+from config.settings import MEDIA_CACHE_CHAT_ID
 
+import asyncio
 import logging
 
 
 logger = logging.getLogger(__name__)
 
 
-router = Router()
+router = Router(name='admin')
 
 
 @router.message(Command("users"), IsAdminFilter())
@@ -145,59 +155,80 @@ async def cancel_reset_weekly(message: types.Message, state: FSMContext):
     await state.clear()
 
 
-@router.message(Command("broadcast"), IsAdminFilter())
-async def cmd_broadcast(message: types.Message, bot: Bot):  # Правильный тип
-    """Массовая рассылка сообщения всем пользователям"""
-    try:
-        # Извлекаем текст рассылки
-        if len(message.text.split()) < 2:
-            await message.answer("❌ Использование: /broadcast <текст сообщения>")
-            return
+# Запущенные рассылки (ссылки держим, чтобы задачи не собрал GC)
+_broadcast_tasks: set[asyncio.Task] = set()
 
-        broadcast_text = message.text.split(' ', 1)[1]
 
-        async with AsyncSessionLocal() as session:
-            # Получаем всех пользователей
-            users = await session.scalars(select(User))
-
-            success = 0
-            failed = 0
-            failed_users = []
-
-            # Отправляем сообщение каждому пользователю
-            for user in users:
-                try:
-                    await bot.send_message(
-                        user.id,
-                        f"📢 Сообщение от администратора:\n\n{broadcast_text}"
-                    )
-                    success += 1
-                except Exception as e:
-                    failed += 1
-                    failed_users.append(
-                        f"{user.id} (@{user.username or 'нет'})")
-                    # Логируем ошибку для диагностики
-                    print(
-                        f"Не удалось отправить пользователю {user.id}: {str(e)}")
-
-            # Формируем отчет
-            report = (
-                f"✅ Рассылка завершена:\n"
-                f"✔️ Успешно: {success}\n"
-                f"❌ Не удалось: {failed}"
+def _broadcast_report_text(report: BroadcastReport) -> str:
+    text = (
+        f"{'✅ Рассылка завершена' if report.finished else '⏳ Рассылка идет'} "
+        f"(#{report.broadcast_id}):\n"
+        f"✔️ Успешно: {report.sent}\n"
+        f"🚫 Заблокировали бота: {report.blocked}\n"
+        f"❌ Не удалось: {report.failed}\n"
+        f"⚡ Скорость: {report.rate:.1f} сообщ./с"
+    )
+    if report.finished and report.failed_users:
+        text += "\n\nНе удалось отправить:\n" + \
+            "\n".join(str(user_id) for user_id in report.failed_users)
+    return text
+
+
+def _run_broadcast(message: types.Message, bot: Bot, text: str = None, broadcast_id: int = None):
+    """Запускает рассылку в фоне; прогресс и итог - в сообщении админу"""
+    engine = BroadcastEngine(bot)
+    last_update = 0.0
+
+    async def on_progress(report: BroadcastReport):
+        nonlocal last_update
+        now = asyncio.get_running_loop().time()
+        if now - last_update >= 10:
+            last_update = now
+            await message.answer(_broadcast_report_text(report))
+
+    async def run():
+        try:
+            if text is not None:
+                report = await engine.start(text, on_progress)
+            else:
+                report = await engine.resume(broadcast_id, on_progress)
+                if report is None:
+                    await message.answer("Незавершенных рассылок нет")
+                    return
+            await message.answer(_broadcast_report_text(report))
+        except Exception as e:
+            logger.error(f"Broadcast failed: {e}", exc_info=True)
+            await message.answer(
+                f"❌ Ошибка при рассылке: {str(e)}\n"
+                f"Продолжить с места остановки: /broadcast_resume"
             )
 
-            # Добавляем список неудавшихся, если их немного
-            if failed_users and len(failed_users) <= 10:
-                report += f"\n\nНе удалось отправить:\n" + \
-                    "\n".join(failed_users[:10])
-            elif failed > 0:
-                report += f"\n\nНе удалось отправить {failed} пользователям"
+    task = asyncio.create_task(run())
+    _broadcast_tasks.add(task)
+    task.add_done_callback(_broadcast_tasks.discard)
 
-            await message.answer(report)
 
-    except Exception as e:
-        await message.answer(f"❌ Ошибка при рассылке: {str(e)}")
+@router.message(Command("broadcast"), IsAdminFilter())
+async def cmd_broadcast(message: types.Message, bot: Bot):  # Правильный тип
+    """Массовая рассылка сообщения всем пользователям"""
+    # Извлекаем текст рассылки
+    if len(message.text.split()) < 2:
+        await message.answer("❌ Использование: /broadcast <текст сообщения>")
+        return
+
+    broadcast_text = message.text.split(' ', 1)[1]
+    _run_broadcast(
+        message, bot, text=f"📢 Сообщение от администратора:\n\n{broadcast_text}")
+    await message.answer("⏳ Рассылка запущена, отчет придет по завершении")
+
+
+@router.message(Command("broadcast_resume"), IsAdminFilter())
+async def cmd_broadcast_resume(message: types.Message, bot: Bot):
+    """Продолжает прерванную рассылку с последней контрольной точки"""
+    parts = message.text.split()
+    broadcast_id = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+    _run_broadcast(message, bot, broadcast_id=broadcast_id)
+    await message.answer("⏳ Продолжаю рассылку")
 
 
 @router.message(Command("test_achievements"), IsAdminFilter())
@@ -232,6 +263,102 @@ async def test_achievements(message: Message):
         await message.answer("Ошибка при проверке достижений")
 
 
+@router.message(Command("reload_catalog"), IsAdminFilter())
+async def cmd_reload_catalog(message: types.Message):
+    """Перечитывает каталог заданий из БД после правки заданий или тем"""
+    try:
+        await task_catalog.refresh()
+        async with AsyncSessionLocal() as session:
+            await achievement_rules.load(session)
+        await message.answer(
+            f"♻️ Каталог обновлен: {len(task_catalog.tasks)} заданий, "
+            f"{len(task_catalog.subtopics)} подтем, "
+            f"{len(achievement_rules.rules)} правил достижений"
+        )
+    except Exception as e:
+        logger.error(f"Error in reload_catalog: {e}")
+        await message.answer("⚠️ Ошибка при обновлении каталога")
+
+
+@router.message(Command("preload_media"), IsAdminFilter())
+async def cmd_preload_media(message: types.Message, bot: Bot):
+    """Загружает картинки заданий в Telegram заранее и сохраняет их file_id"""
+    parts = message.text.split()
+    try:
+        chat_id = int(parts[1]) if len(parts) > 1 else MEDIA_CACHE_CHAT_ID or message.chat.id
+    except ValueError:
+        await message.answer("Использование: /preload_media [chat_id]")
+        return
+
+    try:
+        urls = await task_image_urls()
+        await media_cache.ensure_loaded()
+        missing = len(set(urls) - set(media_cache.file_ids))
+        await message.answer(f"⏳ Загружаю картинки: {missing} из {len(set(urls))} без file_id...")
+        uploaded, failed = await media_cache.preload(bot, chat_id, urls)
+        await message.answer(f"✅ Загружено: {uploaded}, ошибок: {failed}")
+    except Exception as e:
+        logger.error(f"Error in preload_media: {e}", exc_info=True)
+        await message.answer("⚠️ Ошибка при загрузке картинок")
+
+
+@router.message(Command("backfill_subtopic_stats"), IsAdminFilter())
+async def cmd_backfill_subtopic_stats(message: types.Message):
+    """Переносит старую JSON-статистику по подтемам в таблицу счетчиков"""
+    try:
+        await message.answer("⏳ Переношу статистику по подтемам...")
+        moved = await backfill_subtopic_stats(AsyncSessionLocal)
+        await message.answer(f"✅ Статистика перенесена для {moved} пользователей")
+    except Exception as e:
+        logger.error(f"Error in backfill_subtopic_stats: {e}", exc_info=True)
+        await message.answer("⚠️ Ошибка при переносе статистики")
+
+
+@router.message(Command("stats_queue"), IsAdminFilter())
+async def cmd_stats_queue(message: types.Message):
+    """Состояние отложенной записи статистики"""
+    if not stats_aggregator.running:
+        await message.answer("Отложенная запись статистики выключена (STATS_WRITE_BEHIND)")
+        return
+
+    metrics = stats_aggregator.metrics
+    await message.answer(
+        f"📥 Очередь: {stats_aggregator.queue_depth}\n"
+        f"✅ Записано ответов: {metrics.events_flushed} за {metrics.flushes} сбросов\n"
+        f"♻️ Проиграно из журнала: {metrics.events_replayed}\n"
+        f"⚠️ Неудачных сбросов: {metrics.failed_flushes}\n"
+        f"⏱ Сброс: последний {metrics.last_flush_ms:.1f} мс, "
+        f"средний {metrics.avg_flush_ms:.1f} мс, максимум {metrics.max_flush_ms:.1f} мс"
+    )
+
+
+@router.message(Command("set_status"), IsAdminFilter())
+async def cmd_set_status(message: types.Message):
+    """/set_status <user_id> <no_sub|sub|pro_sub|teacher|moderator|admin>"""
+    parts = message.text.split()
+    statuses = ", ".join(s.value for s in UserStatus)
+    if len(parts) != 3 or not parts[1].isdigit():
+        await message.answer(f"Использование: /set_status <user_id> <статус>\nСтатусы: {statuses}")
+        return
+
+    try:
+        status = UserStatus(parts[2].lower())
+    except ValueError:
+        await message.answer(f"Неизвестный статус. Доступны: {statuses}")
+        return
+
+    try:
+        async with AsyncSessionLocal() as session:
+            changed = await set_user_status(session, int(parts[1]), status)
+        if changed:
+            await message.answer(f"✅ Статус пользователя {parts[1]}: {status.value}")
+        else:
+            await message.answer("Пользователь не найден")
+    except Exception as e:
+        logger.error(f"Error in set_status: {e}")
+        await message.answer("⚠️ Ошибка при смене статуса")
+
+
 @router.message(Command("ahelp"), IsAdminFilter())
 async def cmd_help(message: types.Message):
     help_text = """
@@ -242,6 +369,12 @@ async def cmd_help(message: types.Message):
 /send_reminders - ручная отправка напоминаний всем пользователям
 /reset_weekly - обнуляет weekly_points у всех пользователей
 /broadcast [сообщение] - массовая рассылка сообщения
+/broadcast_resume [id] - продолжить прерванную рассылку
+/reload_catalog - перечитать задания, темы и правила достижений из БД
+/preload_media [chat_id] - заранее загрузить картинки заданий в Telegram (кэш file_id)
+/backfill_subtopic_stats - перенести старую статистику по подтемам в таблицу счетчиков
+/stats_queue - очередь и задержка отложенной записи статистики
+/set_status [user_id] [статус] - сменить статус пользователя
 
 🔧 Команды модератора:
 /active_users - Самые активные пользователи
@@ -251,5 +384,6 @@ async def cmd_help(message: types.Message):
 👨‍🏫 Команды преподавателя:
 /student_progress [@username] - Прогресс студента
 /send_feedback [@username] [message] - Отправить feedback
+/variants [N] - Сгенерировать N вариантов ОГЭ
 """
     await message.answer(help_text, parse_mode="HTML")
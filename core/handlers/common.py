@@ -11,7 +11,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-router = Router()
+router = Router(name='common')
 
 
 # @router.message(~Command(commands=["start", "help"]))
@@ -7,9 +7,10 @@ from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy import select, and_, func
 from sqlalchemy.orm import selectinload
 import random
+from datetime import datetime
 
 from config.database import AsyncSessionLocal
-from core.database.models import Task, Theory, PartNumber, Complexity, Achievement
+from core.database.models import Task, Theory, PartNumber, Complexity
 from core.services.task_display import display_task
 
 from ..keyboards.inline import (
@@ -23,10 +24,17 @@ from ..keyboards.reply import (
     task_navigation_kb
 )
 
-from core.services.task_display import display_task, display_task_by_id
-from core.services.task_utils import get_shuffled_task_ids
+from core.services.task_display import display_cursor_task, display_task
+from core.services.task_cursor import start_task_cursor
+from core.services.task_render import task_renders
+from core.services.task_utils import get_random_task
 # from core.services.answer_processing import process_answer
 from core.services.task_service import check_answer
+from core.services.achievement_rules import (
+    achievement_rules,
+    unlocked_achievements,
+    count_unlocked
+)
 
 from core.utils.debounce import throttle
 
@@ -36,7 +44,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-router = Router()
+router = Router(name='inline')
 
 # Состояния для FSM
 
@@ -51,28 +59,35 @@ async def show_achievements_handler(callback: CallbackQuery):
     """Обработчик кнопки просмотра достижений"""
     try:
         async with AsyncSessionLocal() as session:
-            # Получаем все достижения пользователя
-            from core.services.achievement_service import get_user_achievements
-            achievements = await get_user_achievements(session, callback.from_user.id)
+            # Разблокированные достижения и их описания - из общих кэшей
+            await achievement_rules.ensure_loaded(session)
+            unlocked = await unlocked_achievements.get(session, callback.from_user.id)
 
-            if not achievements:
+            if not unlocked:
                 await callback.answer("У вас пока нет достижений", show_alert=True)
                 return
 
-            # Формируем текст сообщения
+            # Формируем текст сообщения (сначала последние полученные)
             message_text = "🏆 Ваши достижения:\n\n"
-            for ua, achievement in achievements:
-                date_str = ua.unlocked_at.strftime(
-                    "%d.%m.%Y") if ua.unlocked_at else "Еще не получено"
+            ordered = sorted(
+                unlocked.items(),
+                key=lambda item: item[1] or datetime.min,
+                reverse=True
+            )
+            for achievement_id, unlocked_at in ordered:
+                achievement = achievement_rules.achievements.get(achievement_id)
+                if achievement is None:
+                    continue
+                date_str = unlocked_at.strftime(
+                    "%d.%m.%Y") if unlocked_at else "Еще не получено"
                 message_text += (
                     f"🔹 {achievement.name}\n"
                     f"📝 {achievement.description}\n"
                     f"📅 Получено: {date_str}\n\n"
                 )
 
-            # Получаем общее количество достижений
-            total_achievements = await session.scalar(select(func.count(Achievement.id)))
-            unlocked_count = len(achievements)
+            total_achievements = achievement_rules.total()
+            unlocked_count = count_unlocked(unlocked)
             message_text += f"🔓 {unlocked_count}/{total_achievements} достижений разблокировано"
 
             await callback.message.answer(message_text)
@@ -101,31 +116,23 @@ async def handle_task_type(callback: CallbackQuery, state: FSMContext, bot: Bot)
 
         task_type = int(callback.data.split(":")[1])
 
-        async with AsyncSessionLocal() as session:
-            stmt = select(Task.id).where(
-                and_(
-                    Task.type_number == task_type,
-                    Task.part_number == PartNumber.PART_ONE
-                )
-            )
-            result = await session.execute(stmt)
-            task_ids = [row[0] for row in result.all()]
+        cursor = await start_task_cursor(
+            task_type=task_type,
+            part_number=PartNumber.PART_ONE
+        )
 
-        if not task_ids:
+        if cursor is None:
             await callback.answer("Задания этого типа не найдены", show_alert=True)
             return
 
-        random.shuffle(task_ids)
-
         await state.update_data(
-            TASK_LIST=task_ids,
-            CURRENT_INDEX=0,
+            TASK_CURSOR=cursor.to_state(),
             IS_RANDOM_SESSION=False,
             CURRENT_TASK_TYPE=task_type,
-            CURRENT_PART=PartNumber.PART_ONE
+            CURRENT_PART=PartNumber.PART_ONE.value
         )
 
-        await display_task_by_id(callback.message, task_ids[0], state)
+        await display_cursor_task(callback.message, cursor, state)
         await callback.answer()
 
     except Exception as e:
@@ -148,31 +155,23 @@ async def handle_part_two_task_type(callback: CallbackQuery, state: FSMContext,
 
         task_type = int(callback.data.split(":")[1])
 
-        async with AsyncSessionLocal() as session:
-            stmt = select(Task.id).where(
-                and_(
-                    Task.type_number == task_type,
-                    Task.part_number == PartNumber.PART_TWO
-                )
-            )
-            result = await session.execute(stmt)
-            task_ids = [row[0] for row in result.all()]
+        cursor = await start_task_cursor(
+            task_type=task_type,
+            part_number=PartNumber.PART_TWO
+        )
 
-        if not task_ids:
+        if cursor is None:
             await callback.answer("Задания этого типа не найдены", show_alert=True)
             return
 
-        random.shuffle(task_ids)
-
         await state.update_data(
-            TASK_LIST=task_ids,
-            CURRENT_INDEX=0,
+            TASK_CURSOR=cursor.to_state(),
             IS_RANDOM_SESSION=False,
             CURRENT_TASK_TYPE=task_type,
-            CURRENT_PART=PartNumber.PART_TWO
+            CURRENT_PART=PartNumber.PART_TWO.value
         )
 
-        await display_task_by_id(callback.message, task_ids[0], state)
+        await display_cursor_task(callback.message, cursor, state)
         await callback.answer()
 
     except Exception as e:
@@ -182,20 +181,14 @@ async def handle_part_two_task_type(callback: CallbackQuery, state: FSMContext,
 
 async def show_random_task(message: Message, task_type: int, state: FSMContext):
     try:
-        async with AsyncSessionLocal() as session:
-            stmt = select(Task).where(
-                Task.type_number == task_type
-            ).options(selectinload(Task.topic))
-
-            tasks = (await session.execute(stmt)).scalars().all()
+        task = await get_random_task(task_type)
 
-            if not tasks:
-                await message.answer("Задания этого типа не найдены")
-                return
+        if not task:
+            await message.answer("Задания этого типа не найдены")
+            return
 
-            task = random.choice(tasks)
-            await state.update_data(current_task_id=task.id)
-            await display_task(message, task, state)
+        await state.update_data(current_task_id=task.id)
+        await display_task(message, task, state)
     except Exception as e:
         await message.answer(f"Ошибка при загрузке задания: {e}")
         print(f"Ошибка: {e}")
@@ -216,30 +209,21 @@ async def handle_subtopic_selection(callback: CallbackQuery, state: FSMContext,
 
         subtopic_id = int(callback.data.split(":")[1])
 
-        # Получаем все задания для выбранной подтемы
-        async with AsyncSessionLocal() as session:
-            stmt = select(Task.id).where(
-                Task.subtopic_id == subtopic_id
-            )
-            result = await session.execute(stmt)
-            task_ids = [row[0] for row in result.all()]
+        # Задания подтемы в случайном порядке из каталога
+        cursor = await start_task_cursor(subtopic_id=subtopic_id)
 
-        if not task_ids:
+        if cursor is None:
             await callback.answer("Задания по этой теме не найдены", show_alert=True)
             return
 
-        # Перемешиваем задания
-        random.shuffle(task_ids)
-
         await state.update_data(
-            TASK_LIST=task_ids,
-            CURRENT_INDEX=0,
+            TASK_CURSOR=cursor.to_state(),
             IS_RANDOM_SESSION=False,
             CURRENT_SUBTOPIC_ID=subtopic_id
         )
 
         # Отображаем первое задание
-        await display_task_by_id(callback.message, task_ids[0], state)
+        await display_cursor_task(callback.message, cursor, state)
         await callback.answer()
 
     except Exception as e:
@@ -262,34 +246,25 @@ async def handle_difficult_subtopic_selection(callback: CallbackQuery, state: FS
 
         subtopic_id = int(callback.data.split(":")[1])
 
-        # Получаем только сложные задания для выбранной подтемы
-        async with AsyncSessionLocal() as session:
-            stmt = select(Task.id).where(
-                and_(
-                    Task.subtopic_id == subtopic_id,
-                    Task.complexity == Complexity.HIGH
-                )
-            )
-            result = await session.execute(stmt)
-            task_ids = [row[0] for row in result.all()]
+        # Только сложные задания выбранной подтемы из каталога
+        cursor = await start_task_cursor(
+            subtopic_id=subtopic_id,
+            complexity=Complexity.HIGH
+        )
 
-        if not task_ids:
+        if cursor is None:
             await callback.answer("Сложные задания по этой теме не найдены", show_alert=True)
             return
 
-        # Перемешиваем задания
-        random.shuffle(task_ids)
-
         await state.update_data(
-            TASK_LIST=task_ids,
-            CURRENT_INDEX=0,
+            TASK_CURSOR=cursor.to_state(),
             IS_RANDOM_SESSION=False,
             CURRENT_SUBTOPIC_ID=subtopic_id,
             IS_DIFFICULT_SESSION=True  # Флаг сложной сессии
         )
 
         # Отображаем первое задание
-        await display_task_by_id(callback.message, task_ids[0], state)
+        await display_cursor_task(callback.message, cursor, state)
         await callback.answer()
 
     except Exception as e:
@@ -312,56 +287,45 @@ async def handle_button_answer(callback: CallbackQuery, state: FSMContext):
 
         async with AsyncSessionLocal() as session:
             async with session.begin():
-                task = await session.get(Task, task_id, with_for_update=True)
-                if not task:
-                    await callback.answer("Задание не найдено", show_alert=True)
-                    return
-
                 logger.info("Calling check_answer from inline_handlers.py")
-                # Проверяем ответ
-                from core.services.task_service import check_answer
+                # Ответ сверяется с ключом по индексу кнопки, без чтения задания из БД.
+                # Блокируются только строки статистики пользователя
                 result = await check_answer(
                     session=session,
                     task_id=task_id,
-                    user_answer=task.answer_options[answer_idx],
+                    user_answer=None,
                     user_id=callback.from_user.id,
-                    state=state
+                    state=state,
+                    option_index=answer_idx
                 )
 
-                if not result["success"]:
-                    await callback.answer("Ошибка при проверке ответа", show_alert=True)
-                    return
+        # Сообщения отправляем уже после коммита, не удерживая блокировки
+        if result.get("error") == "Task not found":
+            await callback.answer("Задание не найдено", show_alert=True)
+            return
+
+        if not result.get("success"):
+            await callback.answer("Ошибка при проверке ответа", show_alert=True)
+            return
 
-                # # ✅ ДОБАВЬТЕ ПРЯМО ЗДЕСЬ ВЫЗОВ ДОСТИЖЕНИЙ
-                # from core.services.achievement_service import check_and_unlock_achievements
-                # unlocked_achievements = await check_and_unlock_achievements(
-                #     session=session,
-                #     user_id=callback.from_user.id,
-                #     is_correct=result["is_correct"],
-                #     task_id=task_id
-                # )
-
-                # ДОБАВЬТЕ ОБРАБОТКУ ДОСТИЖЕНИЙ ЗДЕСЬ:
-                if "unlocked_achievements" in result and result["unlocked_achievements"]:
-                    for achievement in result["unlocked_achievements"]:
-                        await callback.message.answer(
-                            f"🎉 Новое достижение!\n"
-                            f"🏆 {achievement.name}\n"
-                            f"📝 {achievement.description}"
-                        )
-
-                # Отправляем результат - ИСПРАВЛЕНО использование result
-                await state.set_state(TaskStates.SHOWING_RESULT)
-                await callback.answer()
+        if "unlocked_achievements" in result and result["unlocked_achievements"]:
+            for achievement in result["unlocked_achievements"]:
                 await callback.message.answer(
-                    f"{'✅ Правильно!' if result['is_correct'] else '❌ Неверно!'}",
-                    reply_markup=theory_solution_kb(
-                        result['task_id'],  # Используем task_id из результата
-                        # Используем complexity из результата
-                        result['complexity']
-                    )
+                    f"🎉 Новое достижение!\n"
+                    f"🏆 {achievement.name}\n"
+                    f"📝 {achievement.description}"
                 )
 
+        await state.set_state(TaskStates.SHOWING_RESULT)
+        await callback.answer()
+        await callback.message.answer(
+            f"{'✅ Правильно!' if result['is_correct'] else '❌ Неверно!'}",
+            reply_markup=theory_solution_kb(
+                result['task_id'],
+                result['complexity']
+            )
+        )
+
     except Exception as e:
         logger.error(f"Error in handle_button_answer: {e}", exc_info=True)
         await callback.answer("Произошла ошибка при проверке ответа", show_alert=True)
@@ -377,9 +341,10 @@ async def handle_button_answer(callback: CallbackQuery, state: FSMContext):
 async def show_theory(callback: CallbackQuery):
     task_id = int(callback.data.split(":")[1])
 
-    async with AsyncSessionLocal() as session:
-        try:
-            async with session.begin():  # Явное управление транзакцией
+    try:
+        rendered = task_renders.get_theory(task_id)
+        if rendered is None:
+            async with AsyncSessionLocal() as session:
                 stmt = select(Task).where(Task.id == task_id).options(
                     selectinload(Task.theory).selectinload(Theory.topic)
                 )
@@ -387,39 +352,31 @@ async def show_theory(callback: CallbackQuery):
 
                 if not task:
                     await callback.answer("⚠️ Задание не найдено", show_alert=True)
-                    return  # Транзакция завершится автоматически
+                    return
 
                 if not task.theory:
                     await callback.answer("⚠️ Теория отсутствует", show_alert=True)
                     return
 
-                topic_name = task.theory.topic.title_ru if task.theory.topic else "Без темы"
-                theory_text = (
-                    f"📚 Теория по заданию {task.type_number}\n"
-                    f"Тема: {topic_name}\n\n"
-                    f"{task.theory.content}"
-                )
-
-                try:
-                    # Пытаемся отправить с Markdown разметкой
-                    await callback.message.answer(theory_text, parse_mode="HTML")
-                except Exception as e:
-                    logger.error(f"HTML error: {e}")
-                    try:
-                        # Если Markdown не работает, пробуем HTML
-                        await callback.message.answer(theory_text, parse_mode="Markdown")
-                    except Exception as e2:
-                        logger.error(f"Markdown error: {e2}")
-                        # Если ничего не работает, отправляем без форматирования
-                        await callback.message.answer(theory_text)
-
-                # Транзакция закоммитится автоматически при выходе из блока
+                rendered = task_renders.theory(task)
 
+        try:
+            await callback.message.answer(rendered.text, parse_mode=rendered.parse_mode)
         except Exception as e:
-            logger.error(f"Database error: {e}", exc_info=True)
-            await callback.answer("⚠️ Ошибка загрузки теории", show_alert=True)
-        finally:
-            await callback.answer()  # Всегда отвечаем на callback
+            logger.error(f"HTML error: {e}")
+            try:
+                # Если HTML не работает, пробуем Markdown
+                await callback.message.answer(rendered.text, parse_mode="Markdown")
+            except Exception as e2:
+                logger.error(f"Markdown error: {e2}")
+                # Если ничего не работает, отправляем без форматирования
+                await callback.message.answer(rendered.text, parse_mode=None)
+
+    except Exception as e:
+        logger.error(f"Database error: {e}", exc_info=True)
+        await callback.answer("⚠️ Ошибка загрузки теории", show_alert=True)
+    finally:
+        await callback.answer()  # Всегда отвечаем на callback
 
 
 # Обработчик разбора
@@ -433,11 +390,10 @@ async def handle_solution(callback: CallbackQuery):
         async with AsyncSessionLocal() as session:
             # Явно начинаем транзакцию
             async with session.begin():
-                # Получаем задачу с блокировкой для чтения
+                # Содержимое задачи только читаем - блокировка не нужна
                 task = await session.execute(
                     select(Task)
                     .where(Task.id == task_id)
-                    .with_for_update(read=True)
                 )
                 task = task.scalar_one_or_none()
 
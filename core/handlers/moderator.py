@@ -1,51 +1,61 @@
 from aiogram import Router, types, Bot
 from aiogram.filters import Command
 from aiogram.types import Message
-from sqlalchemy import select, func, desc
+from sqlalchemy import select
 from datetime import datetime, timedelta
 
 from core.filters.admin import IsModeratorFilter
 from core.database.models import User, UserProgress
+from core.services.rank_index import leaderboard, RANK_EXCLUDED_STATUSES
 from config.database import AsyncSessionLocal
 
-router = Router()
+router = Router(name='moderator')
+
+
+async def load_users(session, user_ids: list[int]) -> dict[int, User]:
+    """Загружает пользователей по списку ID одним запросом"""
+    users = await session.scalars(select(User).where(User.id.in_(user_ids)))
+    return {user.id: user for user in users}
 
 
 @router.message(Command("active_users"), IsModeratorFilter())
 async def cmd_active_users(message: types.Message):
     """Самые активные пользователи за последние 7 дней"""
     try:
-        async with AsyncSessionLocal() as session:
-            week_ago = datetime.now() - timedelta(days=7)
+        week_ago = datetime.now() - timedelta(days=7)
 
-            # Пользователи с наибольшей активностью
-            active_users = await session.execute(
+        # Один запрос: индекс по weekly_points дает порядок, LIMIT - первые 15 активных
+        async with AsyncSessionLocal() as session:
+            active_users = (await session.execute(
                 select(User, UserProgress.weekly_points)
                 .join(UserProgress, User.id == UserProgress.user_id)
-                .where(User.last_interaction_time >= week_ago)
-                .order_by(desc(UserProgress.weekly_points))
+                .where(
+                    User.last_interaction_time >= week_ago,
+                    User.status.not_in(RANK_EXCLUDED_STATUSES)
+                )
+                .order_by(UserProgress.weekly_points.desc())
                 .limit(15)
+            )).all()
+
+        if not active_users:
+            await message.answer("📊 Нет активных пользователей за последнюю неделю")
+            return
+
+        result = ["🏆 Самые активные пользователи (неделя):\n"]
+        for i, (user, weekly_points) in enumerate(active_users, 1):
+            result.append(
+                f"{i}. @{user.username or 'Без username'} (ID: {user.id})\n"
+                f"   ⚡ XP за неделю: {weekly_points}\n"
+                f"   📅 Последняя активность: {user.last_interaction_time.strftime('%d.%m.%Y %H:%M')}"
             )
 
-            if not active_users:
-                await message.answer("📊 Нет активных пользователей за последнюю неделю")
-                return
-
-            result = ["🏆 Самые активные пользователи (неделя):\n"]
-            for i, (user, weekly_points) in enumerate(active_users, 1):
-                result.append(
-                    f"{i}. @{user.username or 'Без username'} (ID: {user.id})\n"
-                    f"   ⚡ XP за неделю: {weekly_points}\n"
-                    f"   📅 Последняя активность: {user.last_interaction_time.strftime('%d.%m.%Y %H:%M')}"
-                )
-
-            # Разбиваем на сообщения если слишком длинное
-            text = "\n".join(result)
-            if len(text) > 4000:
-                for i in range(0, len(text), 4000):
-                    await message.answer(text[i:i+4000])
-            else:
-                await message.answer(text)
+        # Разбиваем на сообщения если слишком длинное
+        text = "\n".join(result)
+        if len(text) > 4000:
+            for i in range(0, len(text), 4000):
+                await message.answer(text[i:i+4000])
+        else:
+            await message.answer(text)
 
     except Exception as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
@@ -55,27 +65,28 @@ async def cmd_active_users(message: types.Message):
 async def cmd_top_users(message: types.Message):
     """Топ 10 пользователей по общему XP"""
     try:
-        async with AsyncSessionLocal() as session:
-            top_users = await session.execute(
-                select(User, UserProgress.total_points)
-                .join(UserProgress, User.id == UserProgress.user_id)
-                .order_by(desc(UserProgress.total_points))
-                .limit(10)
-            )
+        await leaderboard.ensure_loaded()
+        top = leaderboard.top_total(10)
 
-            if not top_users:
-                await message.answer("📊 Нет данных о пользователях")
-                return
+        if not top:
+            await message.answer("📊 Нет данных о пользователях")
+            return
 
-            result = ["🏆 Топ 10 пользователей по XP:\n"]
-            for i, (user, total_points) in enumerate(top_users, 1):
-                result.append(
-                    f"{i}. @{user.username or 'Без username'} (ID: {user.id})\n"
-                    f"   ⚡ Всего XP: {total_points}\n"
-                    f"   🎯 Статус: {user.status.value}"
-                )
+        async with AsyncSessionLocal() as session:
+            users = await load_users(session, [user_id for user_id, _ in top])
+
+        result = ["🏆 Топ 10 пользователей по XP:\n"]
+        for i, (user_id, total_points) in enumerate(top, 1):
+            user = users.get(user_id)
+            if not user:
+                continue
+            result.append(
+                f"{i}. @{user.username or 'Без username'} (ID: {user.id})\n"
+                f"   ⚡ Всего XP: {total_points}\n"
+                f"   🎯 Статус: {user.status.value}"
+            )
 
-            await message.answer("\n".join(result))
+        await message.answer("\n".join(result))
 
     except Exception as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
@@ -85,27 +96,28 @@ async def cmd_top_users(message: types.Message):
 async def cmd_top_weekly_users(message: types.Message):
     """Топ 10 пользователей по XP за неделю"""
     try:
-        async with AsyncSessionLocal() as session:
-            top_users = await session.execute(
-                select(User, UserProgress.weekly_points)
-                .join(UserProgress, User.id == UserProgress.user_id)
-                .order_by(desc(UserProgress.weekly_points))
-                .limit(10)
-            )
+        await leaderboard.ensure_loaded()
+        top = leaderboard.top_weekly(10)
 
-            if not top_users:
-                await message.answer("📊 Нет данных за неделю")
-                return
+        if not top:
+            await message.answer("📊 Нет данных за неделю")
+            return
 
-            result = ["🏆 Топ 10 пользователей за неделю:\n"]
-            for i, (user, weekly_points) in enumerate(top_users, 1):
-                result.append(
-                    f"{i}. @{user.username or 'Без username'} (ID: {user.id})\n"
-                    f"   ⚡ XP за неделю: {weekly_points}\n"
-                    f"   🎯 Статус: {user.status.value}"
-                )
+        async with AsyncSessionLocal() as session:
+            users = await load_users(session, [user_id for user_id, _ in top])
+
+        result = ["🏆 Топ 10 пользователей за неделю:\n"]
+        for i, (user_id, weekly_points) in enumerate(top, 1):
+            user = users.get(user_id)
+            if not user:
+                continue
+            result.append(
+                f"{i}. @{user.username or 'Без username'} (ID: {user.id})\n"
+                f"   ⚡ XP за неделю: {weekly_points}\n"
+                f"   🎯 Статус: {user.status.value}"
+            )
 
-            await message.answer("\n".join(result))
+        await message.answer("\n".join(result))
 
     except Exception as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
@@ -124,5 +136,6 @@ async def cmd_mhelp(message: types.Message):
         "👨‍🏫 Команды преподавателя:\n"
         "/student_progress [@username] - Прогресс студента\n"
         "/send_feedback [@username] [message] - Отправить feedback\n"
+        "/variants [N] - Сгенерировать N вариантов ОГЭ\n"
     )
     await message.answer(help_text)
@@ -38,11 +38,9 @@ from core.database.models import Task, Theory
 
 from core.fsm.states import TaskStates
 
-from core.services.task_display import display_task, display_task_by_id
-from core.services.task_utils import (
-    get_shuffled_task_ids,
-    get_variant_task_ids
-)
+from core.services.task_display import display_cursor_task, display_task
+from core.services.task_catalog import task_catalog
+from core.services.task_cursor import TaskCursor, start_task_cursor
 # from core.services.answer_processing import process_answer
 from core.services.task_utils import get_random_task
 from core.services.task_service import check_answer
@@ -60,7 +58,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-router = Router()
+router = Router(name='reply')
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -121,31 +119,31 @@ async def show_stats(message: types.Message, state: FSMContext, bot: Bot):
 
         # Формируем текст ответа
         response = [
-            f"⚡️ Всего XP: {stats['total_xp']} | XP Недели: {stats['weekly_xp']}",
-            f"👤 Уровень {stats['level'][0]} - {stats['level'][1]}",
+            f"⚡️ Всего XP: {stats.total_xp} | XP Недели: {stats.weekly_xp}",
+            f"👤 Уровень {stats.level[0]} - {stats.level[1]}",
             f"",
-            f"🔥 Текущая серия: {stats['streak']} дней!",
-            f"✅ Всего решено: {stats['total_tasks']} задач",
-            f"🎯 Общая точность: {int(stats['accuracy'])}%",
+            f"🔥 Текущая серия: {stats.streak} дней!",
+            f"✅ Всего решено: {stats.total_tasks} задач",
+            f"🎯 Общая точность: {int(stats.accuracy)}%",
             f""
         ]
 
         # Добавляем лучшую и худшую тему, если они есть
-        if stats['best_topic']:
+        if stats.best_topic:
             response.append(
-                f"🏆 Лучшая тема: {stats['best_topic'].title_ru} ({int(stats['best_topic_accuracy'])}%)"
+                f"🏆 Лучшая тема: {stats.best_topic.title_ru} ({int(stats.best_topic_accuracy)}%)"
             )
-        if stats['worst_topic']:
+        if stats.worst_topic:
             response.append(
-                f"⚠️ Тема для прокачки: {stats['worst_topic'].title_ru} ({int(stats['worst_topic_accuracy'])}%)"
+                f"⚠️ Тема для прокачки: {stats.worst_topic.title_ru} ({int(stats.worst_topic_accuracy)}%)"
             )
 
         # Добавляем рейтинги и достижения
         response.extend([
             f"",
-            f"🌍 Глобальный рейтинг: #{stats['global_rank']}",
-            f"📅 Недельный рейтинг: #{stats['weekly_rank']}",
-            f"🏆 Достижения: {stats['achievements_unlocked']}/{stats['achievements_total']}"
+            f"🌍 Глобальный рейтинг: #{stats.global_rank}",
+            f"📅 Недельный рейтинг: #{stats.weekly_rank}",
+            f"🏆 Достижения: {stats.achievements_unlocked}/{stats.achievements_total}"
         ])
 
         # Создаем inline-кнопку для просмотра достижений
@@ -381,23 +379,22 @@ async def handle_variant(message: Message, state: FSMContext, bot: Bot):
             logger.debug(f"Не удалось удалить сообщение: {e}")
 
     try:
-        # Получаем ID заданий для варианта
-        task_ids = await get_variant_task_ids()
+        # Вариант: по одному случайному заданию каждого типа
+        cursor = await start_task_cursor(variant=True)
 
-        if not task_ids:
+        if cursor is None:
             await message.answer("❌ Не удалось создать вариант. Задания не найдены.",
                                  reply_markup=practice_menu_kb())
             return
 
         await state.update_data(
-            TASK_LIST=task_ids,
-            CURRENT_INDEX=0,
+            TASK_CURSOR=cursor.to_state(),
             IS_RANDOM_SESSION=False,
             IS_VARIANT_SESSION=True  # Флаг, что это сессия варианта
         )
 
         # Отображаем первое задание
-        await display_task_by_id(message, task_ids[0], state)
+        await display_cursor_task(message, cursor, state)
 
     except Exception as e:
         logger.error(f"Error in handle_variant: {e}", exc_info=True)
@@ -556,20 +553,19 @@ async def random_tasks(message: Message, state: FSMContext, bot: Bot):
             # Сообщение могло быть уже удалено или не найдено
             logger.debug(f"Не удалось удалить сообщение: {e}")
 
-    # Получаем перемешанные ID заданий ВСЕХ типов
-    task_ids = await get_shuffled_task_ids()
+    # 20 случайных заданий ВСЕХ типов
+    cursor = await start_task_cursor(limit=20)
 
-    if not task_ids:
+    if cursor is None:
         await message.answer("❌ Задачи не найдены", reply_markup=tasks_menu_kb())
         return
 
     await state.update_data(
-        TASK_LIST=task_ids,
-        CURRENT_INDEX=0,
+        TASK_CURSOR=cursor.to_state(),
         IS_RANDOM_SESSION=True  # Флаг, что это случайная сессия
     )
 
-    await display_task_by_id(message, task_ids[0], state)
+    await display_cursor_task(message, cursor, state)
 
 
 # Обработчик кнопки "Первая часть"
@@ -672,48 +668,44 @@ async def next_task(message: Message, state: FSMContext, bot: Bot):  # Доба
             return
 
         data = await state.get_data()
-        task_ids = data.get('TASK_LIST', [])
-        current_idx = data.get('CURRENT_INDEX', 0)
-        task_message_id = data.get('task_message_id')
-        chat_id = data.get('chat_id', message.chat.id)
+        cursor = TaskCursor.from_state(data.get('TASK_CURSOR'))
         message_id = data.get('task_message_id')
 
-        print(
-            f"DEBUG: Trying to delete message {task_message_id} in chat {chat_id}")
-
-        # # Удаляем предыдущее сообщение
-        # if task_message_id:
-        #     try:
-        #         await bot.delete_message(
-        #             chat_id=chat_id,
-        #             message_id=task_message_id
-        #         )
-        #         print("DEBUG: Message deleted successfully")
-        #     except Exception as e:
-        #         print(f"DEBUG: Failed to delete message: {e}")
-        if message_id:
-            try:
-                await bot.delete_message(
-                    chat_id=message.chat.id,
-                    message_id=message_id
+        if cursor is not None:
+            await task_catalog.ensure_fresh()
+            cursor = cursor.advance()
+        stale = cursor is not None and cursor.is_stale()
+        next_task_id = cursor.task_id() if cursor is not None else None
+
+        if next_task_id is None:
+            # Сессия закончилась - убираем последнее задание с кнопками ответов
+            if message_id:
+                try:
+                    await bot.delete_message(
+                        chat_id=message.chat.id,
+                        message_id=message_id
+                    )
+                except Exception as e:
+                    # Сообщение могло быть уже удалено или не найдено
+                    logger.debug(f"Не удалось удалить сообщение: {e}")
+
+            if cursor is None:
+                await message.answer("❌ Список заданий пуст", reply_markup=practice_menu_kb())
+            elif stale:
+                # Каталог пересобран с другим набором заданий - старые позиции уже не те
+                await message.answer(
+                    "🔄 Банк заданий обновился, начните сессию заново",
+                    reply_markup=practice_menu_kb()
                 )
-            except Exception as e:
-                # Сообщение могло быть уже удалено или не найдено
-                logger.debug(f"Не удалось удалить сообщение: {e}")
-
-        if not task_ids:
-            await message.answer("❌ Список заданий пуст", reply_markup=practice_menu_kb())
+            else:
+                await message.answer("🎉 Вы завершили все задания в этой сессии!", reply_markup=practice_menu_kb())
             await state.clear()
             return
 
-        if current_idx + 1 >= len(task_ids):
-            await message.answer("🎉 Вы завершили все задания в этой сессии!", reply_markup=practice_menu_kb())
-            await state.clear()
-            return
-
-        next_idx = current_idx + 1
-        await display_task_by_id(message, task_ids[next_idx], state)
-        await state.update_data(CURRENT_INDEX=next_idx)
+        # Новое задание подменяет предыдущее сообщение: один запрос к Bot API.
+        # Обычно оно уже загружено заранее, пока пользователь отвечал
+        await display_cursor_task(message, cursor, state, edit=True, bot=bot)
+        await state.update_data(TASK_CURSOR=cursor.to_state())
 
     except Exception as e:
         logger.error(f"Error in next_task: {e}", exc_info=True)
@@ -762,7 +754,6 @@ async def handle_text_answer(message: Message, state: FSMContext):
         async with AsyncSessionLocal() as session:
             async with session.begin():
                 logger.info("Calling check_answer from reply_handlers.py")
-                from core.services.task_service import check_answer
                 result = await check_answer(
                     session=session,
                     task_id=task_id,
@@ -771,41 +762,30 @@ async def handle_text_answer(message: Message, state: FSMContext):
                     state=state
                 )
 
-                if not result["success"]:
-                    await message.answer("⚠️ Ошибка при проверке ответа")
-                    return
-
-                # ✅ ДОБАВЬТЕ ПРЯМО ЗДЕСЬ
-                # from core.services.achievement_service import check_and_unlock_achievements
-                # unlocked_achievements = await check_and_unlock_achievements(
-                #     session=session,
-                #     user_id=message.from_user.id,
-                #     is_correct=result["is_correct"],
-                #     task_id=task_id
-                # )
-
-                # ✅ ДОБАВЬТЕ ОБРАБОТКУ ДОСТИЖЕНИЙ ЗДЕСЬ:
-                if "unlocked_achievements" in result and result["unlocked_achievements"]:
-                    for achievement in result["unlocked_achievements"]:
-                        await message.answer(
-                            f"🎉 Новое достижение!\n"
-                            f"🏆 {achievement.name}\n"
-                            f"📝 {achievement.description}"
-                        )
-
-                # Меняем состояние после проверки ответа
-                await state.set_state(TaskStates.SHOWING_RESULT)
-
-                # Отправляем результат - ИСПРАВЛЕНО использование result
+        # Сообщения отправляем уже после коммита, не удерживая блокировки
+        if not result.get("success"):
+            await message.answer("⚠️ Ошибка при проверке ответа")
+            return
+
+        if "unlocked_achievements" in result and result["unlocked_achievements"]:
+            for achievement in result["unlocked_achievements"]:
                 await message.answer(
-                    f"{'✅ Правильно!' if result['is_correct'] else '❌ Неверно!'}",
-                    reply_markup=theory_solution_kb(
-                        result['task_id'],  # Используем task_id из результата
-                        # Используем complexity из результата
-                        result['complexity']
-                    )
+                    f"🎉 Новое достижение!\n"
+                    f"🏆 {achievement.name}\n"
+                    f"📝 {achievement.description}"
                 )
 
+        # Меняем состояние после проверки ответа
+        await state.set_state(TaskStates.SHOWING_RESULT)
+
+        await message.answer(
+            f"{'✅ Правильно!' if result['is_correct'] else '❌ Неверно!'}",
+            reply_markup=theory_solution_kb(
+                result['task_id'],
+                result['complexity']
+            )
+        )
+
     except Exception as e:
         logger.error(f"Ошибка обработки: {str(e)}", exc_info=True)
         await message.answer("⚠️ Ошибка при проверке ответа")
@@ -5,9 +5,10 @@ from sqlalchemy import select
 
 from core.filters.admin import IsTeacherFilter
 from core.database.models import User, UserStat, UserProgress
+from core.services.task_utils import generate_variants
 from config.database import AsyncSessionLocal
 
-router = Router()
+router = Router(name='teacher')
 
 
 @router.message(Command("student_progress"), IsTeacherFilter())
@@ -137,12 +138,43 @@ async def cmd_send_feedback(message: types.Message, bot: Bot):
         await message.answer(f"❌ Ошибка: {str(e)}")
 
 
+@router.message(Command("variants"), IsTeacherFilter())
+async def cmd_variants(message: types.Message):
+    """Генерирует несколько вариантов ОГЭ (номера заданий) для самостоятельных работ"""
+    try:
+        parts = message.text.split()
+        count = int(parts[1]) if len(parts) > 1 else 1
+        if not 1 <= count <= 30:
+            await message.answer("❌ Использование: /variants [1-30]")
+            return
+
+        variants = await generate_variants(count)
+        if not variants:
+            await message.answer("❌ Не удалось создать варианты. Задания не найдены.")
+            return
+
+        lines = [
+            f"📋 Вариант {i}: {', '.join(str(task_id) for task_id in task_ids)}"
+            for i, task_ids in enumerate(variants, 1)
+        ]
+
+        # Разбиваем на сообщения по 10 вариантов
+        for i in range(0, len(lines), 10):
+            await message.answer("\n\n".join(lines[i:i+10]))
+
+    except ValueError:
+        await message.answer("❌ Использование: /variants [1-30]")
+    except Exception as e:
+        await message.answer(f"❌ Ошибка: {str(e)}")
+
+
 @router.message(Command("thelp"), IsTeacherFilter())
 async def cmd_thelp(message: types.Message):
     """Помощь по командам преподавателя"""
     help_text = (
         "👨‍🏫 Команды преподавателя:\n\n"
         "/student_progress [@username] - Прогресс студента\n\n"
-        "/send_feedback [@username] [message] - Отправить обратную связь"
+        "/send_feedback [@username] [message] - Отправить обратную связь\n\n"
+        "/variants [N] - Сгенерировать N вариантов ОГЭ"
     )
     await message.answer(help_text)
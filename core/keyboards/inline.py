@@ -2,9 +2,12 @@ from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup
 
-from sqlalchemy import select
-from config.database import AsyncSessionLocal
-from core.database.models import Task, PartNumber, Complexity, Subtopic
+from typing import TYPE_CHECKING, Callable
+
+from core.database.models import PartNumber, Complexity
+
+if TYPE_CHECKING:
+    from core.services.task_catalog import TaskCatalog
 
 
 def answer_options_kb(options: list, task_id: int):
@@ -32,109 +35,87 @@ def theory_solution_kb(task_id: int, complexity: str) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-async def part_one_types_kb():
-    """Создает inline-клавиатуру с кнопками для всех типов заданий первой части"""
+def _types_kb(catalog: 'TaskCatalog', part_number: PartNumber, prefix: str) -> InlineKeyboardMarkup:
+    """Кнопки всех типов заданий одной части"""
     builder = InlineKeyboardBuilder()
+    for type_num in catalog.type_numbers(part_number):
+        builder.button(text=str(type_num), callback_data=f"{prefix}:{type_num}")
+    # Настраиваем количество кнопок в ряду (например, по 2)
+    builder.adjust(2)
+    return builder.as_markup()
 
-    async with AsyncSessionLocal() as session:
-        async with session.begin():  # Явное управление транзакцией
-            # Получаем уникальные номера типов заданий первой части
-            stmt = select(Task.type_number).where(
-                Task.part_number == PartNumber.PART_ONE
-            ).distinct().order_by(Task.type_number)
 
-            result = await session.execute(stmt)
-            type_numbers = result.scalars().all()
+def _subtopics_kb(catalog: 'TaskCatalog', prefix: str, complexity: Complexity = None) -> InlineKeyboardMarkup:
+    """Кнопки подтем с русскими названиями (и заданиями нужной сложности)"""
+    builder = InlineKeyboardBuilder()
+    for subtopic_id in sorted(catalog.subtopics):
+        subtopic = catalog.subtopics[subtopic_id]
+        if not subtopic.title_ru:  # Только подтемы с русскими названиями
+            continue
+        if complexity is not None and not catalog.lookup(subtopic_id=subtopic_id, complexity=complexity):
+            continue
+        builder.button(text=subtopic.title_ru, callback_data=f"{prefix}:{subtopic_id}")
+    builder.adjust(2)  # 2 кнопки в ряд
+    return builder.as_markup()
 
-            if not type_numbers:
-                # Если заданий нет, возвращаем пустую клавиатуру
-                return builder.as_markup()
 
-            # Добавляем кнопки для каждого типа
-            for type_num in type_numbers:
-                builder.button(
-                    text=str(type_num),
-                    callback_data=f"part_one:{type_num}"
-                )
+class CatalogKeyboards:
+    """
+    Меню выбора заданий, собранные из каталога. Клавиатура строится при первом
+    открытии меню и живет до пересборки каталога (изменились задания или подтемы)
+    """
 
-            # Настраиваем количество кнопок в ряду (например, по 2)
-            builder.adjust(2)
+    def __init__(self, catalog: 'TaskCatalog' = None):
+        self._catalog = catalog
+        self._generation = None
+        self._keyboards: dict[str, InlineKeyboardMarkup] = {}
 
-            return builder.as_markup()
+    @property
+    def catalog(self) -> 'TaskCatalog':
+        if self._catalog is None:
+            # Отложенный импорт: сервисы заданий сами импортируют клавиатуры
+            from core.services.task_catalog import task_catalog
+            self._catalog = task_catalog
+        return self._catalog
 
+    async def get(self, name: str, build: Callable[['TaskCatalog'], InlineKeyboardMarkup]) -> InlineKeyboardMarkup:
+        if not self.catalog.loaded:
+            await self.catalog.load()
+        if self._generation != self.catalog.generation:
+            self._keyboards = {}
+            self._generation = self.catalog.generation
 
-async def part_two_types_kb():
-    """Создает inline-клавиатуру с кнопками для всех типов заданий первой части"""
-    builder = InlineKeyboardBuilder()
+        keyboard = self._keyboards.get(name)
+        if keyboard is None:
+            keyboard = self._keyboards[name] = build(self.catalog)
+        return keyboard
 
-    async with AsyncSessionLocal() as session:
-        async with session.begin():  # Явное управление транзакцией
-            # Получаем уникальные номера типов заданий первой части
-            stmt = select(Task.type_number).where(
-                Task.part_number == PartNumber.PART_TWO
-            ).distinct().order_by(Task.type_number)
 
-            result = await session.execute(stmt)
-            type_numbers = result.scalars().all()
+catalog_keyboards = CatalogKeyboards()
 
-            if not type_numbers:
-                # Если заданий нет, возвращаем пустую клавиатуру
-                return builder.as_markup()
 
-            # Добавляем кнопки для каждого типа
-            for type_num in type_numbers:
-                builder.button(
-                    text=str(type_num),
-                    callback_data=f"part_two:{type_num}"
-                )
+async def part_one_types_kb() -> InlineKeyboardMarkup:
+    """Создает inline-клавиатуру с кнопками для всех типов заданий первой части"""
+    return await catalog_keyboards.get(
+        'part_one', lambda catalog: _types_kb(catalog, PartNumber.PART_ONE, 'part_one'))
 
-            # Настраиваем количество кнопок в ряду (например, по 2)
-            builder.adjust(2)
 
-            return builder.as_markup()
+async def part_two_types_kb() -> InlineKeyboardMarkup:
+    """Создает inline-клавиатуру с кнопками для всех типов заданий второй части"""
+    return await catalog_keyboards.get(
+        'part_two', lambda catalog: _types_kb(catalog, PartNumber.PART_TWO, 'part_two'))
 
 
-async def topics_menu_kb():
+async def topics_menu_kb() -> InlineKeyboardMarkup:
     """Создает клавиатуру с подтемами (на русском)"""
-    builder = InlineKeyboardBuilder()
-
-    async with AsyncSessionLocal() as session:
-        # Получаем все подтемы с русскими названиями
-        stmt = select(Subtopic).order_by(Subtopic.id)
-        subtopics = (await session.execute(stmt)).scalars().all()
-
-        for subtopic in subtopics:
-            if subtopic.title_ru:  # Только подтемы с русскими названиями
-                builder.button(
-                    text=subtopic.title_ru,
-                    callback_data=f"subtopic:{subtopic.id}"
-                )
+    return await catalog_keyboards.get(
+        'topics', lambda catalog: _subtopics_kb(catalog, 'subtopic'))
 
-        builder.adjust(2)  # 2 кнопки в ряд
-        return builder.as_markup()
 
-
-async def difficult_topics_menu_kb():
+async def difficult_topics_menu_kb() -> InlineKeyboardMarkup:
     """Создает клавиатуру с подтемами, где есть сложные задания"""
-    builder = InlineKeyboardBuilder()
-
-    async with AsyncSessionLocal() as session:
-        # Получаем подтемы, где есть задания высокой сложности
-        stmt = select(Subtopic).join(Task).where(
-            Task.complexity == Complexity.HIGH
-        ).distinct().order_by(Subtopic.id)
-
-        subtopics = (await session.execute(stmt)).scalars().all()
-
-        for subtopic in subtopics:
-            if subtopic.title_ru:  # Только подтемы с русскими названиями
-                builder.button(
-                    text=subtopic.title_ru,
-                    callback_data=f"difficult_subtopic:{subtopic.id}"
-                )
-
-        builder.adjust(2)  # 2 кнопки в ряд
-        return builder.as_markup()
+    return await catalog_keyboards.get(
+        'difficult_topics', lambda catalog: _subtopics_kb(catalog, 'difficult_subtopic', Complexity.HIGH))
 
 
 def achievements_button() -> InlineKeyboardBuilder:
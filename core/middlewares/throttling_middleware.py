@@ -0,0 +1,89 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject
+
+from config.settings import THROTTLE_CACHE_SIZE, THROTTLE_ROUTER_RATES
+from core.utils.cache import LRUCache
+from core.utils.debounce import ThrottleSpec
+from core.utils.rate_limit import KeyedRateLimiter
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_TEXT = "⏳ Подождите перед повторным нажатием"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничение частоты вызовов обработчиков: отдельное ведро токенов на пару
+    (пользователь или чат, обработчик), ведра хранятся в LRU ограниченного размера.
+    Лимит берется из флага @throttle обработчика, иначе - по имени роутера
+    из router_rates; без лимита обработчик вызывается как обычно.
+    Регистрируется внутренним middleware, чтобы видеть выбранный обработчик
+    """
+
+    def __init__(self, router_rates: dict[str, float] = None, maxsize: int = THROTTLE_CACHE_SIZE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.router_rates = THROTTLE_ROUTER_RATES if router_rates is None else router_rates
+        self.maxsize = maxsize
+        self.clock = clock
+        self._limiters: dict[tuple[float, int], KeyedRateLimiter] = {}
+        self._warned: dict[float, LRUCache] = {}
+
+    def spec_for(self, data: dict[str, Any]) -> Optional[ThrottleSpec]:
+        spec = get_flag(data, 'throttle')
+        if isinstance(spec, ThrottleSpec):
+            return spec
+        router = data.get('event_router')
+        rate = self.router_rates.get(router.name) if router is not None else None
+        return ThrottleSpec(rate=rate) if rate else None
+
+    def limiter(self, spec: ThrottleSpec) -> KeyedRateLimiter:
+        # Разных лимитов единицы, поэтому по ограничителю на каждый
+        limiter = self._limiters.get((spec.rate, spec.burst))
+        if limiter is None:
+            limiter = self._limiters[(spec.rate, spec.burst)] = KeyedRateLimiter(
+                rate=1 / spec.rate, capacity=spec.burst, maxsize=self.maxsize, clock=self.clock)
+        return limiter
+
+    @staticmethod
+    def subject_id(event: TelegramObject, scope: str) -> Optional[int]:
+        if scope == 'chat':
+            chat = getattr(event, 'chat', None) or getattr(getattr(event, 'message', None), 'chat', None)
+            if chat is not None:
+                return chat.id
+        from_user = getattr(event, 'from_user', None)
+        return from_user.id if from_user is not None else None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any]
+    ) -> Any:
+        spec = self.spec_for(data)
+        subject_id = self.subject_id(event, spec.scope) if spec else None
+        if subject_id is None:
+            return await handler(event, data)
+
+        handler_object = data.get('handler')
+        callback = getattr(handler_object, 'callback', handler)
+        key = (subject_id, f"{callback.__module__}.{callback.__qualname__}")
+
+        if self.limiter(spec).try_acquire(key):
+            return await handler(event, data)
+
+        # Предупреждаем один раз за окно, а не на каждое нажатие
+        warned = self._warned.get(spec.rate)
+        if warned is None:
+            warned = self._warned[spec.rate] = LRUCache(maxsize=self.maxsize, ttl=spec.rate)
+        if warned.get(key) is None:
+            warned.set(key, True)
+            try:
+                await event.answer(THROTTLED_TEXT)
+            except Exception as e:
+                logger.debug(f"Could not send throttle notice to {subject_id}: {e}")
+        return None
@@ -1,8 +1,7 @@
 from aiogram import BaseMiddleware
 from typing import Callable, Awaitable, Any
 from aiogram.types import TelegramObject
-from config.database import AsyncSessionLocal
-from core.services.user_service import get_or_create_user
+from core.services.user_context import user_contexts
 
 
 class UserMiddleware(BaseMiddleware):
@@ -13,15 +12,14 @@ class UserMiddleware(BaseMiddleware):
         data: dict[str, Any]
     ) -> Any:
         # Работаем только с сообщениями от пользователей
-        if not hasattr(event, 'from_user'):
+        from_user = getattr(event, 'from_user', None)
+        if from_user is None:
             return await handler(event, data)
 
-        async with AsyncSessionLocal() as session:
-            user = await get_or_create_user(
-                session=session,
-                user_id=event.from_user.id,
-                username=event.from_user.username
-            )
-            data['user'] = user  # Добавляем пользователя в контекст
+        # Пользователь и роль берутся из кэша и передаются фильтрам и обработчикам
+        data['user_context'] = await user_contexts.resolve(
+            user_id=from_user.id,
+            username=from_user.username
+        )
 
         return await handler(event, data)
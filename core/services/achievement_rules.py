@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import operator
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from types import MappingProxyType
+from typing import Iterable, Mapping, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.database.hooks import after_commit, transaction_state
+from core.database.models import Achievement, UserAchievement
+from core.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+OPERATORS = {
+    '>=': operator.ge,
+    '>': operator.gt,
+    '<=': operator.le,
+    '<': operator.lt,
+    '==': operator.eq,
+    '=': operator.eq,
+    '!=': operator.ne,
+}
+
+# Показатели пользователя, которые меняются от ответа к ответу
+METRICS = frozenset({
+    'solved_tasks',
+    'correct_answers',
+    'correct_percentage',
+    'daily_streak',
+    'total_points',
+})
+
+# Условия на текущее задание ("... AND topic_id = 3")
+TASK_FILTERS = frozenset({'topic_id', 'subtopic_id', 'type_number'})
+
+CLAUSE_RE = re.compile(r'^(\w+)\s*(>=|<=|==|!=|=|>|<)\s*(-?\d+(?:\.\d+)?)$')
+AND_RE = re.compile(r'\s+and\s+')
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Все, что нужно правилам, собранное один раз на ответ"""
+    solved_tasks: int
+    correct_answers: int
+    correct_percentage: float
+    daily_streak: int
+    total_points: int
+    is_correct: bool
+    topic_id: Optional[int] = None
+    subtopic_id: Optional[int] = None
+    type_number: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class Predicate:
+    field: str
+    op: str
+    value: float
+
+    def __call__(self, snapshot: UserSnapshot) -> bool:
+        actual = getattr(snapshot, self.field)
+        if actual is None:
+            return False
+        return OPERATORS[self.op](actual, self.value)
+
+
+@dataclass(frozen=True)
+class AchievementInfo:
+    """Данные достижения для уведомления пользователя"""
+    id: int
+    name: str
+    description: str
+    reward_points: int
+
+
+@dataclass(frozen=True)
+class AchievementRule:
+    achievement: AchievementInfo
+    predicates: tuple[Predicate, ...]
+    metrics: frozenset  # От каких показателей зависит правило
+
+    def matches(self, snapshot: UserSnapshot) -> bool:
+        return all(predicate(snapshot) for predicate in self.predicates)
+
+
+def compile_conditions(conditions: str) -> Optional[tuple[Predicate, ...]]:
+    """
+    'solved_tasks >= 10 AND topic_id = 3' -> (Predicate, Predicate).
+    None, если условие не распознано
+    """
+    text = (conditions or '').strip().lower()
+    if not text:
+        return None
+
+    predicates = []
+    for clause in AND_RE.split(text):
+        match = CLAUSE_RE.match(clause.strip())
+        if not match:
+            return None
+
+        field, op, value = match.groups()
+        if field not in METRICS and field not in TASK_FILTERS:
+            return None
+
+        predicates.append(Predicate(field=field, op=op, value=float(value)))
+
+    return tuple(predicates)
+
+
+def achievement_info(achievement) -> AchievementInfo:
+    return AchievementInfo(
+        id=achievement.id,
+        name=achievement.name,
+        description=achievement.description,
+        reward_points=achievement.reward_points or 0
+    )
+
+
+def compile_rule(achievement) -> Optional[AchievementRule]:
+    predicates = compile_conditions(achievement.conditions)
+    if predicates is None:
+        logger.warning(
+            f"Unsupported conditions for achievement {achievement.id}: {achievement.conditions!r}")
+        return None
+
+    return AchievementRule(
+        achievement=achievement_info(achievement),
+        predicates=predicates,
+        metrics=frozenset(p.field for p in predicates if p.field in METRICS)
+    )
+
+
+class AchievementRuleBook:
+    """Скомпилированные правила всех достижений, проиндексированные по показателям"""
+
+    def __init__(self):
+        self.loaded = False
+        self.achievements: dict[int, AchievementInfo] = {}  # Все достижения, включая нераспознанные
+        self.rules: dict[int, AchievementRule] = {}
+        self.by_metric: dict[str, tuple[AchievementRule, ...]] = {}
+        self.task_only: tuple[AchievementRule, ...] = ()
+        self._lock = asyncio.Lock()
+
+    def build(self, achievements: Iterable) -> None:
+        infos = {}
+        rules = {}
+        for achievement in achievements:
+            infos[achievement.id] = achievement_info(achievement)
+            rule = compile_rule(achievement)
+            if rule is not None:
+                rules[rule.achievement.id] = rule
+
+        by_metric = {}
+        task_only = []
+        for rule in rules.values():
+            if not rule.metrics:
+                task_only.append(rule)
+            for metric in rule.metrics:
+                by_metric.setdefault(metric, []).append(rule)
+
+        self.achievements = infos
+        self.rules = rules
+        self.by_metric = {k: tuple(v) for k, v in by_metric.items()}
+        self.task_only = tuple(task_only)
+        self.loaded = True
+        logger.info(f"Compiled {len(rules)} achievement rules")
+
+    async def load(self, session: AsyncSession) -> None:
+        async with self._lock:
+            achievements = (await session.execute(select(Achievement))).scalars().all()
+            self.build(achievements)
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        if not self.loaded:
+            await self.load(session)
+
+    def candidates(self, changed_metrics: Iterable[str] = METRICS) -> list[AchievementRule]:
+        """Правила, результат которых мог измениться (зависящие от changed_metrics или от задания)"""
+        seen = {}
+        for metric in changed_metrics:
+            for rule in self.by_metric.get(metric, ()):
+                seen[rule.achievement.id] = rule
+        for rule in self.task_only:
+            seen[rule.achievement.id] = rule
+        return list(seen.values())
+
+    def total(self) -> int:
+        """Количество всех достижений (для счетчика "N/M")"""
+        return len(self.achievements)
+
+
+class UnlockedAchievementsCache:
+    """
+    user_id -> {achievement_id: unlocked_at} (только для чтения).
+    Загружается одним запросом при первом обращении и дополняется после коммита
+    разблокировки; до коммита новые достижения видны только в своей транзакции
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    async def get(self, session: AsyncSession, user_id: int) -> Mapping[int, Optional[datetime]]:
+        unlocked = self._cache.get(user_id)
+        if unlocked is None:
+            rows = (await session.execute(
+                select(UserAchievement.achievement_id, UserAchievement.unlocked_at)
+                .where(UserAchievement.user_id == user_id)
+            )).all()
+            unlocked = MappingProxyType(
+                {row.achievement_id: row.unlocked_at for row in rows})
+            self._cache.set(user_id, unlocked)
+
+        pending = transaction_state(session, 'unlocked_achievements').get(user_id)
+        if pending:
+            unlocked = MappingProxyType({**unlocked, **pending})
+        return unlocked
+
+    def record(self, session: AsyncSession, user_id: int, achievement_ids: Iterable[int],
+               unlocked_at: datetime) -> None:
+        """Разблокировка в транзакции session: в общий кэш попадет только после коммита"""
+        achievement_ids = list(achievement_ids)
+        pending = transaction_state(session, 'unlocked_achievements').setdefault(user_id, {})
+        pending.update((achievement_id, unlocked_at) for achievement_id in achievement_ids)
+        after_commit(session, lambda: self.add(user_id, achievement_ids, unlocked_at))
+
+    def add(self, user_id: int, achievement_ids: Iterable[int], unlocked_at: datetime) -> None:
+        """Отмечает новые достижения (если набора пользователя нет в кэше, он загрузится из БД)"""
+        current = self._cache.get(user_id)
+        if current is None:
+            return
+        merged = dict(current)
+        merged.update((achievement_id, unlocked_at) for achievement_id in achievement_ids)
+        self._cache.set(user_id, MappingProxyType(merged))
+
+    def invalidate(self, user_id: int) -> None:
+        self._cache.pop(user_id)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+def count_unlocked(unlocked: Mapping[int, Optional[datetime]]) -> int:
+    return sum(1 for unlocked_at in unlocked.values() if unlocked_at is not None)
+
+
+# Единственные экземпляры на процесс
+achievement_rules = AchievementRuleBook()
+unlocked_achievements = UnlockedAchievementsCache()
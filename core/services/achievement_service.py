@@ -1,17 +1,26 @@
 import logging
 from datetime import datetime
-from sqlalchemy import select, and_, or_
+from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from core.database.models import (
     UserAchievement,
     Achievement,
-    User,
     UserStat,
     UserProgress,
-    Task,
-    Subtopic
+    Task
 )
-from typing import Optional, List, Tuple
+from typing import Iterable, Optional
+from core.services.achievement_rules import (
+    METRICS,
+    AchievementInfo,
+    UserSnapshot,
+    achievement_rules,
+    compile_rule,
+    unlocked_achievements
+)
+from core.database.hooks import after_commit
+from core.services.rank_index import leaderboard
+from core.services.task_catalog import task_catalog
 
 logger = logging.getLogger(__name__)
 
@@ -20,57 +29,50 @@ async def check_and_unlock_achievements(
     session: AsyncSession,
     user_id: int,
     is_correct: bool,  # Добавляем параметр is_correct
-    task_id: Optional[int] = None
-) -> list[Achievement]:
-    """Проверяет и разблокирует достижения пользователя."""
+    task_id: Optional[int] = None,
+    task=None,
+    changed_metrics: Iterable[str] = METRICS
+) -> list[AchievementInfo]:
+    """
+    Проверяет и разблокирует достижения пользователя.
+    Правила скомпилированы заранее и проверяются по одному снимку статистики,
+    поэтому число запросов не зависит от количества достижений.
+    changed_metrics - показатели, изменившиеся при ответе (результат apply_answer):
+    правила, не зависящие от них и от задания, не проверяются
+    """
     try:
-        # Получаем все достижения для проверки (без фильтра по типу)
-        stmt = select(Achievement)
-        achievements = (await session.execute(stmt)).scalars().all()
-
-        logger.info(f"Found {len(achievements)} achievements to check")
-
-        unlocked = []
-        for achievement in achievements:
-            # Проверяем, не разблокировано ли уже достижение
-            stmt_exists = select(UserAchievement).where(
-                and_(
-                    UserAchievement.user_id == user_id,
-                    UserAchievement.achievement_id == achievement.id
-                )
-            )
-            exists = (await session.execute(stmt_exists)).scalar_one_or_none()
-
+        await achievement_rules.ensure_loaded(session)
+
+        snapshot = await load_user_snapshot(
+            session, user_id, is_correct, task_id=task_id, task=task)
+        if snapshot is None:
+            return []
+
+        # Уже полученные достижения берем из кэша, проверяем только закрытые
+        unlocked_ids = await unlocked_achievements.get(session, user_id)
+
+        unlocked = [
+            rule.achievement
+            for rule in achievement_rules.candidates(changed_metrics)
+            if rule.achievement.id not in unlocked_ids and rule.matches(snapshot)
+        ]
+        if not unlocked:
+            return []
+
+        now = datetime.utcnow()
+        for achievement in unlocked:
+            session.add(UserAchievement(
+                user_id=user_id,
+                achievement_id=achievement.id,
+                unlocked_at=now,
+                progress=100
+            ))
             logger.info(
-                f"Checking achievement '{achievement.name}' (ID: {achievement.id}), already unlocked: {exists is not None}")
+                f"User {user_id} unlocked achievement {achievement.name}")
 
-            if not exists:
-                is_unlocked = await is_achievement_unlocked(
-                    session=session,
-                    user_id=user_id,
-                    achievement=achievement,
-                    is_correct=is_correct,
-                    task_id=task_id
-                )
-
-                logger.info(
-                    f"Achievement '{achievement.name}' unlock status: {is_unlocked}")
-
-                if is_unlocked:
-                    # Разблокируем достижение
-                    user_achievement = UserAchievement(
-                        user_id=user_id,
-                        achievement_id=achievement.id,
-                        unlocked_at=datetime.utcnow(),
-                        progress=100
-                    )
-                    session.add(user_achievement)
-
-                    await add_achievement_reward(session, user_id, achievement.reward_points)
-
-                    unlocked.append(achievement)
-                    logger.info(
-                        f"User {user_id} unlocked achievement {achievement.name}")
+        await add_achievement_reward(
+            session, user_id, sum(a.reward_points for a in unlocked))
+        unlocked_achievements.record(session, user_id, (a.id for a in unlocked), now)
 
         return unlocked
 
@@ -80,6 +82,39 @@ async def check_and_unlock_achievements(
         return []
 
 
+async def load_user_snapshot(
+    session: AsyncSession,
+    user_id: int,
+    is_correct: bool,
+    task_id: Optional[int] = None,
+    task=None
+) -> Optional[UserSnapshot]:
+    """
+    Собирает показатели пользователя для проверки правил.
+    UserStat и UserProgress к этому моменту уже загружены update_user_stats,
+    поэтому session.get берет их из identity map без запросов к БД.
+    """
+    user_stat = await session.get(UserStat, user_id)
+    user_progress = await session.get(UserProgress, user_id)
+    if not user_stat or not user_progress:
+        return None
+
+    if task is None and task_id is not None:
+        task = task_catalog.get(task_id) or await session.get(Task, task_id)
+
+    return UserSnapshot(
+        solved_tasks=user_stat.total_attempts or 0,  # Все попытки, а не только правильные
+        correct_answers=user_stat.correct_answers or 0,
+        correct_percentage=user_stat.percentage or 0.0,
+        daily_streak=user_progress.current_streak or 0,
+        total_points=user_progress.total_points or 0,
+        is_correct=is_correct,
+        topic_id=task.topic_id if task else None,
+        subtopic_id=task.subtopic_id if task else None,
+        type_number=task.type_number if task else None
+    )
+
+
 async def add_achievement_reward(session: AsyncSession, user_id: int, reward_points: int):
     """Начисляет очки за достижение"""
     try:
@@ -96,6 +131,9 @@ async def add_achievement_reward(session: AsyncSession, user_id: int, reward_poi
         session.add(user_progress)
         await session.flush()
 
+        total_points, weekly_points = user_progress.total_points, user_progress.weekly_points
+        after_commit(session, lambda: leaderboard.update(user_id, total_points, weekly_points))
+
         logger.info(f"Added {reward_points} reward points to user {user_id}")
 
     except Exception as e:
@@ -148,24 +186,13 @@ async def is_achievement_unlocked(
     Возвращает True, если условие выполнено.
     """
     try:
-        condition = achievement.conditions.lower()
-
-        # Разбираем условие по типам
-        if "solved_tasks" in condition and "topic_id" not in condition and "subtopic_id" not in condition:
-            # Простое условие на количество решенных задач
-            return await check_solved_tasks_condition(session, user_id, condition)
-        elif "solved_tasks" in condition:
-            return await check_solved_tasks_condition(session, user_id, condition)
-        elif "correct_percentage" in condition:
-            return await check_correct_percentage_condition(session, user_id, condition)
-        elif "daily_streak" in condition:
-            return await check_daily_streak_condition(session, user_id, condition)
-        elif "topic_id" in condition and task_id:
-            return await check_topic_condition(session, user_id, condition, task_id)
-        elif "subtopic_id" in condition and task_id:
-            return await check_subtopic_condition(session, user_id, condition, task_id)
+        rule = achievement_rules.rules.get(achievement.id) or compile_rule(achievement)
+        if rule is None:
+            return False
 
-        return False
+        snapshot = await load_user_snapshot(
+            session, user_id, is_correct, task_id=task_id)
+        return snapshot is not None and rule.matches(snapshot)
 
     except Exception as e:
         logger.error(
@@ -173,190 +200,6 @@ async def is_achievement_unlocked(
         return False
 
 
-async def check_solved_tasks_condition(
-    session: AsyncSession,
-    user_id: int,
-    condition: str
-) -> bool:
-    """Проверяет условие на количество решенных задач"""
-    try:
-        # Пример условия: "solved_tasks >= 10"
-        parts = condition.split()
-        if len(parts) < 3 or parts[0] != "solved_tasks":
-            return False
-
-        operator = parts[1]
-        required = int(parts[2])
-
-        # Получаем статистику пользователя
-        user_stat = await session.get(UserStat, user_id)
-        if not user_stat:
-            return False
-
-        # ИСПРАВЛЕНИЕ: используем total_attempts вместо correct_answers
-        solved = user_stat.total_attempts  # Все попытки, а не только правильные
-
-        # Применяем оператор сравнения
-        if operator == ">=":
-            return solved >= required
-        elif operator == ">":
-            return solved > required
-        elif operator == "<=":
-            return solved <= required
-        elif operator == "<":
-            return solved < required
-        elif operator == "==":
-            return solved == required
-
-        return False
-
-    except Exception as e:
-        logger.error(f"Error in check_solved_tasks_condition: {e}")
-        return False
-
-
-async def check_correct_percentage_condition(
-    session: AsyncSession,
-    user_id: int,
-    condition: str
-) -> bool:
-    """Проверяет условие на процент правильных ответов"""
-    try:
-        # Пример условия: "correct_percentage > 80 AND topic_id = 3"
-        parts = condition.split()
-        if len(parts) < 3 or parts[0] != "correct_percentage":
-            return False
-
-        operator = parts[1]
-        required = float(parts[2])
-
-        # Получаем статистику пользователя
-        user_stat = await session.get(UserStat, user_id)
-        if not user_stat:
-            return False
-
-        percentage = user_stat.percentage
-
-        # Применяем оператор сравнения
-        if operator == ">=":
-            return percentage >= required
-        elif operator == ">":
-            return percentage > required
-        elif operator == "<=":
-            return percentage <= required
-        elif operator == "<":
-            return percentage < required
-        elif operator == "==":
-            return percentage == required
-
-        return False
-
-    except Exception as e:
-        logger.error(f"Error in check_correct_percentage_condition: {e}")
-        return False
-
-
-async def check_daily_streak_condition(
-    session: AsyncSession,
-    user_id: int,
-    condition: str
-) -> bool:
-    """Проверяет условие на серию дней активности"""
-    try:
-        # Пример условия: "daily_streak >= 5"
-        parts = condition.split()
-        if len(parts) < 3 or parts[0] != "daily_streak":
-            return False
-
-        operator = parts[1]
-        required = int(parts[2])
-
-        # Получаем прогресс пользователя
-        user_progress = await session.get(UserProgress, user_id)
-        if not user_progress:
-            return False
-
-        streak = user_progress.current_streak
-
-        # Применяем оператор сравнения
-        if operator == ">=":
-            return streak >= required
-        elif operator == ">":
-            return streak > required
-        elif operator == "<=":
-            return streak <= required
-        elif operator == "<":
-            return streak < required
-        elif operator == "==":
-            return streak == required
-
-        return False
-
-    except Exception as e:
-        logger.error(f"Error in check_daily_streak_condition: {e}")
-        return False
-
-
-async def check_topic_condition(
-    session: AsyncSession,
-    user_id: int,
-    condition: str,
-    task_id: int
-) -> bool:
-    """Проверяет условие, связанное с конкретной темой"""
-    try:
-        # Пример условия: "solved_tasks >= 10 AND topic_id = 3"
-        task = await session.get(Task, task_id)
-        if not task:
-            return False
-
-        # Проверяем, что условие содержит нужную тему
-        topic_part = next((p for p in condition.split()
-                          if p.startswith("topic_id")), None)
-        if not topic_part:
-            return False
-
-        # Получаем ID темы из условия
-        topic_id = int(topic_part.split("=")[1])
-
-        # Проверяем, что задача относится к нужной теме
-        return task.topic_id == topic_id
-
-    except Exception as e:
-        logger.error(f"Error in check_topic_condition: {e}")
-        return False
-
-
-async def check_subtopic_condition(
-    session: AsyncSession,
-    user_id: int,
-    condition: str,
-    task_id: int
-) -> bool:
-    """Проверяет условие, связанное с конкретной подтемой"""
-    try:
-        # Пример условия: "solved_tasks >= 5 AND subtopic_id = 12"
-        task = await session.get(Task, task_id)
-        if not task or not task.subtopic_id:
-            return False
-
-        # Проверяем, что условие содержит нужную подтему
-        subtopic_part = next((p for p in condition.split()
-                              if p.startswith("subtopic_id")), None)
-        if not subtopic_part:
-            return False
-
-        # Получаем ID подтемы из условия
-        subtopic_id = int(subtopic_part.split("=")[1])
-
-        # Проверяем, что задача относится к нужной подтеме
-        return task.subtopic_id == subtopic_id
-
-    except Exception as e:
-        logger.error(f"Error in check_subtopic_condition: {e}")
-        return False
-
-
 async def get_user_achievements(
     session: AsyncSession,
     user_id: int
@@ -9,6 +9,8 @@ from sqlalchemy import select
 from core.fsm.states import TaskStates
 import logging
 from .achievement_service import check_and_unlock_achievements
+from .answer_key import answer_keys
+from .stats_aggregator import stats_aggregator
 from ..keyboards.inline import achievements_button
 
 logger = logging.getLogger(__name__)
@@ -17,41 +19,68 @@ logger = logging.getLogger(__name__)
 async def check_answer(
     session: AsyncSession,
     task_id: int,
-    user_answer: str,
-    user_id: int
+    user_answer: str | None,
+    user_id: int,
+    option_index: int | None = None
 ) -> dict:
-    """Проверяет ответ и обновляет статистику"""
+    """
+    Проверяет ответ и обновляет статистику.
+    Ответ кнопкой передается через option_index и сверяется с ключом по индексу
+    """
     try:
-        task = await session.get(Task, task_id, with_for_update=True)
+        # Задание только читается - обычное чтение без блокировок,
+        # блокируются лишь строки статистики самого пользователя
+        task = await get_task_for_check(session, task_id)
         if not task:
             return {"error": "Task not found"}
 
-        is_correct = str(user_answer).strip().lower() == str(
-            task.correct_answer).strip().lower()
+        # Сверяем с ключом ответа (компилируется один раз на каждую версию ответа)
+        answer_key = answer_keys.get_for(task)
+        if option_index is not None:
+            is_correct = answer_key.matches_option(option_index)
+        else:
+            is_correct = answer_key.matches(user_answer)
+
+        # В режиме отложенной записи статистику и достижения применит фоновая задача
+        if stats_aggregator.running:
+            stats_aggregator.enqueue(user_id, task_id, is_correct)
+            return {
+                "success": True,
+                "is_correct": is_correct,
+                "task_id": task_id,
+                "complexity": task.complexity.value,
+                "unlocked_achievements": []
+            }
 
         # Обновляем статистику
-        from .stats_service import update_user_stats
-        update_success = await update_user_stats(
+        from .stats_service import update_user_stats, invalidate_user_stats
+        changed_metrics = await update_user_stats(
             session=session,
             user_id=user_id,
             task_id=task_id,
-            is_correct=is_correct
+            is_correct=is_correct,
+            task=task
         )
 
         # Обновляем время последней активности
         from core.services.user_service import update_last_interaction
         await update_last_interaction(session, user_id)
 
-        if not update_success:
+        if not changed_metrics:
             return {"error": "Failed to update stats"}
 
+        # Экран статистики должен показать свежие данные
+        invalidate_user_stats(user_id)
+
         # Проверяем достижения в той же транзакции
         logger.info(f"Checking achievements for user {user_id}")
         unlocked_achievements = await check_and_unlock_achievements(
             session=session,
             user_id=user_id,
             is_correct=is_correct,  # Передаем флаг правильности ответа
-            task_id=task_id
+            task_id=task_id,
+            task=task,
+            changed_metrics=changed_metrics
         )
         logger.info(f"Unlocked achievements: {len(unlocked_achievements)}")
 
@@ -67,3 +96,11 @@ async def check_answer(
         logger.error(f"Error in check_answer: {e}", exc_info=True)
         await session.rollback()
         return {"error": str(e)}
+
+
+async def get_task_for_check(session: AsyncSession, task_id: int):
+    """
+    Задание для проверки ответа: обычное чтение без FOR UPDATE. Ответ берется
+    из строки БД, а не из каталога, чтобы правка ответа действовала сразу
+    """
+    return await session.get(Task, task_id)
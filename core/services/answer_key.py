@@ -0,0 +1,177 @@
+import logging
+import math
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from config.settings import ANSWER_REL_TOLERANCE, ANSWER_ABS_TOLERANCE, ANSWER_KEY_CACHE_SIZE
+from core.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+# Единица -> (базовая единица, множитель). Регистр не учитывается, поэтому
+# приставки, различающиеся только регистром (мДж/МДж), сюда не входят
+UNIT_FACTORS = {
+    'мм': ('м', 0.001), 'см': ('м', 0.01), 'дм': ('м', 0.1),
+    'м': ('м', 1.0), 'км': ('м', 1000.0),
+    'мг': ('кг', 1e-6), 'г': ('кг', 0.001), 'кг': ('кг', 1.0), 'т': ('кг', 1000.0),
+    'мс': ('с', 0.001), 'с': ('с', 1.0), 'мин': ('с', 60.0), 'ч': ('с', 3600.0),
+    'м/с': ('м/с', 1.0), 'см/с': ('м/с', 0.01), 'км/ч': ('м/с', 1 / 3.6),
+    'м/с2': ('м/с2', 1.0),
+    'мл': ('м3', 1e-6), 'л': ('м3', 0.001), 'см3': ('м3', 1e-6), 'м3': ('м3', 1.0),
+    'н': ('н', 1.0), 'кн': ('н', 1000.0),
+    'дж': ('дж', 1.0), 'кдж': ('дж', 1000.0),
+    'вт': ('вт', 1.0), 'квт': ('вт', 1000.0),
+    'па': ('па', 1.0), 'кпа': ('па', 1000.0),
+    'в': ('в', 1.0), 'кв': ('в', 1000.0),
+    'а': ('а', 1.0), 'ма': ('а', 0.001),
+    'ом': ('ом', 1.0), 'ком': ('ом', 1000.0),
+    'гц': ('гц', 1.0), 'кгц': ('гц', 1000.0),
+    'кг/м3': ('кг/м3', 1.0), 'г/см3': ('кг/м3', 1000.0),
+}
+
+# Латинские написания и варианты степеней
+UNIT_ALIASES = {
+    'mm': 'мм', 'cm': 'см', 'm': 'м', 'km': 'км',
+    'g': 'г', 'kg': 'кг',
+    'ms': 'мс', 's': 'с', 'сек': 'с', 'h': 'ч',
+    'm/s': 'м/с', 'km/h': 'км/ч', 'м/с^2': 'м/с2', 'м/с²': 'м/с2', 'm/s2': 'м/с2',
+    'l': 'л', 'м^3': 'м3', 'м³': 'м3', 'см^3': 'см3', 'см³': 'см3',
+    'n': 'н', 'kn': 'кн', 'j': 'дж', 'kj': 'кдж', 'w': 'вт', 'kw': 'квт',
+    'pa': 'па', 'kpa': 'кпа', 'v': 'в', 'kv': 'кв', 'a': 'а', 'ma': 'ма',
+    'hz': 'гц', 'khz': 'кгц',
+    'кг/м^3': 'кг/м3', 'кг/м³': 'кг/м3', 'г/см^3': 'г/см3', 'г/см³': 'г/см3',
+}
+
+NUMBER_RE = re.compile(r'^([+-]?\d+(?:\.\d+)?(?:e[+-]?\d+)?)\s*(.*)$')
+INTEGER_RE = re.compile(r'^\d+$')
+
+
+def normalize_answer(value) -> str:
+    """Нормализует ответ: регистр, ё, пробелы, десятичная запятая"""
+    text = str(value if value is not None else '').strip().lower()
+    text = text.replace('ё', 'е')
+    text = re.sub(r'(?<=\d),(?=\d)', '.', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.rstrip('.')
+
+
+def normalize_unit(unit: str) -> str:
+    unit = unit.replace(' ', '').rstrip('.')
+    return UNIT_ALIASES.get(unit, unit)
+
+
+def parse_quantity(normalized: str) -> Optional[tuple[float, str]]:
+    """
+    '2.5 м/с' -> (2.5, 'м/с'); None, если ответ не число или после числа
+    идет не известная единица ('12abc', '1 2 3')
+    """
+    match = NUMBER_RE.match(normalized)
+    if not match:
+        return None
+    unit = normalize_unit(match.group(2))
+    if unit and unit not in UNIT_FACTORS:
+        return None
+    try:
+        return float(match.group(1)), unit
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class AnswerKey:
+    """Скомпилированный правильный ответ задания"""
+    task_id: int
+    normalized: str
+    number: Optional[float]
+    unit: str
+    option_index: Optional[int]  # Индекс правильного варианта, если он есть среди кнопок
+    options: tuple[str, ...]  # Нормализованные варианты ответа
+
+    def matches(self, user_answer) -> bool:
+        """Сравнивает произвольный ответ пользователя с ключом"""
+        normalized = normalize_answer(user_answer)
+        if normalized == self.normalized:
+            return True
+
+        if self.number is None:
+            return False
+        quantity = parse_quantity(normalized)
+        if quantity is None:
+            return False
+
+        number, unit = quantity
+        # Единицу можно не указывать, но нельзя добавить к безразмерному ответу
+        if unit and not self.unit:
+            return False
+        # Ответы-последовательности цифр ("315") сравниваем только как строки
+        if not unit and not self.unit and INTEGER_RE.match(normalized) and INTEGER_RE.match(self.normalized):
+            return False
+
+        expected = self.number
+        if unit and self.unit and unit != self.unit:
+            user_base = UNIT_FACTORS.get(unit)
+            key_base = UNIT_FACTORS.get(self.unit)
+            if not user_base or not key_base or user_base[0] != key_base[0]:
+                return False
+            number *= user_base[1]
+            expected *= key_base[1]
+
+        return math.isclose(
+            number,
+            expected,
+            rel_tol=ANSWER_REL_TOLERANCE,
+            abs_tol=ANSWER_ABS_TOLERANCE
+        )
+
+    def matches_option(self, option_index: int) -> bool:
+        """Проверяет ответ кнопкой answer:{task_id}:{idx} без обращения к БД"""
+        if self.option_index is not None:
+            return option_index == self.option_index
+        if 0 <= option_index < len(self.options):
+            return self.matches(self.options[option_index])
+        return False
+
+
+def compile_answer_key(task) -> AnswerKey:
+    """Строит ключ по Task или CatalogTask"""
+    normalized = normalize_answer(task.correct_answer)
+    quantity = parse_quantity(normalized)
+    options = tuple(normalize_answer(o) for o in (task.answer_options or ()))
+
+    option_index = next(
+        (i for i, option in enumerate(options) if option == normalized),
+        None
+    )
+
+    return AnswerKey(
+        task_id=task.id,
+        normalized=normalized,
+        number=quantity[0] if quantity else None,
+        unit=quantity[1] if quantity else '',
+        option_index=option_index,
+        options=options
+    )
+
+
+class AnswerKeyCache:
+    """
+    Скомпилированные ключи ответов. Ключ кэша - сам ответ и варианты задания,
+    а не только id: после правки ответа в БД ключ компилируется заново
+    """
+
+    def __init__(self, maxsize: int = ANSWER_KEY_CACHE_SIZE):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def get_for(self, task) -> AnswerKey:
+        """Ключ для загруженного задания (Task из БД или CatalogTask)"""
+        cache_key = (task.id, task.correct_answer, tuple(map(str, task.answer_options or ())))
+        key = self._cache.get(cache_key)
+        if key is None:
+            key = compile_answer_key(task)
+            self._cache.set(cache_key, key)
+        return key
+
+
+answer_keys = AnswerKeyCache()
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable, Optional
+
+from aiogram import Bot
+from sqlalchemy import select, update
+
+from config.database import AsyncSessionLocal
+from config.settings import BROADCAST_CONCURRENCY, BROADCAST_PAGE_SIZE
+from core.database.models import Broadcast, User
+from core.services.delivery import RateLimitedSender, SENT, BLOCKED, get_sender
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BroadcastReport:
+    broadcast_id: int
+    text: str
+    last_user_id: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    finished: bool = False
+    elapsed: float = 0.0
+    failed_users: list = field(default_factory=list)  # Первые неудачные id для отчета
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+    @property
+    def rate(self) -> float:
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    @classmethod
+    def from_row(cls, row: Broadcast) -> 'BroadcastReport':
+        return cls(
+            broadcast_id=row.id,
+            text=row.text,
+            last_user_id=row.last_user_id or 0,
+            sent=row.sent or 0,
+            failed=row.failed or 0,
+            blocked=row.blocked or 0,
+            finished=row.finished_at is not None
+        )
+
+
+class BroadcastStore:
+    """Пользователи для рассылки и контрольные точки в БД"""
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+
+    async def create(self, text: str) -> BroadcastReport:
+        async with self.session_factory() as session:
+            row = Broadcast(text=text, created_at=datetime.utcnow(),
+                            last_user_id=0, sent=0, failed=0, blocked=0)
+            session.add(row)
+            await session.commit()
+            return BroadcastReport.from_row(row)
+
+    async def get(self, broadcast_id: int = None) -> Optional[BroadcastReport]:
+        """Рассылка по id или последняя незавершенная"""
+        async with self.session_factory() as session:
+            if broadcast_id is not None:
+                row = await session.get(Broadcast, broadcast_id)
+            else:
+                row = await session.scalar(
+                    select(Broadcast)
+                    .where(Broadcast.finished_at.is_(None))
+                    .order_by(Broadcast.id.desc())
+                    .limit(1)
+                )
+            return BroadcastReport.from_row(row) if row else None
+
+    async def fetch_user_ids(self, after_id: int, limit: int) -> list[int]:
+        """Следующая страница id (keyset-пагинация по первичному ключу)"""
+        async with self.session_factory() as session:
+            return list((await session.execute(
+                select(User.id)
+                .where(User.id > after_id, User.blocked_at.is_(None))
+                .order_by(User.id)
+                .limit(limit)
+            )).scalars().all())
+
+    async def save_checkpoint(self, report: BroadcastReport, blocked_ids: Iterable[int] = ()) -> None:
+        """Счетчики, позиция и заблокировавшие бота пользователи - одной транзакцией"""
+        blocked_ids = list(blocked_ids)
+        async with self.session_factory() as session:
+            async with session.begin():
+                await session.execute(
+                    update(Broadcast)
+                    .where(Broadcast.id == report.broadcast_id)
+                    .values(
+                        last_user_id=report.last_user_id,
+                        sent=report.sent,
+                        failed=report.failed,
+                        blocked=report.blocked,
+                        finished_at=datetime.utcnow() if report.finished else None
+                    )
+                )
+                if blocked_ids:
+                    await session.execute(
+                        update(User)
+                        .where(User.id.in_(blocked_ids))
+                        .values(blocked_at=datetime.utcnow())
+                    )
+
+
+class BroadcastEngine:
+    """
+    Рассылка постранично: страница id отправляется пулом из concurrency
+    параллельных задач через общий RateLimitedSender, после каждой страницы
+    сохраняется контрольная точка, с которой рассылку можно продолжить
+    """
+
+    def __init__(
+        self,
+        bot: Bot = None,
+        store: BroadcastStore = None,
+        sender: RateLimitedSender = None,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        page_size: int = BROADCAST_PAGE_SIZE
+    ):
+        self.store = store or BroadcastStore()
+        self.sender = sender or get_sender(bot)
+        self.concurrency = concurrency
+        self.page_size = page_size
+
+    async def start(self, text: str, on_progress: Callable[[BroadcastReport], Awaitable[None]] = None) -> BroadcastReport:
+        report = await self.store.create(text)
+        logger.info(f"Broadcast {report.broadcast_id} started")
+        return await self.run(report, on_progress)
+
+    async def resume(self, broadcast_id: int = None, on_progress=None) -> Optional[BroadcastReport]:
+        report = await self.store.get(broadcast_id)
+        if report is None or report.finished:
+            return report
+        logger.info(f"Broadcast {report.broadcast_id} resumed after user {report.last_user_id}")
+        return await self.run(report, on_progress)
+
+    async def run(self, report: BroadcastReport, on_progress=None) -> BroadcastReport:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        elapsed_before = report.elapsed
+
+        async def deliver(user_id: int):
+            async with semaphore:
+                return user_id, await self.sender.send(user_id, report.text)
+
+        while True:
+            user_ids = await self.store.fetch_user_ids(report.last_user_id, self.page_size)
+            if not user_ids:
+                break
+
+            results = await asyncio.gather(*(deliver(user_id) for user_id in user_ids))
+
+            blocked_ids = []
+            for user_id, outcome in results:
+                if outcome == SENT:
+                    report.sent += 1
+                elif outcome == BLOCKED:
+                    report.blocked += 1
+                    blocked_ids.append(user_id)
+                else:
+                    report.failed += 1
+                    if len(report.failed_users) < 10:
+                        report.failed_users.append(user_id)
+
+            report.last_user_id = user_ids[-1]
+            report.elapsed = elapsed_before + time.monotonic() - started
+            await self.store.save_checkpoint(report, blocked_ids)
+
+            if on_progress:
+                try:
+                    await on_progress(report)
+                except Exception as e:
+                    logger.error(f"Broadcast progress callback failed: {e}")
+
+        report.finished = True
+        report.elapsed = elapsed_before + time.monotonic() - started
+        await self.store.save_checkpoint(report)
+        logger.info(
+            f"Broadcast {report.broadcast_id} finished: sent={report.sent}, "
+            f"blocked={report.blocked}, failed={report.failed}, {report.rate:.1f} msg/s")
+        return report
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError
+)
+
+from config.settings import BROADCAST_RATE, BROADCAST_PER_CHAT_RATE
+from core.utils.rate_limit import KeyedRateLimiter, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Результаты доставки
+SENT = 'sent'
+BLOCKED = 'blocked'  # Пользователь заблокировал бота или удалил чат
+FAILED = 'failed'
+
+
+class RateLimitedSender:
+    """
+    Отправка сообщений с учетом лимитов Telegram: общее ведро токенов на бота
+    и отдельное на каждый чат. При 429 выдача токенов приостанавливается на retry_after
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = BROADCAST_RATE,
+        per_chat_rate: float = BROADCAST_PER_CHAT_RATE,
+        max_retries: int = 3,
+        retry_delay: float = 1.0
+    ):
+        self.bot = bot
+        self.bucket = TokenBucket(rate, capacity=rate)
+        self.chats = KeyedRateLimiter(per_chat_rate, capacity=1)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.retry_after_count = 0
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> str:
+        """Отправляет сообщение; возвращает SENT, BLOCKED или FAILED"""
+        for attempt in range(self.max_retries + 1):
+            await self.chats.acquire(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return SENT
+            except TelegramRetryAfter as e:
+                # Flood control действует на весь бот - притормаживаем всех отправителей
+                self.retry_after_count += 1
+                self.bucket.pause(e.retry_after)
+                logger.warning(f"Flood control, pausing sends for {e.retry_after}s")
+            except TelegramForbiddenError:
+                return BLOCKED
+            except TelegramBadRequest as e:
+                if 'chat not found' in str(e).lower():
+                    return BLOCKED
+                logger.error(f"Failed to send to {chat_id}: {e}")
+                return FAILED
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.warning(f"Temporary error sending to {chat_id} (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(self.retry_delay * (2 ** attempt))
+            except Exception as e:
+                logger.error(f"Failed to send to {chat_id}: {e}")
+                return FAILED
+
+        return FAILED
+
+
+# Один отправитель на бота: рассылки и напоминания делят общий лимит Telegram
+_senders: dict[int, RateLimitedSender] = {}
+
+
+def get_sender(bot: Bot) -> RateLimitedSender:
+    sender = _senders.get(id(bot))
+    if sender is None or sender.bot is not bot:
+        sender = _senders[id(bot)] = RateLimitedSender(bot)
+    return sender
@@ -0,0 +1,174 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InputMediaPhoto, Message
+from sqlalchemy import select
+
+from config.database import AsyncSessionLocal
+from config.settings import MEDIA_UPLOAD_RATE
+from core.database.models import Task, TaskMedia
+from core.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+# Ошибки Telegram, означающие, что сохраненный file_id больше не годится
+FILE_ID_ERRORS = ('wrong file identifier', 'wrong remote file', 'file reference expired')
+
+
+def is_file_id_error(error: TelegramBadRequest) -> bool:
+    message = error.message.lower()
+    return any(text in message for text in FILE_ID_ERRORS)
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def photo_file_id(message: Message) -> Optional[str]:
+    """file_id самого крупного размера фото из отправленного сообщения"""
+    return message.photo[-1].file_id if message and message.photo else None
+
+
+class MediaCache:
+    """
+    Кэш file_id картинок заданий. Первая отправка идет по URL (Telegram скачивает
+    картинку с нашего хоста), дальше - по file_id без скачивания. Соответствие
+    url -> file_id хранится в таблице task_media и целиком держится в памяти
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self.file_ids: dict[str, str] = {}
+        self.loaded = False
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        async with self._lock:
+            async with self.session_factory() as session:
+                rows = (await session.execute(select(TaskMedia.url, TaskMedia.file_id))).all()
+            self.file_ids = {url: file_id for url, file_id in rows}
+            self.loaded = True
+        logger.info(f"Media cache loaded: {len(self.file_ids)} file_ids")
+
+    async def ensure_loaded(self) -> None:
+        if self.loaded:
+            return
+        try:
+            await self.load()
+        except Exception as e:
+            # Без кэша картинки уходят по URL, как раньше
+            logger.error(f"Error loading media cache: {e}")
+
+    async def photo(self, url: str) -> str:
+        """То, что передается в photo=: file_id, если он известен, иначе URL"""
+        await self.ensure_loaded()
+        return self.file_ids.get(url, url)
+
+    async def remember(self, url: str, file_id: Optional[str]) -> None:
+        if not file_id or self.file_ids.get(url) == file_id:
+            return
+        self.file_ids[url] = file_id
+        try:
+            async with self.session_factory() as session:
+                await session.merge(TaskMedia(
+                    url_hash=url_hash(url),
+                    url=url,
+                    file_id=file_id,
+                    uploaded_at=datetime.datetime.utcnow()
+                ))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error saving file_id for {url}: {e}")
+
+    async def forget(self, url: str) -> None:
+        """Убирает file_id, который Telegram больше не принимает"""
+        if self.file_ids.pop(url, None) is None:
+            return
+        try:
+            async with self.session_factory() as session:
+                media = await session.get(TaskMedia, url_hash(url))
+                if media:
+                    await session.delete(media)
+                    await session.commit()
+        except Exception as e:
+            logger.error(f"Error removing file_id for {url}: {e}")
+
+    async def _send(self, url: str, send: Callable[[str], Awaitable[Message]]) -> Message:
+        """send(photo) по кэшу; устаревший file_id один раз заменяется отправкой по URL"""
+        photo = await self.photo(url)
+        try:
+            sent = await send(photo)
+        except TelegramBadRequest as e:
+            # Остальные ошибки (например, сообщение для правки удалено) к file_id не относятся
+            if photo == url or not is_file_id_error(e):
+                raise
+            logger.warning(f"Cached file_id for {url} rejected: {e}")
+            await self.forget(url)
+            sent = await send(url)
+        await self.remember(url, photo_file_id(sent))
+        return sent
+
+    async def answer_photo(self, message: Message, url: str, **kwargs) -> Message:
+        return await self._send(url, lambda photo: message.answer_photo(photo=photo, **kwargs))
+
+    async def edit_photo(self, bot: Bot, chat_id: int, message_id: int, url: str,
+                         caption: str = None, **kwargs) -> Message:
+        """Заменяет картинку и подпись в уже отправленном сообщении"""
+        return await self._send(url, lambda photo: bot.edit_message_media(
+            media=InputMediaPhoto(media=photo, caption=caption),
+            chat_id=chat_id,
+            message_id=message_id,
+            **kwargs
+        ))
+
+    async def preload(self, bot: Bot, chat_id: int, urls: list[str],
+                      rate: float = MEDIA_UPLOAD_RATE) -> tuple[int, int]:
+        """
+        Загружает в чат chat_id картинки, для которых еще нет file_id, и сразу
+        удаляет сообщения (file_id остается действительным). Возвращает
+        (загружено, ошибок)
+        """
+        await self.ensure_loaded()
+        bucket = TokenBucket(rate, capacity=1)
+        uploaded = failed = 0
+
+        for url in dict.fromkeys(urls):
+            if url in self.file_ids:
+                continue
+            while True:
+                await bucket.acquire()
+                try:
+                    sent = await bot.send_photo(chat_id, photo=url, disable_notification=True)
+                    await self.remember(url, photo_file_id(sent))
+                    uploaded += 1
+                    try:
+                        await bot.delete_message(chat_id, sent.message_id)
+                    except Exception as e:
+                        logger.warning(f"Could not delete preload message: {e}")
+                    break
+                except TelegramRetryAfter as e:
+                    bucket.pause(e.retry_after)
+                    logger.warning(f"Flood control during media preload, pausing for {e.retry_after}s")
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Error uploading {url}: {e}")
+                    break
+
+        logger.info(f"Media preload finished: {uploaded} uploaded, {failed} failed")
+        return uploaded, failed
+
+
+async def task_image_urls(session_factory=AsyncSessionLocal) -> list[str]:
+    """URL картинок всех заданий (task_content в каталоге не хранится)"""
+    async with session_factory() as session:
+        contents = (await session.execute(select(Task.task_content).order_by(Task.id))).scalars().all()
+    return [content['image'] for content in contents if content and content.get('image')]
+
+
+media_cache = MediaCache()
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+from config.database import AsyncSessionLocal
+from config.settings import LEADERBOARD_REFRESH_INTERVAL
+from core.database.models import User, UserProgress, UserStatus
+
+logger = logging.getLogger(__name__)
+
+# Администраторы и модераторы не участвуют в рейтингах
+RANK_EXCLUDED_STATUSES = [UserStatus.ADMIN, UserStatus.MODERATOR]
+
+
+class RankIndex:
+    """
+    Отсортированный массив ключей (-очки, user_id): ранг и позиция ищутся
+    бинарным поиском, обновление одного пользователя - удаление и вставка ключа
+    """
+
+    def __init__(self):
+        self._keys: list[tuple[int, int]] = []
+        self._points: dict[int, int] = {}
+
+    def rebuild(self, items) -> None:
+        """items - пары (user_id, очки)"""
+        self._points = {user_id: points or 0 for user_id, points in items}
+        self._keys = sorted((-points, user_id)
+                            for user_id, points in self._points.items())
+
+    def update(self, user_id: int, points: int) -> None:
+        points = points or 0
+        old = self._points.get(user_id)
+        if old == points:
+            return
+        if old is not None:
+            self._remove_key(old, user_id)
+        self._points[user_id] = points
+        insort(self._keys, (-points, user_id))
+
+    def remove(self, user_id: int) -> None:
+        old = self._points.pop(user_id, None)
+        if old is not None:
+            self._remove_key(old, user_id)
+
+    def _remove_key(self, points: int, user_id: int) -> None:
+        i = bisect_left(self._keys, (-points, user_id))
+        if i < len(self._keys) and self._keys[i] == (-points, user_id):
+            del self._keys[i]
+
+    def points(self, user_id: int) -> Optional[int]:
+        return self._points.get(user_id)
+
+    def rank(self, user_id: int) -> int:
+        """Как RANK(): 1 + число пользователей с большим количеством очков; 0 если нет в индексе"""
+        points = self._points.get(user_id)
+        if points is None:
+            return 0
+        return bisect_left(self._keys, (-points,)) + 1
+
+    def top(self, k: int) -> list[tuple[int, int]]:
+        """Первые k пар (user_id, очки)"""
+        return self.page(0, k)
+
+    def page(self, offset: int, limit: int) -> list[tuple[int, int]]:
+        """Пары (user_id, очки) на позициях offset..offset+limit"""
+        return [(user_id, -neg) for neg, user_id in self._keys[offset:offset + limit]]
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        for neg, user_id in self._keys:
+            yield user_id, -neg
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class Leaderboard:
+    """
+    Общий и недельный рейтинги в памяти процесса. Между перестроениями индекс
+    обновляется инкрементально ответами этого процесса; изменения других реплик
+    (и недельный сброс на ведущей) подхватываются перестроением раз в refresh_interval
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal,
+                 refresh_interval: float = LEADERBOARD_REFRESH_INTERVAL):
+        self.session_factory = session_factory
+        self.refresh_interval = refresh_interval
+        self.total = RankIndex()
+        self.weekly = RankIndex()
+        self.loaded = False
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def rebuild(self) -> None:
+        """Полностью перечитывает рейтинги из user_progress"""
+        async with self._lock:
+            async with self.session_factory() as session:
+                rows = (await session.execute(
+                    select(
+                        UserProgress.user_id,
+                        UserProgress.total_points,
+                        UserProgress.weekly_points
+                    )
+                    .join(User, User.id == UserProgress.user_id)
+                    .where(User.status.not_in(RANK_EXCLUDED_STATUSES))
+                )).all()
+
+            self.total.rebuild((row.user_id, row.total_points) for row in rows)
+            self.weekly.rebuild((row.user_id, row.weekly_points) for row in rows)
+            self.loaded = True
+
+        logger.info(f"Leaderboard rebuilt for {len(rows)} users")
+
+    async def ensure_loaded(self) -> None:
+        if not self.loaded:
+            await self.rebuild()
+
+    async def start(self) -> None:
+        """Запускает периодическое перестроение (на каждой реплике)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                # До следующей попытки работаем со старым индексом
+                logger.error(f"Leaderboard refresh failed: {e}")
+
+    def update(self, user_id: int, total_points: int, weekly_points: int, status=None) -> None:
+        """Вызывается после изменения очков пользователя"""
+        if status in RANK_EXCLUDED_STATUSES:
+            self.remove(user_id)
+            return
+        if status is None and self.total.points(user_id) is None:
+            # Статус неизвестен, а в рейтинге пользователя нет - не добавляем
+            return
+        self.total.update(user_id, total_points)
+        self.weekly.update(user_id, weekly_points)
+
+    def remove(self, user_id: int) -> None:
+        self.total.remove(user_id)
+        self.weekly.remove(user_id)
+
+    def reset_weekly(self) -> None:
+        self.weekly.rebuild((user_id, 0) for user_id, _ in self.total)
+
+    def global_rank(self, user_id: int) -> int:
+        return self.total.rank(user_id)
+
+    def weekly_rank(self, user_id: int) -> int:
+        return self.weekly.rank(user_id)
+
+    def top_total(self, k: int) -> list[tuple[int, int]]:
+        return self.total.top(k)
+
+    def top_weekly(self, k: int) -> list[tuple[int, int]]:
+        return self.weekly.top(k)
+
+
+# Единственный экземпляр на процесс
+leaderboard = Leaderboard()
@@ -1,51 +1,77 @@
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
 from aiogram import Bot
-from sqlalchemy import select, and_, or_, not_
+from sqlalchemy import select, update, or_, not_
 from sqlalchemy.ext.asyncio import AsyncSession
 from core.database.models import User, Reminder, UserStatus
 from config.database import AsyncSessionLocal
+from config.settings import MIN_REMINDER_GAP, REMINDER_CONCURRENCY
+from core.services.delivery import RateLimitedSender, get_sender, SENT, BLOCKED, FAILED
 
 logger = logging.getLogger(__name__)
 
 
 class ReminderService:
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, session_factory=AsyncSessionLocal, sender: RateLimitedSender = None):
         self.bot = bot
+        self.session_factory = session_factory
+        self.sender = sender or get_sender(bot)
         self.check_interval = 3600  # Интервал в секундах (1 час)
+        self.REMINDER_TOLERANCE = 1  # допуск ±1 час
         self.REMINDER_INTERVALS = {
             'promo': [24, 48, 72],  # часы (1, 2 - убрать)
             'inactive': [120, 168, 240, 504, 720]  # часы
         }
 
+    def candidates_stmt(self, interval: int, now: datetime):
+        """
+        Пользователи, у которых с последней активности прошло interval ± REMINDER_TOLERANCE
+        часов: диапазон по индексу last_interaction_time, без напоминаний в этом окне
+        """
+        tolerance = timedelta(hours=self.REMINDER_TOLERANCE)
+        # Проверка идет раз в час, а окно шире часа: без этого условия пользователь
+        # получил бы одно и то же напоминание дважды
+        reminded_before = now - max(2 * tolerance, timedelta(minutes=MIN_REMINDER_GAP))
+
+        return select(User.id, User.username).where(
+            User.last_interaction_time.between(
+                now - timedelta(hours=interval) - tolerance,
+                now - timedelta(hours=interval) + tolerance
+            ),
+            or_(
+                User.last_reminder_time.is_(None),
+                User.last_reminder_time < reminded_before
+            ),
+            User.blocked_at.is_(None),
+            # Члены перечисления, а не .value: колонка Enum хранит имена ('ADMIN')
+            not_(User.status.in_([
+                UserStatus.ADMIN,
+                UserStatus.MODERATOR,
+                UserStatus.TEACHER
+            ]))
+        )
+
     async def get_users_for_reminders(self, session: AsyncSession) -> Dict[str, List[Tuple[int, str]]]:
         """Возвращает пользователей для напоминаний, сгруппированных по типу"""
-        users = {'promo': [], 'inactive': []}
+        users = {reminder_type: [] for reminder_type in self.REMINDER_INTERVALS}
         current_time = datetime.utcnow()
-
-        stmt = select(User.id, User.username, User.last_interaction_time).where(
-            and_(
-                not_(User.status.in_([
-                    UserStatus.ADMIN.value,
-                    UserStatus.MODERATOR.value,
-                    UserStatus.TEACHER.value
-                ])),
-                User.last_interaction_time.is_not(None)
-            )
-        )
-
-        result = await session.execute(stmt)
-
-        for user_id, username, last_interaction in result.all():
-            inactive_hours = (
-                current_time - last_interaction).total_seconds() / 3600
-
-            for reminder_type, intervals in self.REMINDER_INTERVALS.items():
-                for interval in intervals:
-                    if abs(inactive_hours - interval) <= 1:  # допуск ±1 час
+        seen = set()
+
+        for reminder_type, intervals in self.REMINDER_INTERVALS.items():
+            for interval in intervals:
+                # Серверный курсор: строки читаются порциями, а не целиком в память
+                result = await session.stream(
+                    self.candidates_stmt(interval, current_time)
+                    .execution_options(yield_per=1000)
+                )
+                async for user_id, username in result:
+                    # Окна разных интервалов не пересекаются, но на границе
+                    # (ровно ± допуск) пользователь мог попасть в два
+                    if user_id not in seen:
+                        seen.add(user_id)
                         users[reminder_type].append((user_id, username))
-                        break
 
         return users
 
@@ -64,27 +90,77 @@ class ReminderService:
 
     async def send_reminders(self) -> Dict[str, int]:
         """Основной метод для отправки напоминаний"""
-        results = {'promo': 0, 'inactive': 0}
-
-        async with AsyncSessionLocal() as session:
+        # Кандидатов и тексты читаем коротким сеансом: соединение с БД
+        # возвращается в пул до начала сетевых запросов
+        async with self.session_factory() as session:
             users = await self.get_users_for_reminders(session)
+            texts = {
+                reminder_type: await self.get_reminder_text(session, reminder_type)
+                or self.get_default_text(reminder_type)
+                for reminder_type in users
+            }
+
+        outcomes = await self.deliver(users, texts)
+        await self.record_outcomes(outcomes)
 
-            for reminder_type, user_list in users.items():
-                text = await self.get_reminder_text(session, reminder_type) or self.get_default_text(reminder_type)
-
-                for user_id, username in user_list:
-                    try:
-                        await self.bot.send_message(
-                            chat_id=user_id,
-                            text=text
-                        )
-                        results[reminder_type] += 1
-                        logger.info(
-                            f"Sent {reminder_type} reminder to {username} ({user_id})")
-                    except Exception as e:
-                        logger.error(f"Failed to send to {user_id}: {e}")
-
-        return results
+        return {
+            reminder_type: len(by_outcome[SENT])
+            for reminder_type, by_outcome in outcomes.items()
+        }
+
+    async def deliver(
+        self,
+        users: Dict[str, List[Tuple[int, str]]],
+        texts: Dict[str, str]
+    ) -> Dict[str, Dict[str, List[int]]]:
+        """
+        Отправляет все типы напоминаний одновременно через общий ограничитель
+        скорости; внутри типа параллельно не больше REMINDER_CONCURRENCY[тип].
+        Возвращает {тип: {результат: [user_id, ...]}}
+        """
+        outcomes = {
+            reminder_type: {SENT: [], BLOCKED: [], FAILED: []}
+            for reminder_type in users
+        }
+
+        async def send(reminder_type: str, semaphore: asyncio.Semaphore, user_id: int, username: str):
+            async with semaphore:
+                outcome = await self.sender.send(user_id, texts[reminder_type])
+            outcomes[reminder_type][outcome].append(user_id)
+            if outcome == SENT:
+                logger.debug(f"Sent {reminder_type} reminder to {username} ({user_id})")
+
+        jobs = []
+        for reminder_type, user_list in users.items():
+            semaphore = asyncio.Semaphore(REMINDER_CONCURRENCY.get(reminder_type, 10))
+            jobs += [send(reminder_type, semaphore, user_id, username)
+                     for user_id, username in user_list]
+        await asyncio.gather(*jobs)
+
+        for reminder_type, by_outcome in outcomes.items():
+            logger.info(
+                f"{reminder_type} reminders: sent={len(by_outcome[SENT])}, "
+                f"blocked={len(by_outcome[BLOCKED])}, failed={len(by_outcome[FAILED])}")
+        return outcomes
+
+    async def record_outcomes(self, outcomes: Dict[str, Dict[str, List[int]]], chunk_size: int = 1000):
+        """Пакетно сохраняет last_reminder_time отправленным и blocked_at заблокировавшим бота"""
+        now = datetime.utcnow()
+        sent = [user_id for by_outcome in outcomes.values() for user_id in by_outcome[SENT]]
+        blocked = [user_id for by_outcome in outcomes.values() for user_id in by_outcome[BLOCKED]]
+
+        try:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    for column, user_ids in (('last_reminder_time', sent), ('blocked_at', blocked)):
+                        for i in range(0, len(user_ids), chunk_size):
+                            await session.execute(
+                                update(User)
+                                .where(User.id.in_(user_ids[i:i + chunk_size]))
+                                .values({column: now})
+                            )
+        except Exception as e:
+            logger.error(f"Error recording reminder outcomes: {e}")
 
     @staticmethod
     def get_default_text(reminder_type: str) -> str:
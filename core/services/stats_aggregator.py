@@ -0,0 +1,475 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import select
+
+from config.database import AsyncSessionLocal
+from config.settings import (
+    STATS_FLUSH_INTERVAL_MS,
+    STATS_FLUSH_MAX_EVENTS,
+    STATS_FLUSH_MAX_BATCH,
+    STATS_FLUSH_RETRY_BACKOFF_MS,
+    STATS_FLUSH_MAX_BACKOFF_MS,
+    STATS_FLUSH_MAX_RETRIES,
+    STATS_JOURNAL_PATH,
+    STATS_JOURNAL_FSYNC
+)
+from core.database.models import User, UserStat, UserProgress, Task
+from core.services.achievement_service import check_and_unlock_achievements
+from core.services.rank_index import leaderboard
+from core.services.stats_service import (
+    apply_answer,
+    calculate_points,
+    invalidate_user_stats
+)
+from core.services.subtopic_stats import record_subtopic_counts
+from core.services.task_catalog import task_catalog
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AnswerEvent:
+    """Один ответ пользователя, ожидающий записи в БД"""
+    seq: int
+    user_id: int
+    task_id: int
+    is_correct: bool
+    answered_at: datetime
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data['answered_at'] = self.answered_at.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'AnswerEvent':
+        return cls(
+            seq=int(data['seq']),
+            user_id=int(data['user_id']),
+            task_id=int(data['task_id']),
+            is_correct=bool(data['is_correct']),
+            answered_at=datetime.fromisoformat(data['answered_at'])
+        )
+
+
+class StatsJournal:
+    """
+    Локальный журнал (JSON Lines) с ответами, еще не записанными в БД.
+    После успешной записи пачки добавляется отметка {"flushed": seq};
+    когда записано всё, файл обрезается. Ответы, которые не удалось записать,
+    откладываются в <path>.failed. Журналом владеет один процесс (блокировка <path>.lock)
+    """
+
+    def __init__(self, path: str = STATS_JOURNAL_PATH, fsync: bool = STATS_JOURNAL_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self._last_seq = 0
+        self._file = None
+        self._lock_file = None
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def _open(self):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def _write(self, line: str) -> None:
+        file = self._open()
+        file.write(line + '\n')
+        file.flush()
+        if self.fsync:
+            os.fsync(file.fileno())
+
+    def append(self, event: AnswerEvent) -> None:
+        self._write(event.to_json())
+        self._last_seq = max(self._last_seq, event.seq)
+
+    def mark_flushed(self, seq: int) -> None:
+        if seq >= self._last_seq:
+            # Всё записано - журнал больше не нужен
+            self.close()
+            open(self.path, 'w').close()
+        else:
+            self._write(json.dumps({'flushed': seq}))
+
+    def replay(self) -> list[AnswerEvent]:
+        """События после последней отметки flushed (повреждённые строки пропускаются)"""
+        if not os.path.exists(self.path):
+            return []
+
+        events, flushed = [], 0
+        with open(self.path, encoding='utf-8') as file:
+            for line_number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                    if 'flushed' in data:
+                        flushed = max(flushed, int(data['flushed']))
+                    else:
+                        events.append(AnswerEvent.from_dict(data))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping broken journal line {line_number}: {e}")
+
+        pending = [event for event in events if event.seq > flushed]
+        self._last_seq = max((event.seq for event in events), default=0)
+        return pending
+
+    def dead_letter(self, events: list[AnswerEvent]) -> None:
+        """Откладывает ответы, запись которых не удалась, для ручного разбора"""
+        with open(self.path + '.failed', 'a', encoding='utf-8') as file:
+            for event in events:
+                file.write(event.to_json() + '\n')
+
+    def acquire(self) -> None:
+        """Захватывает журнал; если им уже владеет другой процесс - RuntimeError"""
+        if self._lock_file is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(self.path + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(f"Stats journal {self.path} is used by another process")
+        self._lock_file = lock_file
+
+    def release(self) -> None:
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@dataclass
+class AggregatorMetrics:
+    events_enqueued: int = 0
+    events_flushed: int = 0
+    events_replayed: int = 0
+    flushes: int = 0
+    failed_flushes: int = 0
+    events_dead_lettered: int = 0
+    last_flush_ms: float = 0.0
+    max_flush_ms: float = 0.0
+    total_flush_ms: float = 0.0
+
+    @property
+    def avg_flush_ms(self) -> float:
+        return self.total_flush_ms / self.flushes if self.flushes else 0.0
+
+
+class StatsAggregator:
+    """
+    Отложенная запись статистики ответов.
+    Ответы копятся в очереди и журнале, фоновая задача раз в flush_interval
+    (или при max_events событиях) применяет их пачкой: по одному разу блокирует
+    строки каждого пользователя, объединяет счетчики по подтемам в один upsert
+    и проверяет достижения. Доставка «хотя бы один раз»: при падении между
+    коммитом и отметкой в журнале пачка будет применена повторно.
+    За раз пишется не больше max_batch событий; после неудачи следующая попытка
+    откладывается (экспоненциально), а после max_retries неудач подряд пачка
+    пишется по пользователям и ответы тех, на ком запись падает, откладываются
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        journal: Optional[StatsJournal] = None,
+        flush_interval_ms: int = STATS_FLUSH_INTERVAL_MS,
+        max_events: int = STATS_FLUSH_MAX_EVENTS,
+        notify: Optional[Callable[[int, list], Awaitable[None]]] = None,
+        max_batch: int = STATS_FLUSH_MAX_BATCH,
+        retry_backoff_ms: int = STATS_FLUSH_RETRY_BACKOFF_MS,
+        max_backoff_ms: int = STATS_FLUSH_MAX_BACKOFF_MS,
+        max_retries: int = STATS_FLUSH_MAX_RETRIES
+    ):
+        self.session_factory = session_factory
+        self.journal = journal or StatsJournal()
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_events = max_events
+        self.max_batch = max_batch
+        self.retry_backoff = retry_backoff_ms / 1000
+        self.max_backoff = max_backoff_ms / 1000
+        self.max_retries = max_retries
+        self.notify = notify  # Уведомление о достижениях, открытых при записи
+        self.metrics = AggregatorMetrics()
+
+        self.running = False
+        self._pending: list[AnswerEvent] = []
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._failures = 0  # Неудачных попыток записи подряд
+        self._retry_at = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    async def start(self) -> None:
+        """Проигрывает журнал и запускает фоновую запись"""
+        self.journal.acquire()
+        replayed = self.journal.replay()
+        if replayed:
+            logger.info(f"Replaying {len(replayed)} answers from stats journal")
+            self._pending = replayed + self._pending
+            self.metrics.events_replayed += len(replayed)
+        self._seq = max(self._seq, self.journal.last_seq)
+
+        self.running = True
+        self._task = asyncio.create_task(self._run())
+        logger.info("Stats write-behind started")
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу и записывает остаток очереди"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self.journal.close()
+        self.journal.release()
+        logger.info("Stats write-behind stopped")
+
+    def enqueue(self, user_id: int, task_id: int, is_correct: bool, answered_at: datetime = None) -> AnswerEvent:
+        self._seq += 1
+        event = AnswerEvent(
+            seq=self._seq,
+            user_id=user_id,
+            task_id=task_id,
+            is_correct=is_correct,
+            answered_at=answered_at or datetime.utcnow()
+        )
+        # Сначала журнал, потом очередь: принятый ответ не теряется при падении
+        self.journal.append(event)
+        self._pending.append(event)
+        self.metrics.events_enqueued += 1
+
+        if len(self._pending) >= self.max_events:
+            self._wakeup.set()
+        return event
+
+    async def _run(self) -> None:
+        while True:
+            retry_in = self._retry_at - time.monotonic()
+            if retry_in > 0:
+                # После неудачной записи ждем паузу, даже если очередь растет
+                await asyncio.sleep(retry_in)
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _backoff(self) -> None:
+        self._failures += 1
+        delay = min(self.max_backoff, self.retry_backoff * 2 ** (self._failures - 1))
+        self._retry_at = time.monotonic() + delay
+
+    async def flush(self) -> int:
+        """Записывает накопленные ответы; возвращает количество записанных событий"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+
+            # Берем начало очереди: всё до batch[-1].seq будет записано или отложено
+            batch = self._pending[:self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            started = time.perf_counter()
+            try:
+                unlocked = await self._write(batch)
+                written = len(batch)
+            except Exception as e:
+                self.metrics.failed_flushes += 1
+                logger.error(f"Stats flush of {len(batch)} answers failed: {e}", exc_info=True)
+                result = None
+                if self._failures + 1 >= self.max_retries:
+                    result = await self._write_per_user(batch)
+                if result is None:
+                    # Возвращаем пачку в начало очереди, журнал остается нетронутым
+                    self._pending = batch + self._pending
+                    self._backoff()
+                    return 0
+                unlocked, written = result
+
+            self._failures = 0
+            self._retry_at = 0.0
+            self.journal.mark_flushed(batch[-1].seq)
+
+            elapsed = (time.perf_counter() - started) * 1000
+            self.metrics.flushes += 1
+            self.metrics.events_flushed += written
+            self.metrics.last_flush_ms = elapsed
+            self.metrics.max_flush_ms = max(self.metrics.max_flush_ms, elapsed)
+            self.metrics.total_flush_ms += elapsed
+
+        if self.notify:
+            for user_id, achievements in unlocked.items():
+                try:
+                    await self.notify(user_id, achievements)
+                except Exception as e:
+                    logger.error(f"Error notifying user {user_id} about achievements: {e}")
+
+        return written
+
+    async def _write_per_user(self, batch: list[AnswerEvent]) -> Optional[tuple[dict[int, list], int]]:
+        """
+        Пишет пачку отдельными транзакциями по пользователям. Ответы
+        пользователей с ошибкой уходят в journal.dead_letter, если только
+        БД не недоступна целиком - тогда ничего не откладывается и возвращается None
+        """
+        by_user: dict[int, list[AnswerEvent]] = {}
+        for event in batch:
+            by_user.setdefault(event.user_id, []).append(event)
+
+        unlocked, failed = {}, {}
+        for user_id, events in by_user.items():
+            try:
+                unlocked.update(await self._write(events))
+            except Exception as e:
+                failed[user_id] = events
+                logger.error(f"Stats write for user {user_id} failed: {e}")
+
+        if len(failed) == len(by_user) and not await self._database_available():
+            return None
+
+        dead = [event for events in failed.values() for event in events]
+        if dead:
+            self.journal.dead_letter(dead)
+            self.metrics.events_dead_lettered += len(dead)
+            logger.error(f"Dead-lettered {len(dead)} answers of users {sorted(failed)}")
+        return unlocked, len(batch) - len(dead)
+
+    async def _database_available(self) -> bool:
+        try:
+            async with self.session_factory() as session:
+                await session.execute(select(1))
+            return True
+        except Exception as e:
+            logger.error(f"Stats database is unavailable: {e}")
+            return False
+
+    async def _write(self, batch: list[AnswerEvent]) -> dict[int, list]:
+        """Применяет пачку в одной транзакции; возвращает {user_id: открытые достижения}"""
+        by_user: dict[int, list[AnswerEvent]] = {}
+        for event in batch:
+            by_user.setdefault(event.user_id, []).append(event)
+        user_ids = sorted(by_user)
+
+        unlocked = {}
+        async with self.session_factory() as session:
+            async with session.begin():
+                users = {u.id: u for u in (await session.execute(
+                    select(User).where(User.id.in_(user_ids))
+                )).scalars()}
+                stats = {s.user_id: s for s in (await session.execute(
+                    select(UserStat).where(UserStat.user_id.in_(user_ids)).with_for_update()
+                )).scalars()}
+                progress = {p.user_id: p for p in (await session.execute(
+                    select(UserProgress).where(UserProgress.user_id.in_(user_ids)).with_for_update()
+                )).scalars()}
+
+                subtopic_counts: dict[tuple[int, int], list[int]] = {}
+                answered_tasks: dict[int, dict] = {}
+                changed_metrics: dict[int, frozenset] = defaultdict(frozenset)
+
+                for user_id in user_ids:
+                    user = users.get(user_id)
+                    if user is None:
+                        logger.warning(f"Dropping {len(by_user[user_id])} answers of unknown user {user_id}")
+                        continue
+
+                    user_stat = stats.get(user_id)
+                    if user_stat is None:
+                        user_stat = UserStat(
+                            user_id=user_id, correct_answers=0, total_attempts=0, percentage=0.0)
+                        session.add(user_stat)
+                    user_progress = progress.get(user_id)
+                    if user_progress is None:
+                        user_progress = progress[user_id] = UserProgress(
+                            user_id=user_id, daily_record=0, weekly_points=0,
+                            total_points=0, current_streak=0)
+                        session.add(user_progress)
+
+                    tasks = answered_tasks[user_id] = {}
+                    for event in by_user[user_id]:
+                        task = task_catalog.get(event.task_id) or await session.get(Task, event.task_id)
+                        if task is None:
+                            continue
+
+                        points = calculate_points(task.complexity, user.status, event.is_correct)
+                        changed_metrics[user_id] |= apply_answer(
+                            user_stat, user_progress, event.is_correct, points,
+                            today=event.answered_at.date())
+
+                        if task.subtopic_id:
+                            counts = subtopic_counts.setdefault((user_id, task.subtopic_id), [0, 0])
+                            counts[0 if event.is_correct else 1] += 1
+                        tasks[task.id] = (task, event.is_correct)
+
+                    last_seen = max(event.answered_at for event in by_user[user_id])
+                    if user.last_interaction_time is None or user.last_interaction_time < last_seen:
+                        user.last_interaction_time = last_seen
+
+                await record_subtopic_counts(session, [
+                    {'user_id': user_id, 'subtopic_id': subtopic_id,
+                     'correct': correct, 'wrong': wrong}
+                    for (user_id, subtopic_id), (correct, wrong) in subtopic_counts.items()
+                ])
+                await session.flush()
+
+                # Правила с условием на тему проверяем по каждому решенному заданию
+                for user_id, tasks in answered_tasks.items():
+                    for task, is_correct in tasks.values():
+                        achievements = await check_and_unlock_achievements(
+                            session, user_id, is_correct, task_id=task.id, task=task,
+                            changed_metrics=changed_metrics[user_id])
+                        if achievements:
+                            unlocked.setdefault(user_id, []).extend(achievements)
+
+                # Итоговые очки запоминаем до коммита, рейтинг обновляем после него
+                scores = [
+                    (user_id, progress[user_id].total_points,
+                     progress[user_id].weekly_points, users[user_id].status)
+                    for user_id in answered_tasks
+                ]
+
+        for user_id, total_points, weekly_points, status in scores:
+            leaderboard.update(user_id, total_points, weekly_points, status)
+            invalidate_user_stats(user_id)
+
+        return unlocked
+
+
+# Единственный экземпляр на процесс (запускается при STATS_WRITE_BEHIND)
+stats_aggregator = StatsAggregator()
@@ -1,82 +1,135 @@
-from datetime import datetime, timedelta
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
 from sqlalchemy import and_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, update, inspect
+from sqlalchemy import select, func, update, insert, inspect, literal
 from core.database.models import (
     UserStat,
     UserProgress,
     Task,
-    WeeklyXP,  # Не работает
+    WeeklyXP,
     Subtopic,
     User,
-    UserAchievement,
-    Achievement,
     Complexity,
     UserStatus
 )
-from sqlalchemy.orm.attributes import flag_modified
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, aliased
+from core.database.hooks import after_commit
+from config.settings import STATS_CACHE_TTL, SCHEDULER_TIMEZONE
+from core.services.task_catalog import task_catalog, CatalogSubtopic
+from core.services.rank_index import leaderboard, RANK_EXCLUDED_STATUSES
+from core.services.achievement_rules import (
+    achievement_rules,
+    unlocked_achievements,
+    count_unlocked
+)
+from core.services.subtopic_stats import record_subtopic_answer, best_and_worst_columns
+from core.utils.cache import LRUCache
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+PREMIUM_STATUSES = [UserStatus.SUB, UserStatus.PRO_SUB]
+STANDARD_STATUSES = [UserStatus.NO_SUB, UserStatus.ADMIN,
+                     UserStatus.MODERATOR, UserStatus.TEACHER]
+
+# Сложность -> (очки премиум, очки стандарт, штраф за ошибку)
+POINTS_BY_COMPLEXITY = {
+    Complexity.BASIC: (2, 1, -1),
+    Complexity.ADVANCED: (6, 4, -2),
+    Complexity.HIGH: (20, 15, -6),
+}
+
+
+def calculate_points(complexity: Complexity, status: UserStatus, is_correct: bool) -> int:
+    """Очки за ответ в зависимости от сложности задания и статуса пользователя"""
+    if complexity not in POINTS_BY_COMPLEXITY:
+        return 0
+
+    premium, standard, penalty = POINTS_BY_COMPLEXITY[complexity]
+    if not is_correct:
+        return penalty
+    if status in PREMIUM_STATUSES:
+        return premium
+    if status in STANDARD_STATUSES:
+        return standard
+    return 0
+
+
+def apply_answer(user_stat: UserStat, user_progress: UserProgress, is_correct: bool, points: int,
+                 today=None) -> frozenset[str]:
+    """
+    Применяет один ответ к загруженным строкам статистики и прогресса.
+    Возвращает показатели достижений (METRICS), которые при этом изменились
+    """
+    today = today or datetime.utcnow().date()
+    percentage = user_stat.percentage
+    total_points = user_progress.total_points
+    streak = user_progress.current_streak
+
+    # Обновляем статистику
+    user_stat.total_attempts = (user_stat.total_attempts or 0) + 1
+    if is_correct:
+        user_stat.correct_answers = (user_stat.correct_answers or 0) + 1
+    user_stat.percentage = (
+        (user_stat.correct_answers or 0) / user_stat.total_attempts) * 100
+
+    # Обновляем прогресс (защита от отрицательных значений)
+    user_progress.total_points = max(0, (user_progress.total_points or 0) + points)
+    user_progress.weekly_points = max(0, (user_progress.weekly_points or 0) + points)
+
+    # Вычисляем current_streak
+    last_active = user_progress.last_active_day
+    if last_active == today - timedelta(days=1):
+        # Пользователь активен второй день подряд
+        user_progress.current_streak = (user_progress.current_streak or 0) + 1
+    elif last_active is None or last_active < today:
+        # Перерыв - сбрасываем streak
+        user_progress.current_streak = 1
+    # Уже активен сегодня (или событие старше последней активности) - streak не меняем
+
+    if last_active is None or last_active < today:
+        user_progress.last_active_day = today
+    user_progress.daily_record = (user_progress.daily_record or 0) + 1
+
+    changed = {'solved_tasks'}
+    if is_correct:
+        changed.add('correct_answers')
+    if user_stat.percentage != percentage:
+        changed.add('correct_percentage')
+    if user_progress.total_points != total_points:
+        changed.add('total_points')
+    if user_progress.current_streak != streak:
+        changed.add('daily_streak')
+    return frozenset(changed)
+
+
 async def update_user_stats(
     session: AsyncSession,
     user_id: int,
     task_id: int,
-    is_correct: bool
-) -> bool:
-    """Обновляет статистику с учетом всех требований"""
+    is_correct: bool,
+    task=None
+) -> frozenset[str]:
+    """
+    Обновляет статистику с учетом всех требований.
+    task можно передать уже загруженным (Task или CatalogTask), чтобы не читать его повторно.
+    Возвращает изменившиеся показатели достижений (пустое множество при ошибке)
+    """
     try:
         # Получаем необходимые данные
-        task = await session.get(Task, task_id)
+        if task is None:
+            task = await session.get(Task, task_id)
         user = await session.get(User, user_id)
 
         if not task or not user:
             logger.error("Task or user not found")
-            return False
-
-        # Определяем количество очков
-        premium_statuses = [UserStatus.SUB, UserStatus.PRO_SUB]
-        standard_statuses = [UserStatus.NO_SUB, UserStatus.ADMIN,
-                             UserStatus.MODERATOR, UserStatus.TEACHER]
-
-        if task.complexity == Complexity.BASIC:
-            if is_correct:
-                if user.status in premium_statuses:
-                    points = 2
-                elif user.status in standard_statuses:
-                    points = 1
-                else:
-                    points = 0
-            else:
-                points = -1
-
-        elif task.complexity == Complexity.ADVANCED:
-            if is_correct:
-                if user.status in premium_statuses:
-                    points = 6
-                elif user.status in standard_statuses:
-                    points = 4
-                else:
-                    points = 0
-            else:
-                points = -2
-
-        elif task.complexity == Complexity.HIGH:
-            if is_correct:
-                if user.status in premium_statuses:
-                    points = 20
-                elif user.status in standard_statuses:
-                    points = 15
-                else:
-                    points = 0
-            else:
-                points = -6
+            return frozenset()
 
-        else:
-            points = 0
+        points = calculate_points(task.complexity, user.status, is_correct)
 
         # Получаем или создаем записи статистики
         user_stat = await session.get(UserStat, user_id, with_for_update=True) or \
@@ -85,51 +138,19 @@ async def update_user_stats(
         user_progress = await session.get(UserProgress, user_id, with_for_update=True) or \
             UserProgress(user_id=user_id)
 
-        # Обновляем статистику
-        user_stat.total_attempts += 1
-        if is_correct:
-            user_stat.correct_answers += 1
-        user_stat.percentage = (
-            user_stat.correct_answers / user_stat.total_attempts) * 100
+        changed_metrics = apply_answer(user_stat, user_progress, is_correct, points)
+        new_total = user_progress.total_points
+        new_weekly = user_progress.weekly_points
+        current_streak = user_progress.current_streak
 
-        # Обновляем прогресс (защита от отрицательных значений)
-        new_total = max(0, user_progress.total_points + points)
-        new_weekly = max(0, user_progress.weekly_points + points)
+        # Инкрементально обновляем индекс рейтинга, когда очки будут закоммичены
+        status = user.status
+        after_commit(session, lambda: leaderboard.update(user_id, new_total, new_weekly, status))
 
-        # Вычисляем current_streak
-        today = datetime.utcnow().date()
-        last_active = user_progress.last_active_day
-
-        if last_active == today - timedelta(days=1):
-            # Пользователь активен второй день подряд
-            current_streak = user_progress.current_streak + 1
-        elif last_active == today:
-            # Уже активен сегодня - не увеличиваем streak
-            current_streak = user_progress.current_streak
-        else:
-            # Перерыв - сбрасываем streak
-            current_streak = 1
-
-        # Применяем обновления
-        user_progress.total_points = new_total
-        user_progress.weekly_points = new_weekly
-        user_progress.current_streak = current_streak
-        user_progress.last_active_day = today
-        user_progress.daily_record += 1
-
-        # Обновляем статистику по подтеме
+        # Счетчик по подтеме - отдельная строка, увеличивается атомарно
         if task.subtopic_id:
-            subtopic_key = str(task.subtopic_id)
-            if subtopic_key not in user_stat.subtopics_stats:
-                user_stat.subtopics_stats[subtopic_key] = {
-                    "correct": 0, "wrong": 0}
-
-            if is_correct:
-                user_stat.subtopics_stats[subtopic_key]["correct"] += 1
-            else:
-                user_stat.subtopics_stats[subtopic_key]["wrong"] += 1
-
-            flag_modified(user_stat, "subtopics_stats")
+            await record_subtopic_answer(
+                session, user_id, task.subtopic_id, is_correct)
 
         # Гарантируем сохранение объектов
         session.add_all([user_stat, user_progress])
@@ -146,12 +167,12 @@ async def update_user_stats(
             f"streak={current_streak} days"
         )
 
-        return True
+        return changed_metrics
 
     except Exception as e:
         logger.error(f"Error updating stats: {e}", exc_info=True)
         await session.rollback()
-        return False
+        return frozenset()
 
 
 def calculate_percentage(user_stat: UserStat) -> float:
@@ -161,20 +182,6 @@ def calculate_percentage(user_stat: UserStat) -> float:
     return (user_stat.correct_answers / user_stat.total_attempts) * 100
 
 
-def update_subtopic_stats(user_stat: UserStat, subtopic_id: int, is_correct: bool):
-    """Обновляем статистику по подтеме"""
-    subtopic_key = str(subtopic_id)
-    if subtopic_key not in user_stat.subtopics_stats:
-        user_stat.subtopics_stats[subtopic_key] = {"correct": 0, "wrong": 0}
-
-    if is_correct:
-        user_stat.subtopics_stats[subtopic_key]["correct"] += 1
-    else:
-        user_stat.subtopics_stats[subtopic_key]["wrong"] += 1
-
-    flag_modified(user_stat, "subtopics_stats")
-
-
 def update_progress(user_progress: UserProgress, is_correct: bool):
     """Обновляем прогресс пользователя"""
     points = 2 if is_correct else 1
@@ -234,99 +241,137 @@ async def calculate_user_level(total_xp: int) -> tuple[int, str]:
     return level, title
 
 
-async def get_user_stats(session: AsyncSession, user_id: int) -> dict:
-    """Получает полную статистику пользователя"""
+@dataclass(frozen=True)
+class UserStatsView:
+    """Данные экрана «📊 Статистика»"""
+    total_xp: int
+    weekly_xp: int
+    level: tuple[int, str]
+    streak: int
+    total_tasks: int
+    accuracy: float
+    best_topic: Optional[CatalogSubtopic]
+    best_topic_accuracy: float
+    worst_topic: Optional[CatalogSubtopic]
+    worst_topic_accuracy: float
+    global_rank: int
+    weekly_rank: int
+    achievements_unlocked: int
+    achievements_total: int
+
+
+# user_id -> UserStatsView, сбрасывается при ответе пользователя на задание
+_stats_cache = LRUCache(maxsize=10000, ttl=STATS_CACHE_TTL)
+
+
+def invalidate_user_stats(user_id: int) -> None:
+    """Сбрасывает закэшированную статистику пользователя"""
+    _stats_cache.pop(user_id)
+
+
+def _rank_subquery(me, column_name: str):
+    """1 + количество участников рейтинга, у которых очков больше (то же, что RANK())"""
+    other = aliased(UserProgress)
+    other_user = aliased(User)
+    return (
+        select(func.count() + 1)
+        .select_from(other)
+        .join(other_user, other_user.id == other.user_id)
+        .where(and_(
+            other_user.status.not_in(RANK_EXCLUDED_STATUSES),
+            getattr(other, column_name) > getattr(me, column_name)
+        ))
+        .correlate(me)
+        .scalar_subquery()
+    )
+
+
+def _user_stats_stmt(user_id: int, with_ranks: bool = True):
+    """Вся статистика пользователя одним запросом (ранги - если нет индекса рейтинга)"""
+    me = aliased(UserProgress)
+
+    columns = [UserStat, me, User.status, *best_and_worst_columns(user_id)]
+    if with_ranks:
+        columns += [
+            _rank_subquery(me, 'total_points').label('global_rank'),
+            _rank_subquery(me, 'weekly_points').label('weekly_rank')
+        ]
+
+    return (
+        select(*columns)
+        .select_from(UserStat)
+        .join(me, me.user_id == UserStat.user_id)
+        .join(User, User.id == UserStat.user_id)
+        .where(UserStat.user_id == user_id)
+    )
+
+
+async def get_user_stats(session: AsyncSession, user_id: int, use_cache: bool = True) -> Optional[UserStatsView]:
+    """
+    Получает полную статистику пользователя (один запрос к БД + короткий кэш).
+    Достижения берутся из общих кэшей правил и разблокированных достижений
+    """
+    if use_cache:
+        cached = _stats_cache.get(user_id)
+        if cached is not None:
+            return cached
+
     try:
-        async with session.begin():
-            # Получаем основную статистику
-            user_stat = await session.get(UserStat, user_id)
-            user_progress = await session.get(UserProgress, user_id)
-
-            if not user_stat or not user_progress:
-                logger.warning(
-                    f"User stats or progress not found for user {user_id}")
-                return None
-
-            # Получаем XP за неделю
-            week_start = datetime.utcnow().date() - timedelta(days=datetime.utcnow().weekday())
-            weekly_xp = await session.scalar(
-                select(func.sum(WeeklyXP.xp_earned))
-                .where(and_(
-                    WeeklyXP.user_id == user_id,
-                    WeeklyXP.week_start_date == week_start
-                ))
-            ) or 0
-
-            # Вычисляем уровень и титул
-            level, title = await calculate_user_level(user_progress.total_points)
-
-            # Находим лучшую и худшую тему
-            best_topic = worst_topic = None
-            best_topic_accuracy = worst_topic_accuracy = 0
-
-            if user_stat.subtopics_stats:
-                try:
-                    sorted_topics = sorted(
-                        [(k, v) for k, v in user_stat.subtopics_stats.items()
-                         if isinstance(v, dict)],
-                        key=lambda x: (x[1].get('correct', 0) / (x[1].get('correct', 0) + x[1].get('wrong', 1))
-                                       if (x[1].get('correct', 0) + x[1].get('wrong', 0)) > 0 else 0),
-                        reverse=True
-                    )
-
-                    if sorted_topics:
-                        best_id, best_stats = sorted_topics[0]
-                        worst_id, worst_stats = sorted_topics[-1]
-
-                        best_topic = await session.get(Subtopic, int(best_id))
-                        worst_topic = await session.get(Subtopic, int(worst_id))
-
-                        best_total = best_stats.get(
-                            'correct', 0) + best_stats.get('wrong', 0)
-                        best_topic_accuracy = (best_stats.get(
-                            'correct', 0) / best_total) * 100 if best_total > 0 else 0
-
-                        worst_total = worst_stats.get(
-                            'correct', 0) + worst_stats.get('wrong', 0)
-                        worst_topic_accuracy = (worst_stats.get(
-                            'correct', 0) / worst_total) * 100 if worst_total > 0 else 0
-                except Exception as e:
-                    logger.error(f"Error processing subtopics stats: {e}")
-
-            # Получаем рейтинги
-            global_rank = await get_global_rank(session, user_id) or 0
-            weekly_rank = await get_weekly_rank(session, user_id) or 0
-
-            # Получаем информацию о достижениях
-            achievements_unlocked = await session.scalar(
-                select(func.count(UserAchievement.achievement_id))
-                .where(and_(
-                    UserAchievement.user_id == user_id,
-                    UserAchievement.unlocked_at.is_not(None)
-                ))
-            ) or 0
-
-            achievements_total = await session.scalar(select(func.count(Achievement.id))) or 0
-
-            stats_data = {
-                "total_xp": user_progress.total_points or 0,
-                "weekly_xp": user_progress.weekly_points,
-                "level": (level or 0, title or "Новичок"),
-                "streak": user_progress.current_streak or 0,
-                "total_tasks": user_stat.total_attempts or 0,
-                "accuracy": user_stat.percentage or 0,
-                "best_topic": best_topic,
-                "best_topic_accuracy": best_topic_accuracy,
-                "worst_topic": worst_topic,
-                "worst_topic_accuracy": worst_topic_accuracy,
-                "global_rank": global_rank,
-                "weekly_rank": weekly_rank,
-                "achievements_unlocked": achievements_unlocked,
-                "achievements_total": achievements_total
-            }
-
-            logger.info(f"Successfully collected stats for user {user_id}")
-            return stats_data
+        # Ранги берем из индекса рейтинга в памяти, если он загружен
+        use_leaderboard = leaderboard.loaded
+        row = (await session.execute(
+            _user_stats_stmt(user_id, with_ranks=not use_leaderboard)
+        )).one_or_none()
+
+        if row is None:
+            logger.warning(
+                f"User stats or progress not found for user {user_id}")
+            return None
+
+        user_stat, user_progress = row[0], row[1]
+
+        await achievement_rules.ensure_loaded(session)
+        unlocked = await unlocked_achievements.get(session, user_id)
+
+        is_ranked = row.status not in RANK_EXCLUDED_STATUSES
+        if use_leaderboard:
+            global_rank = leaderboard.global_rank(user_id)
+            weekly_rank = leaderboard.weekly_rank(user_id)
+        else:
+            global_rank, weekly_rank = row.global_rank, row.weekly_rank
+
+        # Вычисляем уровень и титул
+        level, title = await calculate_user_level(user_progress.total_points or 0)
+
+        # Лучшая и худшая тема (посчитаны в том же запросе, названия - из каталога)
+        best_topic = worst_topic = None
+        best_topic_accuracy = worst_topic_accuracy = 0
+        if row.best_subtopic_id is not None:
+            best_topic = task_catalog.get_subtopic(row.best_subtopic_id)
+            best_topic_accuracy = float(row.best_subtopic_accuracy or 0)
+            worst_topic = task_catalog.get_subtopic(row.worst_subtopic_id)
+            worst_topic_accuracy = float(row.worst_subtopic_accuracy or 0)
+
+        stats = UserStatsView(
+            total_xp=user_progress.total_points or 0,
+            weekly_xp=user_progress.weekly_points or 0,
+            level=(level or 0, title or "Новичок"),
+            streak=user_progress.current_streak or 0,
+            total_tasks=user_stat.total_attempts or 0,
+            accuracy=user_stat.percentage or 0,
+            best_topic=best_topic,
+            best_topic_accuracy=best_topic_accuracy,
+            worst_topic=worst_topic,
+            worst_topic_accuracy=worst_topic_accuracy,
+            global_rank=global_rank if is_ranked else 0,
+            weekly_rank=weekly_rank if is_ranked else 0,
+            achievements_unlocked=count_unlocked(unlocked),
+            achievements_total=achievement_rules.total()
+        )
+
+        _stats_cache.set(user_id, stats)
+        logger.info(f"Successfully collected stats for user {user_id}")
+        return stats
 
     except Exception as e:
         logger.error(f"Error in get_user_stats: {e}", exc_info=True)
@@ -338,6 +383,9 @@ async def get_global_rank(session: AsyncSession, user_id: int) -> int:
     Получает глобальный рейтинг пользователя по общему количеству XP (total_points)
     Возвращает позицию в рейтинге (1-based) или 0 если пользователь не найден
     """
+    if leaderboard.loaded:
+        return leaderboard.global_rank(user_id)
+
     try:
         # Создаем CTE для ранжирования пользователей
         rank_query = (
@@ -371,6 +419,9 @@ async def get_weekly_rank(session: AsyncSession, user_id: int) -> int:
     Получает недельный рейтинг пользователя по weekly_points
     Возвращает позицию в рейтинге (1-based) или 0 если пользователь не найден
     """
+    if leaderboard.loaded:
+        return leaderboard.weekly_rank(user_id)
+
     try:
         # Создаем CTE для ранжирования пользователей по weekly_points
         rank_query = (
@@ -405,6 +456,7 @@ async def update_weekly_xp(session: AsyncSession, user_id: int) -> bool:
         today = datetime.utcnow().date()
         week_start = today - timedelta(days=today.weekday())
 
+        reset = False
         async with session.begin():
             user_progress = await session.get(UserProgress, user_id, with_for_update=True)
             if not user_progress:
@@ -415,10 +467,14 @@ async def update_weekly_xp(session: AsyncSession, user_id: int) -> bool:
             if user_progress.last_active_day and user_progress.last_active_day < week_start:
                 # Сбрасываем weekly_points при переходе на новую неделю
                 user_progress.weekly_points = 0
+                reset = True
                 logger.info(f"Reset weekly points for user {user_id}")
                 await session.flush()
 
-            return True
+        # Рейтинг обновляем после коммита
+        if reset:
+            leaderboard.update(user_id, user_progress.total_points, 0)
+        return True
 
     except Exception as e:
         logger.error(f"Error updating weekly XP: {e}")
@@ -434,8 +490,51 @@ async def reset_all_weekly_points(session: AsyncSession) -> int:
             .values(weekly_points=0)
         )
         await session.commit()
+        leaderboard.reset_weekly()
         return result.rowcount
     except Exception as e:
         logger.error(f"Error resetting weekly points: {e}")
         await session.rollback()
         return 0
+
+
+async def close_week(session: AsyncSession, week_start: Optional[date] = None) -> int:
+    """
+    Сохраняет weekly_points завершившейся недели в WeeklyXP и обнуляет их.
+    По умолчанию закрывается неделя, начавшаяся в прошлый понедельник по
+    SCHEDULER_TIMEZONE - в нем же запускается задача закрытия недели.
+    Повторный вызов для той же недели ничего не делает
+    """
+    if week_start is None:
+        today = datetime.now(ZoneInfo(SCHEDULER_TIMEZONE)).date()
+        week_start = today - timedelta(days=today.weekday() + 7)
+
+    try:
+        closed = await session.scalar(
+            select(WeeklyXP.user_id)
+            .where(WeeklyXP.week_start_date == week_start)
+            .limit(1)
+        )
+        if closed is not None:
+            logger.info(f"Week {week_start} is already closed")
+            return 0
+
+        await session.execute(
+            insert(WeeklyXP).from_select(
+                ['user_id', 'week_start_date', 'xp_earned'],
+                select(UserProgress.user_id, literal(week_start), UserProgress.weekly_points)
+                .where(UserProgress.weekly_points > 0)
+            )
+        )
+        result = await session.execute(
+            update(UserProgress)
+            .where(UserProgress.weekly_points != 0)
+            .values(weekly_points=0)
+        )
+        await session.commit()
+        leaderboard.reset_weekly()
+        return result.rowcount
+    except Exception as e:
+        logger.error(f"Error closing week {week_start}: {e}")
+        await session.rollback()
+        return 0
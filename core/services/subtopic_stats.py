@@ -0,0 +1,131 @@
+import logging
+
+from sqlalchemy import select, func, update
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.database.models import UserStat, UserSubtopicStat
+
+logger = logging.getLogger(__name__)
+
+
+def subtopic_accuracy(stat=UserSubtopicStat):
+    """Точность по подтеме в процентах (SQL-выражение)"""
+    return (stat.correct * 100.0) / func.nullif(stat.correct + stat.wrong, 0)
+
+
+def _upsert_stmt(rows: list[dict]):
+    """INSERT ... ON DUPLICATE KEY UPDATE с прибавлением к существующим счетчикам"""
+    stmt = insert(UserSubtopicStat).values(rows)
+    return stmt.on_duplicate_key_update(
+        correct=UserSubtopicStat.correct + stmt.inserted.correct,
+        wrong=UserSubtopicStat.wrong + stmt.inserted.wrong
+    )
+
+
+async def record_subtopic_answer(
+    session: AsyncSession,
+    user_id: int,
+    subtopic_id: int,
+    is_correct: bool
+) -> None:
+    """Атомарно увеличивает счетчик ответов по подтеме (одна строка, без чтения)"""
+    await record_subtopic_counts(session, [{
+        'user_id': user_id,
+        'subtopic_id': subtopic_id,
+        'correct': 1 if is_correct else 0,
+        'wrong': 0 if is_correct else 1
+    }])
+
+
+async def record_subtopic_counts(session: AsyncSession, rows: list[dict]) -> None:
+    """Прибавляет сразу несколько приращений {user_id, subtopic_id, correct, wrong} одним запросом"""
+    if rows:
+        await session.execute(_upsert_stmt(rows))
+
+
+def best_and_worst_columns(user_id):
+    """
+    Скалярные подзапросы для лучшей и худшей подтемы пользователя.
+    Каждый читает только строки пользователя по первичному ключу (user_id, subtopic_id)
+    """
+    accuracy = subtopic_accuracy()
+    mine = (UserSubtopicStat.user_id == user_id,
+            UserSubtopicStat.correct + UserSubtopicStat.wrong > 0)
+
+    def pick(order_by):
+        return (
+            select(UserSubtopicStat.subtopic_id)
+            .where(*mine)
+            .order_by(*order_by)
+            .limit(1)
+            .scalar_subquery()
+        )
+
+    return [
+        pick([accuracy.desc(), UserSubtopicStat.subtopic_id]).label('best_subtopic_id'),
+        select(func.max(accuracy)).where(*mine).scalar_subquery().label('best_subtopic_accuracy'),
+        pick([accuracy.asc(), UserSubtopicStat.subtopic_id.desc()]).label('worst_subtopic_id'),
+        select(func.min(accuracy)).where(*mine).scalar_subquery().label('worst_subtopic_accuracy'),
+    ]
+
+
+def rows_from_json(user_id: int, subtopics_stats) -> list[dict]:
+    """Строки счетчиков из старого JSON {"subtopic_id": {"correct": X, "wrong": Y}}"""
+    rows = []
+    for key, value in (subtopics_stats or {}).items():
+        if not isinstance(value, dict):
+            continue
+        try:
+            subtopic_id = int(key)
+        except (TypeError, ValueError):
+            continue
+        correct = int(value.get('correct') or 0)
+        wrong = int(value.get('wrong') or 0)
+        if correct or wrong:
+            rows.append({
+                'user_id': user_id,
+                'subtopic_id': subtopic_id,
+                'correct': correct,
+                'wrong': wrong
+            })
+    return rows
+
+
+async def backfill_subtopic_stats(session_factory, batch_size: int = 500) -> int:
+    """
+    Переносит UserStat.subtopics_stats в user_subtopic_stats.
+    Перенесенный JSON очищается в той же транзакции, поэтому повторный запуск
+    безопасен и не удваивает счетчики. Возвращает количество обработанных пользователей
+    """
+    processed = 0
+    last_user_id = 0
+
+    while True:
+        async with session_factory() as session:
+            async with session.begin():
+                stats = (await session.execute(
+                    select(UserStat.user_id, UserStat.subtopics_stats)
+                    .where(UserStat.user_id > last_user_id)
+                    .order_by(UserStat.user_id)
+                    .limit(batch_size)
+                    .with_for_update()
+                )).all()
+                if not stats:
+                    break
+
+                user_ids = [row.user_id for row in stats if row.subtopics_stats]
+                rows = [r for row in stats for r in rows_from_json(row.user_id, row.subtopics_stats)]
+                await record_subtopic_counts(session, rows)
+                if user_ids:
+                    await session.execute(
+                        update(UserStat)
+                        .where(UserStat.user_id.in_(user_ids))
+                        .values(subtopics_stats={})
+                    )
+
+        processed += len(user_ids)
+        last_user_id = stats[-1].user_id
+        logger.info(f"Subtopic stats backfill: {processed} users moved, last id {last_user_id}")
+
+    return processed
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import time
+import zlib
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from sqlalchemy import select, func
+
+from config.database import AsyncSessionLocal
+from config.settings import CATALOG_CHECK_INTERVAL
+from core.database.models import Task, Topic, Subtopic, Theory, PartNumber, Complexity
+
+logger = logging.getLogger(__name__)
+
+
+def ids_checksum(ids: Iterable[int]) -> int:
+    """CRC32 последовательности ID: короткий и не зависящий от процесса отпечаток"""
+    return zlib.crc32(array('q', ids).tobytes())
+
+
+@dataclass(frozen=True)
+class CatalogTask:
+    """Лёгкая копия строки Task без тяжёлого task_content (только для чтения)"""
+    id: int
+    type_number: Optional[int]
+    topic_id: Optional[int]
+    subtopic_id: Optional[int]
+    part_number: Optional[PartNumber]
+    complexity: Optional[Complexity]
+    correct_answer: Optional[str]
+    answer_options: Optional[tuple]
+
+
+@dataclass(frozen=True)
+class CatalogTopic:
+    id: int
+    name: Optional[str]
+    title_ru: Optional[str]
+
+
+@dataclass(frozen=True)
+class CatalogSubtopic:
+    id: int
+    topic_id: Optional[int]
+    name: Optional[str]
+    title_ru: Optional[str]
+
+
+class TaskCatalog:
+    """
+    Общий для процесса каталог заданий, тем и подтем.
+    Загружается один раз при старте, дальше выбор заданий идёт без обращений к БД.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, check_interval: float = CATALOG_CHECK_INTERVAL):
+        self.session_factory = session_factory
+        self.check_interval = check_interval
+
+        self.version = None  # Отпечаток таблиц на момент загрузки
+        self.generation = 0  # Растет при каждой пересборке (для зависимых кэшей)
+        self.loaded = False
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+        self.tasks: dict[int, CatalogTask] = {}
+        self.topics: dict[int, CatalogTopic] = {}
+        self.subtopics: dict[int, CatalogSubtopic] = {}
+
+        self._by_type: dict[int, tuple[int, ...]] = {}
+        self._by_part: dict[PartNumber, tuple[int, ...]] = {}
+        self._by_subtopic: dict[int, tuple[int, ...]] = {}
+        self._by_complexity: dict[Complexity, tuple[int, ...]] = {}
+        self._all_ids: tuple[int, ...] = ()
+        self._query_cache: dict[tuple, tuple[int, ...]] = {}
+        self._fingerprint_cache: dict[tuple, int] = {}
+
+    # -------------| Загрузка |------------- #
+
+    @staticmethod
+    def _version_stmt():
+        """
+        Дешёвый отпечаток каталога: количество, максимальный id и время последней
+        правки в каждой таблице. updated_at ловит правки существующих строк
+        (ответ, сложность, подтема, название темы, текст теории)
+        """
+        return select(
+            select(func.count(Task.id)).scalar_subquery(),
+            select(func.max(Task.id)).scalar_subquery(),
+            select(func.max(Task.updated_at)).scalar_subquery(),
+            select(func.count(Subtopic.id)).scalar_subquery(),
+            select(func.max(Subtopic.id)).scalar_subquery(),
+            select(func.max(Subtopic.updated_at)).scalar_subquery(),
+            select(func.count(Topic.id)).scalar_subquery(),
+            select(func.max(Topic.id)).scalar_subquery(),
+            select(func.max(Topic.updated_at)).scalar_subquery(),
+            select(func.max(Theory.updated_at)).scalar_subquery()
+        )
+
+    async def load(self) -> None:
+        """Полностью перечитывает каталог из БД"""
+        async with self._lock:
+            async with self.session_factory() as session:
+                version = tuple((await session.execute(self._version_stmt())).one())
+
+                task_rows = (await session.execute(
+                    select(
+                        Task.id,
+                        Task.type_number,
+                        Task.topic_id,
+                        Task.subtopic_id,
+                        Task.part_number,
+                        Task.complexity,
+                        Task.correct_answer,
+                        Task.answer_options
+                    )
+                )).all()
+                topics = (await session.execute(select(Topic))).scalars().all()
+                subtopics = (await session.execute(select(Subtopic))).scalars().all()
+
+            self.build(task_rows, topics, subtopics, version=version)
+
+        logger.info(
+            f"Task catalog loaded: {len(self.tasks)} tasks, "
+            f"{len(self.topics)} topics, {len(self.subtopics)} subtopics")
+
+    async def refresh(self) -> None:
+        """Принудительное обновление (например, после правки заданий)"""
+        await self.load()
+
+    async def ensure_fresh(self) -> None:
+        """
+        Загружает каталог при первом обращении и не чаще чем раз в check_interval
+        сверяет отпечаток с БД, перезагружая каталог при изменениях
+        """
+        if not self.loaded:
+            await self.load()
+            return
+
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        try:
+            async with self.session_factory() as session:
+                version = tuple((await session.execute(self._version_stmt())).one())
+            if version != self.version:
+                logger.info("Task catalog version changed, reloading")
+                await self.load()
+        except Exception as e:
+            # Работаем со старыми данными, пока БД недоступна
+            logger.error(f"Error checking task catalog version: {e}")
+
+    def build(
+        self,
+        task_rows: Iterable,
+        topics: Iterable = (),
+        subtopics: Iterable = (),
+        version=None
+    ) -> None:
+        """Строит индексы из готовых строк (без обращений к БД)"""
+        tasks = {}
+        by_type, by_part, by_subtopic, by_complexity = {}, {}, {}, {}
+
+        for row in task_rows:
+            task = CatalogTask(
+                id=row.id,
+                type_number=row.type_number,
+                topic_id=row.topic_id,
+                subtopic_id=row.subtopic_id,
+                part_number=row.part_number,
+                complexity=row.complexity,
+                correct_answer=row.correct_answer,
+                answer_options=tuple(row.answer_options or ())
+            )
+            tasks[task.id] = task
+
+        for task_id in sorted(tasks):
+            task = tasks[task_id]
+            if task.type_number is not None:
+                by_type.setdefault(task.type_number, []).append(task_id)
+            if task.part_number is not None:
+                by_part.setdefault(task.part_number, []).append(task_id)
+            if task.subtopic_id is not None:
+                by_subtopic.setdefault(task.subtopic_id, []).append(task_id)
+            if task.complexity is not None:
+                by_complexity.setdefault(task.complexity, []).append(task_id)
+
+        # Подменяем всё разом, чтобы читатели не увидели полусобранный каталог
+        self.tasks = tasks
+        self.topics = {
+            t.id: CatalogTopic(id=t.id, name=t.name, title_ru=t.title_ru)
+            for t in topics
+        }
+        self.subtopics = {
+            s.id: CatalogSubtopic(
+                id=s.id, topic_id=s.topic_id, name=s.name, title_ru=s.title_ru)
+            for s in subtopics
+        }
+        self._by_type = {k: tuple(v) for k, v in by_type.items()}
+        self._by_part = {k: tuple(v) for k, v in by_part.items()}
+        self._by_subtopic = {k: tuple(v) for k, v in by_subtopic.items()}
+        self._by_complexity = {k: tuple(v) for k, v in by_complexity.items()}
+        self._all_ids = tuple(sorted(tasks))
+        self._query_cache = {}
+        self._fingerprint_cache = {}
+
+        self.version = version
+        self.generation += 1
+        self.loaded = True
+        self._checked_at = time.monotonic()
+
+    # -------------| Выборки |------------- #
+
+    def lookup(
+        self,
+        task_type: int = None,
+        part_number: PartNumber = None,
+        subtopic_id: int = None,
+        complexity: Complexity = None
+    ) -> tuple[int, ...]:
+        """Возвращает неизменяемый отсортированный кортеж ID заданий по фильтрам"""
+        key = (task_type, part_number, subtopic_id, complexity)
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            return cached
+
+        candidates = []
+        if task_type is not None:
+            candidates.append(self._by_type.get(task_type, ()))
+        if part_number is not None:
+            candidates.append(self._by_part.get(part_number, ()))
+        if subtopic_id is not None:
+            candidates.append(self._by_subtopic.get(subtopic_id, ()))
+        if complexity is not None:
+            candidates.append(self._by_complexity.get(complexity, ()))
+
+        if not candidates:
+            result = self._all_ids
+        elif len(candidates) == 1:
+            result = candidates[0]
+        else:
+            # Начинаем с самого короткого индекса и пересекаем с остальными
+            candidates.sort(key=len)
+            rest = [set(c) for c in candidates[1:]]
+            result = tuple(
+                task_id for task_id in candidates[0]
+                if all(task_id in s for s in rest)
+            )
+
+        self._query_cache[key] = result
+        return result
+
+    def fingerprint(self, **filters) -> int:
+        """
+        Контрольная сумма выборки lookup. В отличие от generation одинакова
+        на всех репликах и после перезапуска, пока набор ID не изменился
+        """
+        key = tuple(filters.get(name) for name in ('task_type', 'part_number', 'subtopic_id', 'complexity'))
+        cached = self._fingerprint_cache.get(key)
+        if cached is None:
+            cached = self._fingerprint_cache[key] = ids_checksum(self.lookup(**filters))
+        return cached
+
+    def task_ids(self, **filters) -> list[int]:
+        """То же, что lookup, но в виде нового списка (его можно перемешивать)"""
+        return list(self.lookup(**filters))
+
+    def type_numbers(self, part_number: PartNumber = None) -> list[int]:
+        """Отсортированные номера типов заданий (опционально только для одной части)"""
+        if part_number is None:
+            return sorted(self._by_type)
+        return sorted({
+            self.tasks[task_id].type_number
+            for task_id in self._by_part.get(part_number, ())
+            if self.tasks[task_id].type_number is not None
+        })
+
+    def get(self, task_id: int) -> Optional[CatalogTask]:
+        return self.tasks.get(task_id)
+
+    def get_subtopic(self, subtopic_id: int) -> Optional[CatalogSubtopic]:
+        return self.subtopics.get(subtopic_id)
+
+    def get_topic(self, topic_id: int) -> Optional[CatalogTopic]:
+        return self.topics.get(topic_id)
+
+
+# Единственный экземпляр на процесс
+task_catalog = TaskCatalog()
@@ -0,0 +1,154 @@
+import logging
+import random
+from dataclasses import asdict, dataclass, replace
+from typing import Optional
+
+from core.database.models import Complexity, PartNumber
+from core.services.task_catalog import TaskCatalog, ids_checksum, task_catalog
+
+logger = logging.getLogger(__name__)
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(x: int) -> int:
+    """Перемешивание битов (финализатор splitmix64)"""
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def permute(index: int, size: int, seed: int) -> int:
+    """
+    Позиция index в псевдослучайной перестановке [0, size), заданной seed.
+    Сеть Фейстеля на ближайшей сверху степени двойки с «обходом цикла»:
+    значения за пределами size прогоняются повторно. Область не больше 4 * size,
+    поэтому в среднем хватает нескольких раундов, а вся перестановка не строится
+    """
+    if size <= 1:
+        return 0
+    bits = max(2, (size - 1).bit_length())
+    bits += bits % 2
+    half = bits // 2
+    mask = (1 << half) - 1
+
+    x = index
+    while True:
+        left, right = x >> half, x & mask
+        for round_number in range(4):
+            key = _mix(seed * 4 + round_number)
+            left, right = right, left ^ (_mix(key ^ right) & mask)
+        x = (left << half) | right
+        if x < size:
+            return x
+
+
+@dataclass(frozen=True)
+class TaskCursor:
+    """
+    Сессия заданий без списка ID в состоянии FSM: фильтр каталога, seed
+    перестановки и текущая позиция. Задание на позиции вычисляется за O(1)
+    по отсортированному индексу каталога. В режиме variant позиция - номер
+    типа задания, из пула каждого типа берется одно задание.
+
+    pool - отпечаток пула на старте сессии. Перестановка считается по текущему
+    пулу, поэтому после пересборки каталога с другим набором заданий позиция
+    указывала бы на другие задания (повторы и пропуски) - такая сессия устарела
+    """
+    seed: int
+    position: int = 0
+    task_type: Optional[int] = None
+    part_number: Optional[str] = None  # Значение PartNumber (состояние хранится в JSON)
+    subtopic_id: Optional[int] = None
+    complexity: Optional[str] = None  # Значение Complexity
+    limit: Optional[int] = None
+    variant: bool = False
+    pool: Optional[int] = None
+
+    @classmethod
+    def new(
+        cls,
+        task_type: int = None,
+        part_number: PartNumber = None,
+        subtopic_id: int = None,
+        complexity: Complexity = None,
+        limit: int = None,
+        variant: bool = False
+    ) -> 'TaskCursor':
+        return cls(
+            seed=random.getrandbits(32),
+            task_type=task_type,
+            part_number=part_number.value if part_number else None,
+            subtopic_id=subtopic_id,
+            complexity=complexity.value if complexity else None,
+            limit=limit,
+            variant=variant
+        )
+
+    @property
+    def filters(self) -> dict:
+        return dict(
+            task_type=self.task_type,
+            part_number=PartNumber(self.part_number) if self.part_number else None,
+            subtopic_id=self.subtopic_id,
+            complexity=Complexity(self.complexity) if self.complexity else None
+        )
+
+    def size(self, catalog: TaskCatalog = task_catalog) -> int:
+        if self.variant:
+            total = len(catalog.type_numbers())
+        else:
+            total = len(catalog.lookup(**self.filters))
+        return min(total, self.limit) if self.limit is not None else total
+
+    def fingerprint(self, catalog: TaskCatalog = task_catalog) -> int:
+        # В режиме variant задания выбираются по типам, важен только их список
+        if self.variant:
+            return ids_checksum(catalog.type_numbers())
+        return catalog.fingerprint(**self.filters)
+
+    def stamped(self, catalog: TaskCatalog = task_catalog) -> 'TaskCursor':
+        """Курсор с запомненным отпечатком текущего пула"""
+        return replace(self, pool=self.fingerprint(catalog))
+
+    def is_stale(self, catalog: TaskCatalog = task_catalog) -> bool:
+        """Пул заданий изменился с начала сессии (курсоры без отпечатка не проверяются)"""
+        return self.pool is not None and self.pool != self.fingerprint(catalog)
+
+    def task_id(self, catalog: TaskCatalog = task_catalog) -> Optional[int]:
+        """ID задания на текущей позиции (None, если сессия закончилась или устарела)"""
+        if self.position >= self.size(catalog) or self.is_stale(catalog):
+            return None
+        if self.variant:
+            task_type = catalog.type_numbers()[self.position]
+            pool = catalog.lookup(task_type=task_type)
+            return pool[permute(0, len(pool), _mix(self.seed ^ task_type))]
+        pool = catalog.lookup(**self.filters)
+        return pool[permute(self.position, len(pool), self.seed)]
+
+    def advance(self) -> 'TaskCursor':
+        return replace(self, position=self.position + 1)
+
+    def to_state(self) -> dict:
+        return {key: value for key, value in asdict(self).items() if value not in (None, False)}
+
+    @classmethod
+    def from_state(cls, data: Optional[dict]) -> Optional['TaskCursor']:
+        if not data:
+            return None
+        try:
+            return cls(**data)
+        except TypeError as e:
+            logger.warning(f"Broken task cursor in state: {e}")
+            return None
+
+
+async def start_task_cursor(**options) -> Optional[TaskCursor]:
+    """Новая сессия по фильтрам каталога; None, если заданий нет или каталог недоступен"""
+    try:
+        await task_catalog.ensure_fresh()
+        cursor = TaskCursor.new(**options).stamped()
+        return cursor if cursor.size() else None
+    except Exception as e:
+        logger.error(f"Error starting task cursor: {e}")
+        return None
@@ -1,121 +1,143 @@
 import logging
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from core.database.models import Task, Complexity
+from core.database.models import Task
 from core.fsm.states import TaskStates
 from config.database import AsyncSessionLocal
-from ..keyboards.inline import answer_options_kb
+from core.services.media_cache import media_cache
+from core.services.task_cursor import TaskCursor
+from core.services.task_prefetch import task_prefetcher
+from core.services.task_render import TaskRender, task_renders
 from ..keyboards.reply import task_navigation_kb
 
 logger = logging.getLogger(__name__)
 
 
-async def display_task(message: Message, task: Task, state: FSMContext):
-    """Отображает задание с вариантами ответов"""
+async def _edit_task_message(bot: Bot, chat_id: int, data: dict, rendered: TaskRender) -> Optional[Message]:
+    """
+    Подменяет предыдущее сообщение задания новым. None, если редактировать
+    нечего или нельзя (фото не превращается в текст и наоборот)
+    """
+    message_id = data.get('task_message_id')
+    if not message_id or data.get('task_message_kind') != rendered.kind:
+        return None
     try:
-        # Добавляем отметку о сложности
-        complexity_marker = ""
-        if task.complexity == Complexity.HIGH:
-            complexity_marker = "🔥 "
-
-        text = (
-            f"📌 Номер задания: {task.id} {complexity_marker}\n"
-            f"Тип задания: {task.type_number}\n\n"
-            f"{task.task_content['text']}\n\n"
+        if rendered.kind == 'photo':
+            return await media_cache.edit_photo(
+                bot, chat_id, message_id, rendered.image_url,
+                caption=rendered.body,
+                reply_markup=rendered.reply_markup
+            )
+        return await bot.edit_message_text(
+            rendered.body,
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=rendered.reply_markup
         )
+    except TelegramBadRequest as e:
+        # Сообщение удалено, слишком старое или не изменилось - отправим новое
+        logger.debug(f"Could not edit task message {message_id}: {e}")
+        return None
+
+
+async def _send_task_message(message: Message, rendered: TaskRender) -> Message:
+    if rendered.kind == 'photo':
+        try:
+            # Повторные показы идут по file_id, Telegram не скачивает картинку заново
+            return await media_cache.answer_photo(
+                message,
+                rendered.image_url,
+                caption=rendered.body,
+                reply_markup=rendered.reply_markup
+            )
+        except Exception as e:
+            logger.error(f"Error sending photo with caption: {e}")
+            return await message.answer(
+                rendered.text + "\n\n⚠️ Не удалось загрузить изображение",
+                reply_markup=rendered.reply_markup
+            )
+    return await message.answer(rendered.body, reply_markup=rendered.reply_markup)
+
 
-        # Проверяем наличие изображения
-        image_url = task.task_content.get('image')
-        task_text = task.task_content.get('text', 'Текст задания отсутствует')
-
-        if image_url:
-            # Если есть изображение - пытаемся отправить фото с подписью
-            try:
-                msg = await message.answer_photo(
-                    photo=image_url,
-                    caption=text,
-                    reply_markup=answer_options_kb(
-                        task.answer_options, task.id)
-                )
-            except Exception as e:
-                logger.error(f"Error sending photo with caption: {e}")
-
-                # Пытаемся отправить изображение отдельным сообщением
+async def show_task(message: Message, rendered: TaskRender, state: FSMContext,
+                    edit: bool = False, bot: Bot = None):
+    """
+    Отображает задание с вариантами ответов одним сообщением.
+    edit=True - пользователь уже работает с заданиями (кнопки навигации на экране):
+    предыдущее сообщение задания редактируется на месте, если это возможно
+    """
+    try:
+        bot = bot or Bot.get_current()
+        data = await state.get_data() if edit else {}
+
+        msg = None
+        if edit:
+            msg = await _edit_task_message(bot, message.chat.id, data, rendered)
+        if msg is None:
+            msg = await _send_task_message(message, rendered)
+            if data.get('task_message_id'):
+                # Старое задание с кнопками ответов не должно оставаться в чате
                 try:
-                    # Сначала отправляем изображение
-                    await message.answer_photo(
-                        photo=image_url
-                    )
-                    # Затем отправляем текст задания с клавиатурой
-                    msg = await message.answer(
-                        text + "\n\nИзображение отправлено отдельным сообщением",
-                        reply_markup=answer_options_kb(
-                            task.answer_options, task.id)
-                    )
-                except Exception as e2:
-                    logger.error(f"Error sending photo separately: {e2}")
-                    # Если не удалось отправить вообще, отправляем только текст
-                    msg = await message.answer(
-                        text + "\n\n⚠️ Не удалось загрузить изображение",
-                        reply_markup=answer_options_kb(
-                            task.answer_options, task.id)
-                    )
-        else:
-            # Если нет изображения - отправляем только текст
-            msg = await message.answer(
-                text,
-                reply_markup=answer_options_kb(task.answer_options, task.id)
+                    await bot.delete_message(message.chat.id, data['task_message_id'])
+                except Exception as e:
+                    logger.debug(f"Could not delete previous task message: {e}")
+
+        if not edit:
+            # Reply-клавиатуру навигации нельзя прикрепить к сообщению с inline-кнопками
+            await message.answer(
+                "Выберите действие:",
+                reply_markup=task_navigation_kb(rendered.type_number)
             )
 
         # Сохраняем данные в состоянии
+        await state.set_state(TaskStates.WAITING_ANSWER)
         await state.update_data(
             task_message_id=msg.message_id,
+            task_message_kind=rendered.kind,
             chat_id=message.chat.id,
-            current_task_id=task.id,
-            current_type=task.type_number
-        )
-
-        # Отправляем клавиатуру навигации
-        await message.answer(
-            "Выберите действие:",
-            reply_markup=task_navigation_kb(task.type_number)
+            current_task_id=rendered.task_id,
+            current_type=rendered.type_number
         )
-
-        await state.set_state(TaskStates.WAITING_ANSWER)
-        await state.update_data(current_task_id=task.id)
         logger.info(
-            f"Установлено состояние WAITING_ANSWER для задания {task.id}")
+            f"Установлено состояние WAITING_ANSWER для задания {rendered.task_id}")
 
     except Exception as e:
         logger.error(f"Error displaying task: {str(e)}")
-        await message.answer(f"Произошла ошибка при отображении задания {task.id}")
+        await message.answer(f"Произошла ошибка при отображении задания {rendered.task_id}")
+
+
+async def display_task(message: Message, task: Task, state: FSMContext, edit: bool = False, bot: Bot = None):
+    """Отображает загруженное задание (отрисовка берется из кэша)"""
+    await show_task(message, task_renders.task(task), state, edit=edit, bot=bot)
 
 
-async def display_task_by_id(message: Message, task_id: int, state: FSMContext):
-    """Отображает задание с проверкой состояния"""
+async def display_task_by_id(message: Message, task_id: int, state: FSMContext,
+                             edit: bool = False, bot: Bot = None):
+    """Отображает задание по ID; уже отрисованное задание показывается без запроса к БД"""
     try:
-        async with AsyncSessionLocal() as session:
-            async with session.begin():
-                task = await session.get(
-                    Task,
-                    task_id,
-                    options=[
-                        selectinload(Task.topic),
-                        selectinload(Task.subtopic)
-                    ]
-                )
-
-                if not task:
-                    await message.answer("Задание не найдено")
-                    return
-
-        # Устанавливаем состояние перед отображением задания
-        await state.set_state(TaskStates.WAITING_ANSWER)
-        await display_task(message, task, state)
+        rendered = task_renders.get(task_id)
+        if rendered is None:
+            async with AsyncSessionLocal() as session:
+                task = await session.get(Task, task_id)
+            if not task:
+                await message.answer("Задание не найдено")
+                return
+            rendered = task_renders.task(task)
+
+        await show_task(message, rendered, state, edit=edit, bot=bot)
 
     except Exception as e:
         logger.error(f"Error in display_task_by_id: {e}", exc_info=True)
         await message.answer("Ошибка при загрузке задания")
         await state.clear()
+
+
+async def display_cursor_task(message: Message, cursor: TaskCursor, state: FSMContext,
+                              edit: bool = False, bot: Bot = None):
+    """Отображает текущее задание сессии и заранее готовит следующие"""
+    await display_task_by_id(message, cursor.task_id(), state, edit=edit, bot=bot)
+    task_prefetcher.schedule(cursor)
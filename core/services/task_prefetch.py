@@ -0,0 +1,81 @@
+import asyncio
+import logging
+
+from sqlalchemy import select
+
+from config.database import AsyncSessionLocal
+from config.settings import TASK_PREFETCH_DEPTH
+from core.database.models import Task
+from core.services.task_cursor import TaskCursor
+from core.services.task_render import TaskRenderCache, task_renders
+
+logger = logging.getLogger(__name__)
+
+
+class TaskPrefetcher:
+    """
+    Пока пользователь отвечает, следующие depth заданий его сессии загружаются
+    одним запросом и отрисовываются в кэш task_renders. Следующее нажатие
+    «Следующее задание» показывает задание без обращения к БД
+    """
+
+    def __init__(self, renders: TaskRenderCache = task_renders, session_factory=AsyncSessionLocal,
+                 depth: int = TASK_PREFETCH_DEPTH):
+        self.renders = renders
+        self.session_factory = session_factory
+        self.depth = depth
+        self._loading: set[int] = set()  # Задания, которые уже загружаются
+        self._tasks: set[asyncio.Task] = set()
+        self.prefetched = 0
+
+    def upcoming(self, cursor: TaskCursor) -> list[int]:
+        """ID следующих заданий сессии, которых еще нет в кэше"""
+        ids = []
+        for _ in range(self.depth):
+            cursor = cursor.advance()
+            task_id = cursor.task_id()
+            if task_id is None:
+                break
+            if task_id not in self._loading and not self.renders.cached(task_id):
+                ids.append(task_id)
+        return ids
+
+    def schedule(self, cursor: TaskCursor) -> None:
+        """Запускает загрузку в фоне и сразу возвращает управление"""
+        try:
+            ids = self.upcoming(cursor)
+        except Exception as e:
+            logger.error(f"Error computing tasks to prefetch: {e}")
+            return
+        if not ids:
+            return
+        self._loading.update(ids)
+        task = asyncio.create_task(self._load(ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, ids: list[int]) -> None:
+        try:
+            async with self.session_factory() as session:
+                tasks = (await session.execute(select(Task).where(Task.id.in_(ids)))).scalars().all()
+            for task in tasks:
+                self.renders.task(task)
+            self.prefetched += len(tasks)
+        except Exception as e:
+            # Не страшно: задание загрузится при показе
+            logger.error(f"Error prefetching tasks {ids}: {e}")
+        finally:
+            self._loading.difference_update(ids)
+
+    async def wait(self) -> None:
+        """Дожидается запущенных загрузок (тесты, остановка бота)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await self.wait()
+
+
+task_prefetcher = TaskPrefetcher()
@@ -0,0 +1,139 @@
+import html
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram.enums import ParseMode
+from aiogram.types import InlineKeyboardMarkup
+
+from config.settings import TASK_RENDER_CACHE_SIZE
+from core.database.models import Complexity, Task
+from core.keyboards.inline import answer_options_kb
+from core.services.task_catalog import TaskCatalog, task_catalog
+from core.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Подпись к фото в Telegram не длиннее 1024 символов
+CAPTION_LIMIT = 1024
+
+
+@dataclass(frozen=True)
+class TaskRender:
+    """
+    Готовое к отправке сообщение задания. kind - photo (картинка с подписью)
+    или text; длинный текст с картинкой уходит текстом, картинка - превью ссылки
+    """
+    task_id: int
+    type_number: Optional[int]
+    text: str
+    body: str  # То, что уходит в Telegram (с невидимой ссылкой на картинку для kind=text)
+    kind: str
+    image_url: Optional[str]
+    reply_markup: InlineKeyboardMarkup
+    parse_mode: str = ParseMode.HTML
+
+
+@dataclass(frozen=True)
+class TheoryRender:
+    task_id: int
+    text: str
+    parse_mode: str = ParseMode.HTML
+
+
+def render_task(task: Task) -> TaskRender:
+    """Текст, картинка и клавиатура ответов задания"""
+    # Добавляем отметку о сложности
+    complexity_marker = ""
+    if task.complexity == Complexity.HIGH:
+        complexity_marker = "🔥 "
+
+    text = (
+        f"📌 Номер задания: {task.id} {complexity_marker}\n"
+        f"Тип задания: {task.type_number}\n\n"
+        f"{task.task_content.get('text', 'Текст задания отсутствует')}\n\n"
+    )
+    image_url = task.task_content.get('image')
+    kind = 'photo' if image_url and len(text) <= CAPTION_LIMIT else 'text'
+    body = text
+    if image_url and kind == 'text':
+        body = f'<a href="{html.escape(image_url)}">\u200b</a>{text}'
+
+    return TaskRender(
+        task_id=task.id,
+        type_number=task.type_number,
+        text=text,
+        body=body,
+        kind=kind,
+        image_url=image_url,
+        reply_markup=answer_options_kb(task.answer_options, task.id)
+    )
+
+
+def render_theory(task: Task) -> TheoryRender:
+    """Теория к заданию; task.theory и task.theory.topic должны быть загружены"""
+    topic_name = task.theory.topic.title_ru if task.theory.topic else "Без темы"
+    return TheoryRender(
+        task_id=task.id,
+        text=(
+            f"📚 Теория по заданию {task.type_number}\n"
+            f"Тема: {topic_name}\n\n"
+            f"{task.theory.content}"
+        )
+    )
+
+
+class TaskRenderCache:
+    """
+    Отрисованные задания и теория по task_id. Сбрасывается при пересборке
+    каталога (после правки заданий или теории), редкие задания вытесняются
+    """
+
+    def __init__(self, maxsize: int = TASK_RENDER_CACHE_SIZE, catalog: TaskCatalog = task_catalog):
+        self.catalog = catalog
+        self._generation = None
+        self._cache = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def _sync(self):
+        if self._generation != self.catalog.generation:
+            self._cache.clear()
+            self._generation = self.catalog.generation
+
+    def get(self, task_id: int) -> Optional[TaskRender]:
+        """Готовое задание без обращения к БД или None"""
+        self._sync()
+        render = self._cache.get(('task', task_id))
+        if render is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return render
+
+    def cached(self, task_id: int) -> bool:
+        self._sync()
+        return ('task', task_id) in self._cache
+
+    def task(self, task: Task) -> TaskRender:
+        self._sync()
+        render = self._cache.get(('task', task.id))
+        if render is None:
+            render = render_task(task)
+            self._cache.set(('task', task.id), render)
+        return render
+
+    def get_theory(self, task_id: int) -> Optional[TheoryRender]:
+        self._sync()
+        return self._cache.get(('theory', task_id))
+
+    def theory(self, task: Task) -> TheoryRender:
+        self._sync()
+        render = self._cache.get(('theory', task.id))
+        if render is None:
+            render = render_theory(task)
+            self._cache.set(('theory', task.id), render)
+        return render
+
+
+task_renders = TaskRenderCache()
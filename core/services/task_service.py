@@ -26,13 +26,15 @@ logger = logging.getLogger(__name__)
 async def check_answer(
     session: AsyncSession,
     task_id: int,
-    user_answer: str,
+    user_answer: str | None,
     user_id: int,
-    state: FSMContext | None = None
+    state: FSMContext | None = None,
+    option_index: int | None = None
 ) -> dict:
     """Проверка ответа с полным обновлением статистики"""
     try:
-        return await check_answer_with_achievements(session, task_id, user_answer, user_id)
+        return await check_answer_with_achievements(
+            session, task_id, user_answer, user_id, option_index=option_index)
 
     except Exception as e:
         logger.error(f"Error in check_answer: {e}", exc_info=True)
@@ -1,79 +1,178 @@
 import random
-from sqlalchemy import select, and_, func
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from config.database import AsyncSessionLocal
-from core.database.models import Task, PartNumber
+from core.database.models import Task, PartNumber, Complexity
+from core.services.task_catalog import TaskCatalog, task_catalog
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-async def get_random_task(task_type: int = None) -> Task:
-    async with AsyncSessionLocal() as session:
-        stmt = select(Task)
-        if task_type is not None:
-            stmt = stmt.where(Task.type_number == task_type)
-        stmt = stmt.options(selectinload(Task.topic))
-        tasks = (await session.execute(stmt)).scalars().all()
-        return random.choice(tasks) if tasks else None
-
-
-async def get_shuffled_task_ids(
+async def pick_random_task_id(
         task_type: int = None,
         part_number: PartNumber = None,
         subtopic_id: int = None,
-        limit: int = 20
-) -> list[int]:
+        complexity: Complexity = None
+) -> int | None:
+    """
+    Выбирает ID случайного задания по кэшированному массиву ID из каталога.
+    Если каталог недоступен - выбирает в БД через COUNT + OFFSET
+    """
+    filters = dict(
+        task_type=task_type,
+        part_number=part_number,
+        subtopic_id=subtopic_id,
+        complexity=complexity
+    )
+
+    try:
+        await task_catalog.ensure_fresh()
+        task_ids = task_catalog.lookup(**filters)
+        return random.choice(task_ids) if task_ids else None
+    except Exception as e:
+        logger.error(f"Task catalog unavailable, falling back to SQL: {e}")
+
     async with AsyncSessionLocal() as session:
-        try:
-            stmt = select(Task.id)
+        return await pick_random_task_id_sql(session, **filters)
 
-            # Добавляем условия фильтрации, если они указаны
-            filters = []
-            if task_type is not None:
-                filters.append(Task.type_number == task_type)
-            if part_number is not None:
-                filters.append(Task.part_number == part_number)
-            if subtopic_id is not None:
-                filters.append(Task.subtopic_id == subtopic_id)
 
-            if filters:
-                stmt = stmt.where(and_(*filters))
+async def pick_random_task_id_sql(
+        session: AsyncSession,
+        task_type: int = None,
+        part_number: PartNumber = None,
+        subtopic_id: int = None,
+        complexity: Complexity = None
+) -> int | None:
+    """Случайный ID без выгрузки таблицы: COUNT(*) и одна строка по случайному OFFSET"""
+    filters = []
+    if task_type is not None:
+        filters.append(Task.type_number == task_type)
+    if part_number is not None:
+        filters.append(Task.part_number == part_number)
+    if subtopic_id is not None:
+        filters.append(Task.subtopic_id == subtopic_id)
+    if complexity is not None:
+        filters.append(Task.complexity == complexity)
+
+    total = await session.scalar(select(func.count(Task.id)).where(*filters))
+    if not total:
+        return None
+
+    return await session.scalar(
+        select(Task.id)
+        .where(*filters)
+        .order_by(Task.id)
+        .offset(random.randrange(total))
+        .limit(1)
+    )
 
-            result = await session.execute(stmt)
-            task_ids = [row[0] for row in result.all()]
 
-            random.shuffle(task_ids)
-            return task_ids[:limit]
+async def get_random_task(task_type: int = None) -> Task:
+    """Случайное задание: сначала выбираем ID, затем загружаем только одну строку"""
+    task_id = await pick_random_task_id(task_type=task_type)
+    if task_id is None:
+        return None
 
-        except Exception as e:
-            logger.error(f"Error getting task ids: {str(e)}")
-            return []
+    async with AsyncSessionLocal() as session:
+        return await session.get(
+            Task,
+            task_id,
+            options=[selectinload(Task.topic)]
+        )
 
 
-async def get_variant_task_ids() -> list[int]:
-    """Возвращает список ID заданий (по одному случайному каждого типа)"""
-    async with AsyncSessionLocal() as session:
-        try:
-            # Получаем все существующие типы заданий
-            stmt = select(Task.type_number).distinct().order_by(
-                Task.type_number)
-            type_numbers = (await session.execute(stmt)).scalars().all()
+async def get_shuffled_task_ids(
+        task_type: int = None,
+        part_number: PartNumber = None,
+        subtopic_id: int = None,
+        complexity: Complexity = None,
+        limit: int | None = 20
+) -> list[int]:
+    """Перемешанные ID заданий из каталога (без запросов к БД)"""
+    try:
+        await task_catalog.ensure_fresh()
 
-            task_ids = []
+        task_ids = task_catalog.task_ids(
+            task_type=task_type,
+            part_number=part_number,
+            subtopic_id=subtopic_id,
+            complexity=complexity
+        )
 
-            # Для каждого типа получаем одно случайное задание
-            for type_num in type_numbers:
-                stmt = select(Task.id).where(
-                    Task.type_number == type_num
-                ).order_by(func.random()).limit(1)
+        random.shuffle(task_ids)
+        return task_ids[:limit] if limit is not None else task_ids
 
-                task_id = (await session.execute(stmt)).scalar_one_or_none()
-                if task_id:
-                    task_ids.append(task_id)
+    except Exception as e:
+        logger.error(f"Error getting task ids: {str(e)}")
+        return []
 
-            return task_ids
 
-        except Exception as e:
-            logger.error(f"Error getting variant tasks: {str(e)}")
-            return []
+async def get_variant_task_ids() -> list[int]:
+    """Возвращает список ID заданий (по одному случайному каждого типа)"""
+    variants = await generate_variants(1)
+    return variants[0] if variants else []
+
+
+async def generate_variants(count: int = 1) -> list[list[int]]:
+    """
+    Собирает count вариантов ОГЭ за один проход по пулам ID из каталога.
+    При недоступности каталога один вариант собирается одним SQL-запросом
+    """
+    try:
+        await task_catalog.ensure_fresh()
+        return build_variants(task_catalog, count)
+    except Exception as e:
+        logger.error(f"Error generating variants from catalog: {str(e)}")
+
+    try:
+        async with AsyncSessionLocal() as session:
+            variants = []
+            for _ in range(count):
+                task_ids = await fetch_variant_task_ids_sql(session)
+                if task_ids:
+                    variants.append(task_ids)
+            return variants
+    except Exception as e:
+        logger.error(f"Error getting variant tasks: {str(e)}")
+        return []
+
+
+def build_variants(catalog: TaskCatalog, count: int = 1, rng: random.Random = None) -> list[list[int]]:
+    """
+    По одному заданию каждого типа в каждом варианте.
+    Пул типа перемешивается и выдается по кругу, поэтому задачи не повторяются
+    между вариантами, пока в пуле хватает заданий
+    """
+    rng = rng or random
+    type_numbers = catalog.type_numbers()
+    if not type_numbers or count < 1:
+        return []
+
+    variants = [[] for _ in range(count)]
+    for type_num in type_numbers:
+        pool = catalog.task_ids(task_type=type_num)
+        rng.shuffle(pool)
+        for i, variant in enumerate(variants):
+            if i and i % len(pool) == 0:
+                rng.shuffle(pool)
+            variant.append(pool[i % len(pool)])
+
+    return variants
+
+
+async def fetch_variant_task_ids_sql(session: AsyncSession) -> list[int]:
+    """Один вариант одним запросом: ROW_NUMBER() по каждому типу в случайном порядке"""
+    ranked = select(
+        Task.id,
+        Task.type_number,
+        func.row_number().over(
+            partition_by=Task.type_number,
+            order_by=func.rand()
+        ).label('rn')
+    ).subquery()
+
+    stmt = select(ranked.c.id).where(
+        ranked.c.rn == 1).order_by(ranked.c.type_number)
+    return list((await session.execute(stmt)).scalars().all())
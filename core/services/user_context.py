@@ -0,0 +1,109 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from config.database import AsyncSessionLocal
+from config.settings import USER_CONTEXT_TTL
+from core.database.models import User, UserStatus
+from core.services.user_service import (
+    get_or_create_user,
+    interaction_write_due,
+    update_last_interaction
+)
+from core.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_status(status) -> UserStatus:
+    """Статус из БД может прийти строкой ('no_sub' или 'NO_SUB')"""
+    if isinstance(status, UserStatus):
+        return status
+    if isinstance(status, str):
+        try:
+            return UserStatus(status.lower())
+        except ValueError:
+            pass
+    return UserStatus.NO_SUB
+
+
+@dataclass(frozen=True)
+class UserContext:
+    """Пользователь и его роль, общие для middleware и фильтров одного апдейта"""
+    id: int
+    username: Optional[str]
+    status: UserStatus
+
+    @property
+    def is_admin(self) -> bool:
+        return self.status == UserStatus.ADMIN
+
+    @property
+    def is_moderator(self) -> bool:
+        return self.status in (UserStatus.ADMIN, UserStatus.MODERATOR)
+
+    @property
+    def is_teacher(self) -> bool:
+        return self.status in (UserStatus.ADMIN, UserStatus.MODERATOR, UserStatus.TEACHER)
+
+    @classmethod
+    def from_user(cls, user: User) -> 'UserContext':
+        return cls(id=user.id, username=user.username, status=normalize_status(user.status))
+
+
+class UserContextCache:
+    """
+    user_id -> UserContext с TTL. Статус, измененный вне бота, подхватывается
+    по истечении TTL; изменения через set_user_status сбрасывают запись сразу
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, ttl: float = USER_CONTEXT_TTL, maxsize: int = 100000):
+        self.session_factory = session_factory
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    async def resolve(self, user_id: int, username: str = None) -> UserContext:
+        """Пользователь апдейта: создается при первом обращении, активность пишется с ограничением частоты"""
+        context = self._cache.get(user_id)
+        if context is not None and (not username or context.username == username):
+            if interaction_write_due(user_id):
+                async with self.session_factory() as session:
+                    await update_last_interaction(session, user_id)
+                    await session.commit()
+            return context
+
+        async with self.session_factory() as session:
+            user = await get_or_create_user(
+                session=session,
+                user_id=user_id,
+                username=username,
+                touch=interaction_write_due(user_id)
+            )
+            context = UserContext.from_user(user)
+
+        self._cache.set(user_id, context)
+        return context
+
+    async def get(self, user_id: int) -> Optional[UserContext]:
+        """Только чтение (без создания пользователя); None, если пользователя нет"""
+        context = self._cache.get(user_id)
+        if context is not None:
+            return context
+
+        async with self.session_factory() as session:
+            user = await session.get(User, user_id)
+        if user is None:
+            return None
+
+        context = UserContext.from_user(user)
+        self._cache.set(user_id, context)
+        return context
+
+    def invalidate(self, user_id: int) -> None:
+        self._cache.pop(user_id)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+# Единственный экземпляр на процесс
+user_contexts = UserContextCache()
@@ -1,18 +1,29 @@
 import logging
 from datetime import datetime
 from sqlalchemy import select, func, and_, update
-from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from core.database.models import User, UserStat, UserProgress, Topic, Subtopic
+from core.database.models import User, UserStat, UserProgress, UserSubtopicStat, UserStatus
+from core.services.subtopic_stats import record_subtopic_answer
+from core.utils.cache import LRUCache
+from config.settings import LAST_INTERACTION_WRITE_INTERVAL
 
 
 logger = logging.getLogger(__name__)
 
+# user_id -> отметка о недавней записи last_interaction_time
+_interaction_writes = LRUCache(maxsize=100000, ttl=LAST_INTERACTION_WRITE_INTERVAL)
 
-async def get_or_create_user(session: AsyncSession, user_id: int, username: str = None) -> User:
+
+async def get_or_create_user(
+    session: AsyncSession,
+    user_id: int,
+    username: str = None,
+    touch: bool = True
+) -> User:
     """
-    Получает или создает пользователя с начальной статистикой и прогрессом
+    Получает или создает пользователя с начальной статистикой и прогрессом.
+    touch=False - не обновлять last_interaction_time (запись уже была недавно)
     """
     try:
         # 1. Получаем или создаем пользователя
@@ -49,14 +60,24 @@ async def get_or_create_user(session: AsyncSession, user_id: int, username: str
             logger.info(
                 f"Initial stats and progress created for user {user_id}")
 
-            # 4. Инициализируем статистику по подтемам (опционально)
-            await initialize_subtopic_stats(session, user_id)
+            # Статистика по подтемам не заполняется заранее: строка счетчика
+            # появляется при первом ответе по подтеме
+            mark_interaction_written(user_id)
         else:
-            logger.info(f"Updating existing user {user_id}")
-            user.last_interaction_time = datetime.utcnow()
+            changed = False
+            if touch:
+                user.last_interaction_time = datetime.utcnow()
+                mark_interaction_written(user_id)
+                changed = True
             if username and user.username != username:
                 user.username = username
-            await session.commit()
+                changed = True
+            if user.blocked_at is not None:
+                # Пользователь снова пишет боту - значит, разблокировал его
+                user.blocked_at = None
+                changed = True
+            if changed:
+                await session.commit()
 
         return user
 
@@ -72,48 +93,6 @@ async def get_or_create_user(session: AsyncSession, user_id: int, username: str
         raise
 
 
-async def initialize_subtopic_stats(session: AsyncSession, user_id: int):
-    """
-    Инициализирует статистику по всем подтемам для нового пользователя
-    """
-    try:
-        subtopics = await session.execute(select(Subtopic))
-        subtopics = subtopics.scalars().all()
-
-        if not subtopics:
-            logger.warning("No subtopics found in database!")
-            return
-
-        user_stat = await session.get(UserStat, user_id)
-        if not user_stat:
-            logger.error(f"UserStat not found for user {user_id}")
-            return
-
-        # Инициализируем нулевые значения для всех подтем
-        for subtopic in subtopics:
-            if str(subtopic.id) not in user_stat.subtopics_stats:
-                user_stat.subtopics_stats[str(subtopic.id)] = {
-                    "correct": 0,
-                    "wrong": 0
-                }
-
-        logger.debug(f"Before flag_modified: {user_stat.subtopics_stats}")
-        flag_modified(user_stat, "subtopics_stats")
-        logger.debug(f"After flag_modified: {user_stat.subtopics_stats}")
-
-        # Помечаем поле как измененное
-        flag_modified(user_stat, "subtopics_stats")
-
-        await session.commit()
-        logger.info(f"Initialized subtopic stats for user {user_id}")
-
-    except SQLAlchemyError as e:
-        logger.error(
-            f"Database error in initialize_subtopic_stats: {str(e)}", exc_info=True)
-        await session.rollback()
-        raise
-
-
 async def update_user_stats(
     session: AsyncSession,
     user_id: int,
@@ -137,15 +116,7 @@ async def update_user_stats(
             100 if user_stat.total_attempts > 0 else 0
 
         # Обновляем статистику по подтеме
-        subtopic_key = str(subtopic_id)
-        if subtopic_key not in user_stat.subtopics_stats:
-            user_stat.subtopics_stats[subtopic_key] = {
-                "correct": 0, "wrong": 0}
-
-        if is_correct:
-            user_stat.subtopics_stats[subtopic_key]["correct"] += 1
-        else:
-            user_stat.subtopics_stats[subtopic_key]["wrong"] += 1
+        await record_subtopic_answer(session, user_id, subtopic_id, is_correct)
 
         await session.commit()
         logger.debug(
@@ -172,22 +143,63 @@ async def log_user_stats(session: AsyncSession, user_id: int):
         logger.debug(
             f"Total: correct={user_stat.correct_answers}, attempts={user_stat.total_attempts}, percentage={user_stat.percentage:.1f}%")
 
-        for subtopic_id, stats in user_stat.subtopics_stats.items():
+        subtopic_stats = (await session.execute(
+            select(UserSubtopicStat).where(UserSubtopicStat.user_id == user_id)
+        )).scalars().all()
+        for stats in subtopic_stats:
             logger.debug(
-                f"Subtopic {subtopic_id}: correct={stats['correct']}, wrong={stats['wrong']}")
+                f"Subtopic {stats.subtopic_id}: correct={stats.correct}, wrong={stats.wrong}")
 
-        return len(user_stat.subtopics_stats)
+        return len(subtopic_stats)
 
     except SQLAlchemyError as e:
         logger.error(f"Error logging stats for user {user_id}: {str(e)}")
         return 0
 
 
-async def update_last_interaction(session: AsyncSession, user_id: int):
-    """Обновляет время последней активности пользователя"""
+def interaction_write_due(user_id: int) -> bool:
+    """Пора ли снова записывать last_interaction_time (не чаще LAST_INTERACTION_WRITE_INTERVAL)"""
+    return user_id not in _interaction_writes
+
+
+def mark_interaction_written(user_id: int) -> None:
+    _interaction_writes.set(user_id, True)
+
+
+async def update_last_interaction(session: AsyncSession, user_id: int, force: bool = False):
+    """Обновляет время последней активности пользователя (с ограничением частоты записи)"""
+    if not force and not interaction_write_due(user_id):
+        return
+    mark_interaction_written(user_id)
+
     await session.execute(
         update(User)
         .where(User.id == user_id)
         .values(last_interaction_time=datetime.utcnow())
     )
     await session.flush()
+
+
+async def set_user_status(session: AsyncSession, user_id: int, status: UserStatus) -> bool:
+    """Меняет статус пользователя и сбрасывает закэшированную роль и место в рейтинге"""
+    from core.services.user_context import user_contexts
+    from core.services.rank_index import leaderboard, RANK_EXCLUDED_STATUSES
+
+    user = await session.get(User, user_id)
+    if user is None:
+        return False
+
+    user.status = status
+    await session.commit()
+    user_contexts.invalidate(user_id)
+
+    if status in RANK_EXCLUDED_STATUSES:
+        leaderboard.remove(user_id)
+    else:
+        progress = await session.get(UserProgress, user_id)
+        if progress:
+            leaderboard.update(
+                user_id, progress.total_points, progress.weekly_points, status)
+
+    logger.info(f"User {user_id} status changed to {status.value}")
+    return True
@@ -1,25 +1,19 @@
-from aiogram import types
-from functools import wraps
-import asyncio
-from typing import Callable, Any
+from dataclasses import dataclass
 
+from aiogram import flags
 
-def throttle(rate: float = 1.0):
-    def decorator(func: Callable):
-        last_called = 0
 
-        @wraps(func)
-        async def wrapped(*args, **kwargs):
-            nonlocal last_called
-            current_time = asyncio.get_event_loop().time()
+@dataclass(frozen=True)
+class ThrottleSpec:
+    rate: float  # Секунд между вызовами
+    burst: int = 1  # Сколько вызовов подряд разрешено без паузы
+    scope: str = 'user'  # 'user' - лимит на пользователя, 'chat' - на чат
 
-            if current_time - last_called < rate:
-                if isinstance(args[0], (types.Message, types.CallbackQuery)):
-                    await args[0].answer("⏳ Подождите перед повторным нажатием")
-                return
 
-            last_called = current_time
-            return await func(*args, **kwargs)
-
-        return wrapped
-    return decorator
+def throttle(rate: float = 1.0, burst: int = 1, scope: str = 'user'):
+    """
+    Не чаще одного вызова обработчика в rate секунд на пользователя (или чат).
+    Только помечает обработчик флагом - ограничивает ThrottlingMiddleware,
+    поэтому декоратор ставится под @router.message/@router.callback_query
+    """
+    return flags.throttle(ThrottleSpec(rate=rate, burst=burst, scope=scope))
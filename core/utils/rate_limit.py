@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import Callable, Hashable
+
+from core.utils.cache import LRUCache
+
+
+class TokenBucket:
+    """
+    Ведро токенов: в среднем rate операций в секунду, всплески до capacity.
+    pause() останавливает выдачу токенов (например, после 429 от Telegram)
+    """
+
+    def __init__(self, rate: float, capacity: float = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - max(self._updated, self._paused_until))
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = max(now, self._updated)
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        now = self.clock()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1.0) -> float:
+        """Сколько секунд ждать до появления tokens токенов"""
+        now = self.clock()
+        if now < self._paused_until:
+            return self._paused_until - now + tokens / self.rate
+        self._refill(now)
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        # Лок сохраняет порядок ожидающих и не дает им будить друг друга впустую
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep(self.delay(tokens))
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, self.clock() + seconds)
+        self._tokens = 0.0
+
+
+class KeyedRateLimiter:
+    """Отдельное ведро на каждый ключ (чат, пользователя), хранятся последние maxsize ключей"""
+
+    def __init__(self, rate: float, capacity: float = None, maxsize: int = 100000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._buckets = LRUCache(maxsize=maxsize)
+
+    def bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.capacity, clock=self.clock)
+            self._buckets.set(key, bucket)
+        return bucket
+
+    def try_acquire(self, key: Hashable, tokens: float = 1.0) -> bool:
+        return self.bucket(key).try_acquire(tokens)
+
+    async def acquire(self, key: Hashable, tokens: float = 1.0) -> None:
+        await self.bucket(key).acquire(tokens)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from aiogram import Bot
+from apscheduler.jobstores.base import BaseJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.schedulers.base import STATE_STOPPED
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import update, or_
+from sqlalchemy.exc import IntegrityError
+
+from config.database import AsyncSessionLocal, DB_URL
+from config.settings import (
+    SCHEDULER_JOBSTORE_URL,
+    SCHEDULER_LEASE_TTL,
+    SCHEDULER_TIMEZONE
+)
+from core.database.models import SchedulerLease
+from core.services.reminder_service import ReminderService
+from core.services.stats_service import close_week
+
+logger = logging.getLogger(__name__)
+
+
+# Задачи хранятся в БД ссылкой на функцию, поэтому бот передается не аргументом,
+# а через модуль
+_bot: Optional[Bot] = None
+
+
+async def send_reminders_job():
+    results = await ReminderService(_bot).send_reminders()
+    logger.info(f"Reminders sent: {results}")
+
+
+async def close_week_job():
+    async with AsyncSessionLocal() as session:
+        count = await close_week(session)
+    logger.info(f"Weekly points reset for {count} users")
+
+
+@dataclass(frozen=True)
+class JobSpec:
+    id: str
+    func: Callable
+    trigger: dict  # Поля CronTrigger
+    misfire_grace_time: int  # Сколько секунд после пропуска задачу еще можно догнать
+
+
+JOBS = [
+    # Окна напоминаний ±1 час, поэтому пропущенный запуск догоняем в пределах получаса
+    JobSpec('send_reminders', send_reminders_job, {'minute': 0}, 30 * 60),
+    # Неделю закрываем даже после долгого простоя: close_week не повторяет сброс
+    JobSpec('close_week', close_week_job, {'day_of_week': 'mon', 'hour': 0, 'minute': 0}, 3 * 24 * 3600),
+]
+
+
+def default_jobstore_url() -> str:
+    # APScheduler 3 работает с синхронным драйвером
+    return (SCHEDULER_JOBSTORE_URL or os.getenv('DB_FULL_URL')
+            or DB_URL.replace('+aiomysql', '+pymysql'))
+
+
+class LeaderLease:
+    """
+    Аренда роли ведущего в таблице scheduler_leases. Владелец продлевает ее
+    каждую треть срока; если он пропал, после истечения срока роль забирает
+    другая реплика. Часы реплик должны быть синхронизированы
+    """
+
+    def __init__(self, name: str = 'scheduler', ttl: float = SCHEDULER_LEASE_TTL,
+                 session_factory=AsyncSessionLocal, owner: str = None):
+        self.name = name
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    @property
+    def renew_interval(self) -> float:
+        return self.ttl / 3
+
+    async def try_acquire(self) -> bool:
+        """Захватывает или продлевает аренду; True, если процесс - ведущий"""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        try:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    result = await session.execute(
+                        update(SchedulerLease)
+                        .where(
+                            SchedulerLease.name == self.name,
+                            or_(SchedulerLease.owner == self.owner,
+                                SchedulerLease.expires_at < now)
+                        )
+                        .values(owner=self.owner, expires_at=expires_at)
+                    )
+                    if result.rowcount:
+                        return True
+                    if await session.get(SchedulerLease, self.name) is not None:
+                        return False
+                    session.add(SchedulerLease(name=self.name, owner=self.owner, expires_at=expires_at))
+            return True
+        except IntegrityError:
+            # Другая реплика создала запись одновременно с нами
+            return False
+
+    async def release(self) -> None:
+        async with self.session_factory() as session:
+            async with session.begin():
+                await session.execute(
+                    update(SchedulerLease)
+                    .where(SchedulerLease.name == self.name, SchedulerLease.owner == self.owner)
+                    .values(expires_at=datetime.utcnow())
+                )
+
+
+class JobScheduler:
+    """
+    Задачи по расписанию (cron) с хранением в БД. Работают во всех репликах,
+    но задачи выполняет только ведущая; при потере аренды планировщик ставится
+    на паузу. Пропущенные запуски догоняются в пределах misfire_grace_time,
+    несколько пропусков подряд выполняются один раз (coalesce)
+    """
+
+    def __init__(self, bot: Bot, jobstore: BaseJobStore = None, lease: LeaderLease = None,
+                 jobs: list[JobSpec] = None, timezone: str = SCHEDULER_TIMEZONE):
+        global _bot
+        _bot = bot
+        self.jobs = JOBS if jobs is None else jobs
+        self.timezone = timezone
+        self.lease = lease or LeaderLease()
+        self.scheduler = AsyncIOScheduler(
+            jobstores={'default': jobstore or SQLAlchemyJobStore(
+                url=default_jobstore_url(), tablename='scheduler_jobs')},
+            job_defaults={'coalesce': True, 'max_instances': 1},
+            timezone=timezone
+        )
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.scheduler.state != STATE_STOPPED:
+            self.scheduler.shutdown(wait=False)
+        if self.is_leader:
+            self.is_leader = False
+            try:
+                await self.lease.release()
+            except Exception as e:
+                logger.error(f"Scheduler lease release failed: {e}")
+        logger.info("Scheduler stopped")
+
+    async def _run(self):
+        while True:
+            try:
+                leader = await self.lease.try_acquire()
+            except Exception as e:
+                # Без связи с БД аренду не продлить - уступаем роль
+                logger.error(f"Scheduler lease check failed: {e}")
+                leader = False
+
+            try:
+                if leader and not self.is_leader:
+                    self.activate()
+                elif not leader and self.is_leader:
+                    self.deactivate()
+            except Exception as e:
+                logger.error(f"Scheduler state change failed: {e}")
+
+            await asyncio.sleep(self.lease.renew_interval)
+
+    def activate(self):
+        """Процесс стал ведущим: загружаем задачи и начинаем их выполнять"""
+        if self.scheduler.state == STATE_STOPPED:
+            self.scheduler.start(paused=True)
+        self.sync_jobs()
+        self.scheduler.resume()
+        self.is_leader = True
+        logger.info(f"Scheduler leader: {self.lease.owner}")
+
+    def deactivate(self):
+        self.scheduler.pause()
+        self.is_leader = False
+        logger.info(f"Scheduler lost leadership: {self.lease.owner}")
+
+    def sync_jobs(self):
+        """
+        Приводит хранилище к списку jobs. Существующие задачи не пересоздаются:
+        иначе сохраненное время следующего запуска пересчиталось бы от текущего
+        момента и пропущенный запуск (например, сброс недели) был бы потерян
+        """
+        wanted = {spec.id: spec for spec in self.jobs}
+
+        for job in self.scheduler.get_jobs():
+            if job.id not in wanted:
+                job.remove()
+                logger.info(f"Removed obsolete job {job.id}")
+
+        for spec in wanted.values():
+            trigger = CronTrigger(timezone=self.timezone, **spec.trigger)
+            job = self.scheduler.get_job(spec.id)
+            if job is None:
+                self.scheduler.add_job(spec.func, trigger, id=spec.id, name=spec.id,
+                                       misfire_grace_time=spec.misfire_grace_time)
+                logger.info(f"Scheduled job {spec.id}: {trigger}")
+            elif repr(job.trigger) != repr(trigger):
+                job.reschedule(trigger)
+                logger.info(f"Rescheduled job {spec.id}: {trigger}")
+            elif job.misfire_grace_time != spec.misfire_grace_time:
+                job.modify(misfire_grace_time=spec.misfire_grace_time)
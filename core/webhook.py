@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiohttp import web
+
+from config.settings import (
+    WEBHOOK_BASE_URL,
+    WEBHOOK_DRAIN_TIMEOUT,
+    WEBHOOK_PATH,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_SECRET,
+    WEBHOOK_WORKERS
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def update_routing_key(update: dict) -> int:
+    """Пользователь (или чат) апдейта: его апдейты обрабатываются по порядку"""
+    for key, payload in update.items():
+        if key != 'update_id' and isinstance(payload, dict):
+            sender = payload.get('from') or payload.get('chat') or payload.get('user') or {}
+            if 'id' in sender:
+                return sender['id']
+    return update.get('update_id', 0)
+
+
+@dataclass
+class WebhookMetrics:
+    received: int = 0
+    processed: int = 0
+    failed: int = 0
+    rejected: int = 0  # Неверный секрет или остановка сервера
+
+
+class WebhookServer:
+    """
+    Приём апдейтов через webhook. Запрос проверяется по секретному заголовку,
+    апдейт ставится в очередь и Telegram сразу получает 200. Очередей столько
+    же, сколько обработчиков; апдейты одного пользователя всегда попадают в одну
+    очередь, поэтому обрабатываются последовательно, а разных - параллельно.
+    При остановке новые запросы получают 503 (Telegram их повторит), а
+    принятые апдейты дорабатываются в пределах drain_timeout.
+    Без секрета сервер не создается: иначе апдейты мог бы прислать кто угодно
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: Optional[str] = WEBHOOK_SECRET,
+        workers: int = WEBHOOK_WORKERS,
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+        drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT,
+        path: str = WEBHOOK_PATH,
+        **data: Any
+    ):
+        if not secret_token:
+            raise ValueError("Webhook secret token is required")
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret_token = secret_token
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self.path = path
+        self.data = data  # Дополнительные данные для обработчиков
+        self.metrics = WebhookMetrics()
+
+        self.accepting = False
+        self._queues = [asyncio.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self._tasks: list[asyncio.Task] = []
+
+    # -------------| Приложение |------------- #
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+        return app
+
+    async def _on_startup(self, app: web.Application) -> None:
+        await self.dispatcher.emit_startup(bot=self.bot, dispatcher=self.dispatcher, **self.data)
+        await self.start()
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        await self.stop()
+        await self.dispatcher.emit_shutdown(bot=self.bot, dispatcher=self.dispatcher, **self.data)
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+        self.accepting = True
+        logger.info(f"Webhook server started with {self.workers} workers")
+
+    async def stop(self) -> None:
+        """Перестает принимать апдейты и дожидается обработки принятых"""
+        self.accepting = False
+        pending = self.queue_depth
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                timeout=self.drain_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Webhook drain timed out, {self.queue_depth} updates dropped")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Webhook server stopped, drained {pending} pending updates")
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def set_webhook(self, base_url: str = WEBHOOK_BASE_URL) -> None:
+        await self.bot.set_webhook(
+            url=base_url.rstrip('/') + self.path,
+            secret_token=self.secret_token,
+            allowed_updates=self.dispatcher.resolve_used_update_types(),
+            max_connections=min(100, self.workers)
+        )
+
+    # -------------| Обработка |------------- #
+
+    def _authorized(self, request: web.Request) -> bool:
+        return secrets.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret_token)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            self.metrics.rejected += 1
+            return web.Response(status=401)
+        if not self.accepting:
+            self.metrics.rejected += 1
+            return web.Response(status=503)
+
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        self.metrics.received += 1
+        queue = self._queues[update_routing_key(update) % self.workers]
+        # Полная очередь задерживает ответ - Telegram сам снизит темп
+        await queue.put(update)
+        return web.Response()
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            update = await queue.get()
+            try:
+                result = await self.dispatcher.feed_raw_update(bot=self.bot, update=update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=self.bot, result=result)
+                self.metrics.processed += 1
+            except Exception as e:
+                self.metrics.failed += 1
+                logger.error(f"Error processing update {update.get('update_id')}: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+
+def run_webhook(dispatcher: Dispatcher, bot: Bot, host: str, port: int) -> None:
+    """
+    Запускает aiohttp-сервер; регистрирует webhook в Telegram, если задан WEBHOOK_BASE_URL.
+    Без WEBHOOK_SECRET секрет генерируется при регистрации, а если webhook
+    регистрируется снаружи (WEBHOOK_BASE_URL пуст) - сервер не запускается
+    """
+    secret_token = WEBHOOK_SECRET
+    if not secret_token:
+        if not WEBHOOK_BASE_URL:
+            raise RuntimeError("WEBHOOK_SECRET is required when WEBHOOK_BASE_URL is not set")
+        secret_token = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET is not set, using a generated secret")
+
+    server = WebhookServer(dispatcher, bot, secret_token=secret_token)
+    app = server.create_app()
+
+    if WEBHOOK_BASE_URL:
+        async def register_webhook(app: web.Application) -> None:
+            await server.set_webhook()
+            logger.info(f"Webhook set to {WEBHOOK_BASE_URL}{server.path}")
+        app.on_startup.append(register_webhook)
+
+    async def close_session(app: web.Application) -> None:
+        await bot.session.close()
+    app.on_cleanup.append(close_session)
+
+    started = time.monotonic()
+    web.run_app(app, host=host, port=port, shutdown_timeout=WEBHOOK_DRAIN_TIMEOUT)
+    logger.info(f"Webhook server ran for {time.monotonic() - started:.0f}s: {server.metrics}")
@@ -15,6 +15,11 @@ def get_url():
     return os.getenv('DB_FULL_URL') or config.get_main_option("sqlalchemy.url")
 
 
+def include_object(obj, name, type_, reflected, compare_to):
+    """Таблица задач APScheduler не описана в моделях - не трогаем ее"""
+    return not (type_ == 'table' and name == 'scheduler_jobs')
+
+
 def run_migrations_online():
     """Run migrations in 'online' mode."""
     connectable = create_engine(
@@ -27,7 +32,8 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             compare_type=True,
-            compare_server_default=True
+            compare_server_default=True,
+            include_object=include_object
         )
 
         with context.begin_transaction():
@@ -0,0 +1,35 @@
+"""add indexes on user_progress points
+
+Revision ID: 3b9d1c7a5e21
+Revises: dc8dff978f19
+Create Date: 2026-10-18 10:12:40.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9d1c7a5e21'
+down_revision: Union[str, Sequence[str], None] = 'dc8dff978f19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Рейтинги в get_user_stats считают «сколько пользователей выше» по этим колонкам
+    op.create_index(op.f('ix_user_progress_total_points'),
+                    'user_progress', ['total_points'], unique=False)
+    op.create_index(op.f('ix_user_progress_weekly_points'),
+                    'user_progress', ['weekly_points'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_user_progress_weekly_points'),
+                  table_name='user_progress')
+    op.drop_index(op.f('ix_user_progress_total_points'),
+                  table_name='user_progress')
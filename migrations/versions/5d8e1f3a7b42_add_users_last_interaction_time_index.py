@@ -0,0 +1,30 @@
+"""add index on users.last_interaction_time
+
+Revision ID: 5d8e1f3a7b42
+Revises: 9a4f6b2c8e10
+Create Date: 2026-10-18 16:48:03.551270
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8e1f3a7b42'
+down_revision: Union[str, Sequence[str], None] = '9a4f6b2c8e10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Напоминания выбирают пользователей диапазоном по времени последней активности
+    op.create_index(op.f('ix_users_last_interaction_time'),
+                    'users', ['last_interaction_time'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_last_interaction_time'), table_name='users')
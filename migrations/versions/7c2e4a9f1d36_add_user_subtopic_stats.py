@@ -0,0 +1,39 @@
+"""add user_subtopic_stats counters
+
+Revision ID: 7c2e4a9f1d36
+Revises: 3b9d1c7a5e21
+Create Date: 2026-10-18 14:03:11.542190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e4a9f1d36'
+down_revision: Union[str, Sequence[str], None] = '3b9d1c7a5e21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Данные из user_stats.subtopics_stats переносятся командой /backfill_subtopic_stats
+    op.create_table('user_subtopic_stats',
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('subtopic_id', sa.Integer(), nullable=False),
+                    sa.Column('correct', sa.Integer(), nullable=False,
+                              server_default='0'),
+                    sa.Column('wrong', sa.Integer(), nullable=False,
+                              server_default='0'),
+                    sa.ForeignKeyConstraint(['subtopic_id'], ['subtopics.id'], ),
+                    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+                    sa.PrimaryKeyConstraint('user_id', 'subtopic_id')
+                    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_subtopic_stats')
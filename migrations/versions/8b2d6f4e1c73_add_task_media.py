@@ -0,0 +1,34 @@
+"""add task_media
+
+Revision ID: 8b2d6f4e1c73
+Revises: e3b7c9d2a615
+Create Date: 2026-10-18 19:12:40.512306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2d6f4e1c73'
+down_revision: Union[str, Sequence[str], None] = 'e3b7c9d2a615'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('task_media',
+                    sa.Column('url_hash', sa.String(length=64), nullable=False),
+                    sa.Column('url', sa.Text(), nullable=False),
+                    sa.Column('file_id', sa.String(length=255), nullable=False),
+                    sa.Column('uploaded_at', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('url_hash')
+                    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('task_media')
@@ -0,0 +1,45 @@
+"""add broadcasts and users.blocked_at
+
+Revision ID: 9a4f6b2c8e10
+Revises: 7c2e4a9f1d36
+Create Date: 2026-10-18 15:27:45.913402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4f6b2c8e10'
+down_revision: Union[str, Sequence[str], None] = '7c2e4a9f1d36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column(
+        'blocked_at', sa.DateTime(), nullable=True))
+    op.create_table('broadcasts',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('text', sa.Text(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(), nullable=True),
+                    sa.Column('finished_at', sa.DateTime(), nullable=True),
+                    sa.Column('last_user_id', sa.Integer(),
+                              nullable=False, server_default='0'),
+                    sa.Column('sent', sa.Integer(),
+                              nullable=False, server_default='0'),
+                    sa.Column('failed', sa.Integer(),
+                              nullable=False, server_default='0'),
+                    sa.Column('blocked', sa.Integer(),
+                              nullable=False, server_default='0'),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('broadcasts')
+    op.drop_column('users', 'blocked_at')
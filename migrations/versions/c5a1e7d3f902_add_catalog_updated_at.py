@@ -0,0 +1,42 @@
+"""add updated_at to catalog tables
+
+Revision ID: c5a1e7d3f902
+Revises: 8b2d6f4e1c73
+Create Date: 2026-10-18 21:04:27.318540
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a1e7d3f902'
+down_revision: Union[str, Sequence[str], None] = '8b2d6f4e1c73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CATALOG_TABLES = ('tasks', 'subtopics', 'topics', 'theories')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Время обновляет сама БД, поэтому правки напрямую в SQL тоже меняют отпечаток каталога.
+    # Микросекунды - чтобы две правки в одну секунду не дали одинаковый max(updated_at)
+    for table in CATALOG_TABLES:
+        op.add_column(table, sa.Column(
+            'updated_at',
+            mysql.DATETIME(fsp=6),
+            server_default=sa.text('CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)'),
+            nullable=True
+        ))
+    op.create_index(op.f('ix_tasks_updated_at'), 'tasks', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_tasks_updated_at'), table_name='tasks')
+    for table in CATALOG_TABLES:
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,34 @@
+"""add scheduler_leases
+
+Revision ID: e3b7c9d2a615
+Revises: 5d8e1f3a7b42
+Create Date: 2026-10-18 17:35:12.084417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b7c9d2a615'
+down_revision: Union[str, Sequence[str], None] = '5d8e1f3a7b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблицу задач (scheduler_jobs) APScheduler создает сам при запуске
+    op.create_table('scheduler_leases',
+                    sa.Column('name', sa.String(length=50), nullable=False),
+                    sa.Column('owner', sa.String(length=100), nullable=False),
+                    sa.Column('expires_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('name')
+                    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('scheduler_leases')
@@ -1,4 +1,4 @@
-from core import run_bot
+from core.bot import run_bot
 
 if __name__ == '__main__':
     run_bot()
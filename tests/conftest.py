@@ -0,0 +1,11 @@
+import os
+
+# config.settings и config.database читают переменные окружения при импорте
+os.environ.setdefault("BOT_TOKEN", "123456789:AAHjKLMNopQRsTuVWXyZ-1234567890_abcDE")
+os.environ.setdefault("DB_HOST", "127.0.0.1")
+os.environ.setdefault("DB_PORT", "3306")
+os.environ.setdefault("DB_USER", "bot_name")
+os.environ.setdefault("DB_PASSWORD", "password_bot")
+os.environ.setdefault("DB_NAME", "db_name")
+os.environ.setdefault("ADMIN_USER_ID", "1")
+os.environ.setdefault("LEADS_TOKEN", "9999999999:AAHjKLMNopQRsTuVWXyZ-1234567890_abcDE")
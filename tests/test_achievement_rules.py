@@ -0,0 +1,164 @@
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from core.database.hooks import discard_after_rollback, run_after_commit
+from core.services import achievement_service
+from core.services.achievement_rules import (
+    AchievementRuleBook,
+    UnlockedAchievementsCache,
+    UserSnapshot,
+    compile_conditions,
+    count_unlocked
+)
+
+
+def make_achievement(id, conditions, reward_points=10):
+    return SimpleNamespace(
+        id=id,
+        name=f"a{id}",
+        description=f"d{id}",
+        reward_points=reward_points,
+        conditions=conditions
+    )
+
+
+def make_snapshot(**overrides):
+    values = dict(
+        solved_tasks=10,
+        correct_answers=8,
+        correct_percentage=80.0,
+        daily_streak=3,
+        total_points=500,
+        is_correct=True,
+        topic_id=3,
+        subtopic_id=12,
+        type_number=5
+    )
+    values.update(overrides)
+    return UserSnapshot(**values)
+
+
+@pytest.mark.parametrize("conditions", [
+    "solved_tasks >= 10 AND topic_id = 3",
+    "solved_tasks>=10 and topic_id=3",
+    "SOLVED_TASKS >= 10   AND   TOPIC_ID == 3",
+])
+def test_compound_formats(conditions):
+    predicates = compile_conditions(conditions)
+    assert [p.field for p in predicates] == ["solved_tasks", "topic_id"]
+    assert all(p(make_snapshot()) for p in predicates)
+    assert not all(p(make_snapshot(topic_id=4)) for p in predicates)
+
+
+@pytest.mark.parametrize("conditions", [
+    "", "solved_tasks", "unknown_metric > 1", "solved_tasks >= ten"
+])
+def test_unsupported_conditions(conditions):
+    assert compile_conditions(conditions) is None
+
+
+def test_rule_book_indexes_by_metric():
+    book = AchievementRuleBook()
+    book.build([
+        make_achievement(1, "solved_tasks >= 10"),
+        make_achievement(2, "correct_answers >= 5 AND subtopic_id = 12"),
+        make_achievement(3, "topic_id = 3"),
+        make_achievement(4, "broken"),
+    ])
+
+    assert (book.total(), len(book.rules)) == (4, 3)
+    assert {r.achievement.id for r in book.candidates({"solved_tasks"})} == {1, 3}
+    assert {r.achievement.id for r in book.candidates()} == {1, 2, 3}
+
+
+def test_task_filter_without_task_never_matches():
+    book = AchievementRuleBook()
+    book.build([make_achievement(1, "topic_id = 3")])
+    rule = book.rules[1]
+    assert rule.matches(make_snapshot())
+    assert not rule.matches(make_snapshot(topic_id=None))
+
+
+@pytest.mark.asyncio
+async def test_check_and_unlock_uses_constant_queries(monkeypatch):
+    book = AchievementRuleBook()
+    book.build([make_achievement(i, f"solved_tasks >= {i}") for i in range(1, 51)])
+    monkeypatch.setattr(achievement_service, "achievement_rules", book)
+    cache = UnlockedAchievementsCache()
+    monkeypatch.setattr(achievement_service, "unlocked_achievements", cache)
+
+    stat = SimpleNamespace(total_attempts=20, correct_answers=15, percentage=75.0)
+    progress = SimpleNamespace(
+        total_points=100, weekly_points=10, current_streak=1)
+
+    async def get(model, user_id, **kwargs):
+        return stat if model is achievement_service.UserStat else progress
+
+    unlocked_rows = MagicMock()
+    unlocked_rows.all.return_value = [
+        SimpleNamespace(achievement_id=1, unlocked_at=datetime(2024, 1, 1)),
+        SimpleNamespace(achievement_id=2, unlocked_at=datetime(2024, 1, 2)),
+    ]
+    session = MagicMock()
+    session.get = AsyncMock(side_effect=get)
+    session.execute = AsyncMock(return_value=unlocked_rows)
+    session.flush = AsyncMock()
+    session.info = {}
+
+    unlocked = await achievement_service.check_and_unlock_achievements(
+        session, user_id=7, is_correct=True,
+        task=SimpleNamespace(topic_id=1, subtopic_id=2, type_number=3)
+    )
+
+    assert sorted(a.id for a in unlocked) == list(range(3, 21))
+    assert session.execute.await_count == 1
+    assert session.add.call_count == 18 + 1  # + user_progress в add_achievement_reward
+    assert progress.total_points == 100 + 18 * 10
+
+    # До коммита новые достижения видны только своей транзакции
+    again = await achievement_service.check_and_unlock_achievements(
+        session, user_id=7, is_correct=True)
+    assert again == []
+    assert count_unlocked(await cache.get(MagicMock(info={}), 7)) == 2
+
+    # После коммита набор пользователя дополнен, повторная проверка не ходит в БД
+    run_after_commit(session)
+    assert count_unlocked(await cache.get(session, 7)) == 20
+    assert session.execute.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_unlocks_do_not_reach_cache():
+    cache = UnlockedAchievementsCache()
+    rows = MagicMock()
+    rows.all.return_value = []
+    session = MagicMock(info={})
+    session.execute = AsyncMock(return_value=rows)
+
+    await cache.get(session, 7)
+    cache.record(session, 7, [3, 4], datetime(2024, 1, 3))
+    assert set(await cache.get(session, 7)) == {3, 4}
+
+    discard_after_rollback(session)
+    assert set(await cache.get(session, 7)) == set()
+
+
+@pytest.mark.asyncio
+async def test_unlocked_cache_loads_once_and_ignores_unknown_users():
+    rows = MagicMock()
+    rows.all.return_value = [
+        SimpleNamespace(achievement_id=5, unlocked_at=None)]
+    session = MagicMock()
+    session.execute = AsyncMock(return_value=rows)
+    cache = UnlockedAchievementsCache(maxsize=2)
+
+    cache.add(1, [9], datetime(2024, 1, 1))  # Не загружен - не кэшируем частичный набор
+    unlocked = await cache.get(session, 1)
+    assert dict(unlocked) == {5: None}
+    assert count_unlocked(unlocked) == 0
+
+    cache.add(1, [9], datetime(2024, 1, 1))
+    assert set(await cache.get(session, 1)) == {5, 9}
+    assert session.execute.await_count == 1
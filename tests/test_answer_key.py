@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+from core.services.answer_key import AnswerKeyCache, compile_answer_key
+
+
+def make_key(correct_answer, answer_options=None):
+    return compile_answer_key(SimpleNamespace(
+        id=1,
+        correct_answer=correct_answer,
+        answer_options=answer_options or []
+    ))
+
+
+def test_text_normalization():
+    key = make_key("Диффузия")
+    assert key.matches("  диффузия ")
+    assert not key.matches("конвекция")
+
+
+def test_decimal_comma_and_trailing_zeros():
+    key = make_key("2,5")
+    assert key.matches("2.5")
+    assert key.matches("2,50")
+    assert not key.matches("2.6")
+
+
+def test_units_are_optional_and_converted():
+    key = make_key("2.5 м/с")
+    assert key.matches("2,5")
+    assert key.matches("2.5 m/s")
+    assert key.matches("9 км/ч")
+    assert not key.matches("2.5 м")
+
+
+def test_text_after_number_is_not_ignored():
+    assert not make_key("12").matches("12abc")
+    assert not make_key("12").matches("12 кг")
+    assert not make_key("20").matches("20 что угодно")
+    assert not make_key("2.5 м/с").matches("2.5 попугаев")
+
+
+def test_unknown_unit_in_key_compares_as_string():
+    key = make_key("1 2 3")
+    assert key.number is None
+    assert not key.matches("1")
+    assert key.matches("1  2 3")
+
+
+def test_digit_sequences_compare_as_strings():
+    key = make_key("315")
+    assert key.matches("315")
+    assert not key.matches("0315")
+    assert not key.matches("351")
+
+
+def test_option_index():
+    key = make_key("3", ["1", "2", "3", "4"])
+    assert key.option_index == 2
+    assert key.matches_option(2)
+    assert not key.matches_option(0)
+    assert not key.matches_option(10)
+
+
+def test_cache_recompiles_edited_answer():
+    cache = AnswerKeyCache()
+    row = SimpleNamespace(id=7, correct_answer="1", answer_options=["1", "2"])
+
+    key = cache.get_for(row)
+    assert key.matches_option(0)
+    assert cache.get_for(SimpleNamespace(**vars(row))) is key
+
+    # Ответ исправили в БД - ключ компилируется заново
+    edited = cache.get_for(SimpleNamespace(**{**vars(row), "correct_answer": "2"}))
+    assert edited.matches_option(1)
+    assert not edited.matches_option(0)
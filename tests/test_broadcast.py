@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from core.services.broadcast import BroadcastEngine, BroadcastReport
+from core.services.delivery import RateLimitedSender
+from core.utils.rate_limit import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_rate_and_pause():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert bucket.delay() == pytest.approx(0.5)
+
+    clock.now = 0.5
+    assert bucket.try_acquire()
+
+    bucket.pause(3)
+    clock.now = 3.4
+    assert not bucket.try_acquire()
+    clock.now = 4.0
+    assert bucket.try_acquire()
+
+
+class FakeBot:
+    """Бот без сети: blocked - заблокировавшие бота, flood_on - номера вызовов с 429"""
+
+    def __init__(self, blocked=(), flood_on=()):
+        self.blocked = set(blocked)
+        self.flood_on = set(flood_on)
+        self.calls = 0
+        self.delivered = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(0)
+        if call in self.flood_on:
+            raise TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=0.05)
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(method=None, message="bot was blocked by the user")
+        self.delivered.append(chat_id)
+
+
+class MemoryStore:
+    def __init__(self, user_ids, crash_on_checkpoint=None):
+        self.user_ids = sorted(user_ids)
+        self.blocked = set()
+        self.row = None
+        self.checkpoints = 0
+        self.crash_on_checkpoint = crash_on_checkpoint
+
+    async def create(self, text):
+        self.row = BroadcastReport(broadcast_id=1, text=text)
+        return BroadcastReport(broadcast_id=1, text=text)
+
+    async def get(self, broadcast_id=None):
+        r = self.row
+        return BroadcastReport(r.broadcast_id, r.text, r.last_user_id, r.sent,
+                               r.failed, r.blocked, r.finished)
+
+    async def fetch_user_ids(self, after_id, limit):
+        return [u for u in self.user_ids if u > after_id and u not in self.blocked][:limit]
+
+    async def save_checkpoint(self, report, blocked_ids=()):
+        self.checkpoints += 1
+        if self.checkpoints == self.crash_on_checkpoint:
+            raise RuntimeError("process killed")
+        self.blocked.update(blocked_ids)
+        self.row = BroadcastReport(report.broadcast_id, report.text, report.last_user_id,
+                                   report.sent, report.failed, report.blocked, report.finished)
+
+
+def make_engine(bot, store, page_size=10):
+    sender = RateLimitedSender(bot, rate=10_000, per_chat_rate=10_000, retry_delay=0)
+    return BroadcastEngine(store=store, sender=sender, concurrency=5, page_size=page_size)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_marks_blocked_and_retries_after_flood():
+    bot = FakeBot(blocked={3, 7}, flood_on={5})
+    store = MemoryStore(range(1, 26))
+    engine = make_engine(bot, store)
+
+    report = await engine.start("hi")
+
+    assert report.finished
+    assert (report.sent, report.blocked, report.failed) == (23, 2, 0)
+    assert store.blocked == {3, 7}
+    assert sorted(bot.delivered) == [u for u in range(1, 26) if u not in (3, 7)]
+    assert engine.sender.retry_after_count == 1
+
+
+@pytest.mark.asyncio
+async def test_broadcast_resumes_from_checkpoint():
+    bot = FakeBot()
+    store = MemoryStore(range(1, 31), crash_on_checkpoint=2)
+
+    with pytest.raises(RuntimeError):
+        await make_engine(bot, store).start("hi")
+    assert store.row.last_user_id == 10
+
+    report = await make_engine(bot, store).resume()
+    assert report.finished and report.last_user_id == 30
+    # Страница, не успевшая попасть в контрольную точку, отправляется повторно
+    assert sorted(set(bot.delivered)) == list(range(1, 31))
+    assert len(bot.delivered) == 40
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+from core.database.models import Complexity, PartNumber
+from core.keyboards.inline import CatalogKeyboards, _subtopics_kb, _types_kb
+from core.services.task_catalog import TaskCatalog
+from tests.test_task_catalog import make_task
+
+SUBTOPICS = [
+    SimpleNamespace(id=10, topic_id=1, name="kinematics", title_ru="Кинематика"),
+    SimpleNamespace(id=11, topic_id=1, name="dynamics", title_ru="Динамика"),
+    SimpleNamespace(id=12, topic_id=1, name="draft", title_ru=None),
+]
+
+
+def buttons(markup):
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+
+@pytest.fixture
+def catalog():
+    # session_factory=None: любое обращение к БД упадет
+    catalog = TaskCatalog(session_factory=None)
+    catalog.build([
+        make_task(1, 3, PartNumber.PART_ONE, subtopic_id=10),
+        make_task(2, 1, PartNumber.PART_ONE, subtopic_id=11, complexity=Complexity.HIGH),
+        make_task(3, 21, PartNumber.PART_TWO, subtopic_id=12, complexity=Complexity.HIGH),
+    ], subtopics=SUBTOPICS)
+    return catalog
+
+
+@pytest.mark.asyncio
+async def test_menus_are_built_from_catalog(catalog):
+    keyboards = CatalogKeyboards(catalog)
+
+    part_one = await keyboards.get('part_one', lambda c: _types_kb(c, PartNumber.PART_ONE, 'part_one'))
+    assert buttons(part_one) == ['part_one:1', 'part_one:3']
+    assert [len(row) for row in part_one.inline_keyboard] == [2]
+
+    topics = await keyboards.get('topics', lambda c: _subtopics_kb(c, 'subtopic'))
+    assert buttons(topics) == ['subtopic:10', 'subtopic:11']
+
+    difficult = await keyboards.get(
+        'difficult', lambda c: _subtopics_kb(c, 'difficult_subtopic', Complexity.HIGH))
+    assert buttons(difficult) == ['difficult_subtopic:11']
+
+
+@pytest.mark.asyncio
+async def test_menu_is_cached_until_catalog_changes(catalog):
+    keyboards = CatalogKeyboards(catalog)
+    builds = []
+
+    def build(c):
+        builds.append(c.generation)
+        return _types_kb(c, PartNumber.PART_TWO, 'part_two')
+
+    first = await keyboards.get('part_two', build)
+    assert await keyboards.get('part_two', build) is first
+    assert len(builds) == 1
+
+    catalog.build([make_task(4, 22, PartNumber.PART_TWO)], subtopics=SUBTOPICS)
+    rebuilt = await keyboards.get('part_two', build)
+    assert buttons(rebuilt) == ['part_two:22']
+    assert len(builds) == 2
@@ -0,0 +1,112 @@
+import json
+import random
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from core.fsm.states import TaskStates
+from core.fsm.storage import RedisStorage, SQLiteStorage, pack_data, unpack_data
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Локальная замена Redis: get/set(ex=)/delete со сроком жизни ключей"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.values = {}
+
+    async def get(self, key):
+        value, expires_at = self.values.get(key, (None, None))
+        if expires_at is not None and expires_at <= self.clock():
+            del self.values[key]
+            return None
+        return value
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = (value.encode(), self.clock() + ex if ex else None)
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+    async def aclose(self):
+        pass
+
+
+def test_task_list_is_packed_compactly():
+    task_ids = random.Random(1).sample(range(1, 60000), 300)
+    data = {'TASK_LIST': task_ids, 'CURRENT_INDEX': 5, 'CURRENT_PART': 'part_one',
+            'short': [1, 2], 'nested': {'ids': list(range(100000, 100020))}}
+
+    raw = pack_data(data)
+    assert unpack_data(raw) == data
+    # 2 байта на id против 5-6 символов в JSON
+    assert len(raw) < len(json.dumps(data)) / 2
+    assert unpack_data(None) == {}
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def make_storage(request, tmp_path):
+    clock = Clock()
+    redis = FakeRedis(clock)
+
+    def make(ttl=3600):
+        if request.param == 'sqlite':
+            return SQLiteStorage(path=str(tmp_path / 'fsm.sqlite3'), ttl=ttl, clock=clock)
+        return RedisStorage(redis, ttl=ttl)
+
+    make.clock = clock
+    return make
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(make_storage):
+    storage = make_storage()
+    context = FSMContext(bot=None, storage=storage, key=KEY)
+    await context.set_state(TaskStates.WAITING_ANSWER)
+    await context.update_data(TASK_LIST=list(range(10, 400)), CURRENT_INDEX=3)
+    await context.update_data(CURRENT_INDEX=4)
+    await storage.close()
+
+    # Новый процесс с тем же хранилищем
+    storage = make_storage()
+    context = FSMContext(bot=None, storage=storage, key=KEY)
+    assert await context.get_state() == TaskStates.WAITING_ANSWER.state
+    data = await context.get_data()
+    assert data == {'TASK_LIST': list(range(10, 400)), 'CURRENT_INDEX': 4}
+
+    await context.clear()
+    assert await context.get_state() is None
+    assert await context.get_data() == {}
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_idle_session_expires(make_storage):
+    storage = make_storage(ttl=60)
+    other = StorageKey(bot_id=1, chat_id=7, user_id=7)
+    await storage.set_state(None, KEY, TaskStates.WAITING_ANSWER)
+    await storage.set_data(None, KEY, {'CURRENT_INDEX': 1})
+
+    make_storage.clock.now += 30
+    await storage.set_data(None, other, {'CURRENT_INDEX': 2})
+    make_storage.clock.now += 31
+
+    assert await storage.get_state(None, KEY) is None
+    assert await storage.get_data(None, KEY) == {}
+    assert await storage.get_data(None, other) == {'CURRENT_INDEX': 2}
+
+    # После истечения запись начинается заново, старые данные не всплывают
+    await storage.set_state(None, KEY, TaskStates.SHOWING_RESULT)
+    assert await storage.get_data(None, KEY) == {}
+    await storage.close()
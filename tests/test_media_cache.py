@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+
+from core.services.media_cache import MediaCache
+
+URL = 'https://example.com/tasks/1.png'
+
+
+def _session_factory(rows=()):
+    session = AsyncMock()
+    session.__aenter__.return_value = session
+    session.execute.return_value = MagicMock(all=MagicMock(return_value=list(rows)))
+    session.add = MagicMock()
+    return MagicMock(return_value=session), session
+
+
+def photo_message(file_id, message_id=1):
+    return SimpleNamespace(message_id=message_id, photo=[
+        SimpleNamespace(file_id=f"{file_id}_small"), SimpleNamespace(file_id=file_id)
+    ])
+
+
+class FakeMessage:
+    def __init__(self, reject=(), error='Bad Request: wrong file identifier/HTTP URL specified'):
+        self.photos = []
+        self.reject = set(reject)
+        self.error = error
+
+    async def answer_photo(self, photo, **kwargs):
+        self.photos.append(photo)
+        if photo in self.reject:
+            raise TelegramBadRequest(method=MagicMock(), message=self.error)
+        return photo_message('uploaded_id')
+
+
+@pytest.mark.asyncio
+async def test_second_send_uses_file_id():
+    factory, session = _session_factory()
+    cache = MediaCache(session_factory=factory)
+    message = FakeMessage()
+
+    await cache.answer_photo(message, URL, caption='task')
+    await cache.answer_photo(message, URL, caption='task')
+
+    assert message.photos == [URL, 'uploaded_id']
+    # file_id сохранен в БД один раз
+    assert session.merge.await_count == 1
+    assert session.merge.await_args.args[0].file_id == 'uploaded_id'
+
+
+@pytest.mark.asyncio
+async def test_cache_is_loaded_from_db():
+    factory, _ = _session_factory(rows=[(URL, 'stored_id')])
+    cache = MediaCache(session_factory=factory)
+    assert await cache.photo(URL) == 'stored_id'
+    assert await cache.photo('https://example.com/other.png') == 'https://example.com/other.png'
+
+
+@pytest.mark.asyncio
+async def test_rejected_file_id_falls_back_to_url():
+    factory, session = _session_factory(rows=[(URL, 'stale_id')])
+    cache = MediaCache(session_factory=factory)
+    message = FakeMessage(reject={'stale_id'})
+
+    await cache.answer_photo(message, URL)
+
+    assert message.photos == ['stale_id', URL]
+    assert cache.file_ids[URL] == 'uploaded_id'
+
+
+@pytest.mark.asyncio
+async def test_other_errors_keep_file_id():
+    factory, session = _session_factory(rows=[(URL, 'stored_id')])
+    cache = MediaCache(session_factory=factory)
+    message = FakeMessage(reject={'stored_id'}, error='Bad Request: message to edit not found')
+
+    with pytest.raises(TelegramBadRequest):
+        await cache.answer_photo(message, URL)
+
+    # Без повторной загрузки по URL, file_id остался в кэше
+    assert message.photos == ['stored_id']
+    assert cache.file_ids[URL] == 'stored_id'
+    session.delete.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_preload_uploads_only_missing_images():
+    factory, _ = _session_factory(rows=[(URL, 'stored_id')])
+    cache = MediaCache(session_factory=factory)
+    bot = MagicMock()
+    bot.send_photo = AsyncMock(side_effect=lambda chat_id, photo, **kwargs: photo_message(f"id:{photo}", 7))
+    bot.delete_message = AsyncMock()
+    urls = [URL, 'https://example.com/2.png', 'https://example.com/3.png', 'https://example.com/2.png']
+
+    uploaded, failed = await cache.preload(bot, chat_id=42, urls=urls, rate=1000)
+
+    assert (uploaded, failed) == (2, 0)
+    assert [call.kwargs['photo'] for call in bot.send_photo.await_args_list] == urls[1:3]
+    assert bot.delete_message.await_count == 2
+    assert cache.file_ids['https://example.com/3.png'] == 'id:https://example.com/3.png'
@@ -0,0 +1,81 @@
+import asyncio
+import random
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from core.database.models import UserStatus
+from core.services.rank_index import RankIndex, Leaderboard
+
+
+def sql_rank(points: dict, user_id: int) -> int:
+    """Эталон: RANK() OVER (ORDER BY points DESC)"""
+    return 1 + sum(1 for p in points.values() if p > points[user_id])
+
+
+def test_rank_matches_sql_rank_with_ties():
+    points = {1: 100, 2: 50, 3: 100, 4: 0, 5: 50}
+    index = RankIndex()
+    index.rebuild(points.items())
+
+    for user_id in points:
+        assert index.rank(user_id) == sql_rank(points, user_id)
+    assert index.rank(999) == 0
+
+
+def test_incremental_updates_match_rebuild():
+    rng = random.Random(3)
+    points = {}
+    index = RankIndex()
+    for _ in range(2000):
+        user_id = rng.randint(1, 200)
+        points[user_id] = max(0, points.get(user_id, 0) + rng.randint(-6, 20))
+        index.update(user_id, points[user_id])
+
+    assert len(index) == len(points)
+    for user_id in points:
+        assert index.rank(user_id) == sql_rank(points, user_id)
+
+    top = index.top(5)
+    assert [p for _, p in top] == sorted(points.values(), reverse=True)[:5]
+    assert index.page(5, 5) == list(index)[5:10]
+
+
+def test_leaderboard_excludes_staff_and_resets_weekly():
+    board = Leaderboard(session_factory=None)
+    board.update(1, 100, 30, UserStatus.NO_SUB)
+    board.update(2, 200, 10, UserStatus.SUB)
+    board.update(3, 900, 90, UserStatus.ADMIN)
+    # Статус неизвестен и пользователя нет в рейтинге - не добавляется
+    board.update(4, 500, 50)
+
+    assert board.top_total(10) == [(2, 200), (1, 100)]
+    assert board.weekly_rank(1) == 1
+
+    board.update(1, 110, 40)
+    assert board.total.points(1) == 110
+
+    board.reset_weekly()
+    assert board.top_weekly(10) == [(1, 0), (2, 0)]
+    assert board.weekly_rank(2) == 1
+
+
+@pytest.mark.asyncio
+async def test_periodic_refresh_picks_up_other_replicas():
+    rows = [SimpleNamespace(user_id=1, total_points=100, weekly_points=30)]
+    session = AsyncMock()
+    session.__aenter__.return_value = session
+    session.execute.side_effect = lambda stmt: MagicMock(all=MagicMock(return_value=list(rows)))
+    board = Leaderboard(session_factory=MagicMock(return_value=session), refresh_interval=0.01)
+    await board.rebuild()
+    await board.start()
+
+    # Ведущая реплика закрыла неделю, другая начислила очки новому пользователю
+    rows = [SimpleNamespace(user_id=1, total_points=100, weekly_points=0),
+            SimpleNamespace(user_id=2, total_points=50, weekly_points=5)]
+    await asyncio.sleep(0.05)
+    await board.stop()
+
+    assert board.top_weekly(10) == [(2, 5), (1, 0)]
+    assert board.total.points(2) == 50
@@ -39,3 +39,161 @@ async def test_reminder_logic():
     assert mock_bot.send_message.call_count == 2
     mock_bot.send_message.assert_any_call(chat_id=123, text="Test reminder")
     mock_bot.send_message.assert_any_call(chat_id=456, text="Test reminder")
+
+
+class FakeSender:
+    """Отправитель, запоминающий максимальное число одновременных отправок по типу текста"""
+
+    def __init__(self, outcomes=None):
+        self.outcomes = outcomes or {}
+        self.active = {}
+        self.peak = {}
+        self.sent = []
+
+    async def send(self, chat_id, text, **kwargs):
+        import asyncio
+        self.active[text] = self.active.get(text, 0) + 1
+        self.peak[text] = max(self.peak.get(text, 0), self.active[text])
+        await asyncio.sleep(0)
+        self.active[text] -= 1
+        self.sent.append((chat_id, text))
+        return self.outcomes.get(chat_id, 'sent')
+
+
+def _session_factory(events):
+    session = AsyncMock()
+    session.__aenter__.side_effect = lambda: events.append('open') or session
+    session.__aexit__.side_effect = lambda *exc: events.append('close')
+    session.begin = MagicMock(return_value=AsyncMock())
+    return MagicMock(return_value=session), session
+
+
+@pytest.mark.asyncio
+async def test_deliver_respects_per_type_concurrency():
+    from core.services.reminder_service import ReminderService
+
+    sender = FakeSender(outcomes={3: 'blocked', 4: 'failed'})
+    service = ReminderService(AsyncMock(), session_factory=MagicMock(), sender=sender)
+    users = {
+        'promo': [(i, f"user{i}") for i in range(1, 31)],
+        'inactive': [(i, f"user{i}") for i in range(100, 150)]
+    }
+
+    with patch.dict('core.services.reminder_service.REMINDER_CONCURRENCY', {'promo': 2, 'inactive': 5}):
+        outcomes = await service.deliver(users, {'promo': 'P', 'inactive': 'I'})
+
+    assert sender.peak == {'P': 2, 'I': 5}
+    assert len(sender.sent) == 80
+    assert outcomes['promo']['blocked'] == [3]
+    assert outcomes['promo']['failed'] == [4]
+    assert len(outcomes['promo']['sent']) == 28
+    assert len(outcomes['inactive']['sent']) == 50
+
+
+@pytest.mark.asyncio
+async def test_send_reminders_releases_session_before_sending():
+    from core.services.reminder_service import ReminderService
+
+    events = []
+    factory, _ = _session_factory(events)
+    sender = FakeSender(outcomes={2: 'blocked'})
+    original_send = sender.send
+
+    async def send(chat_id, text, **kwargs):
+        events.append('send')
+        return await original_send(chat_id, text, **kwargs)
+
+    sender.send = send
+    service = ReminderService(AsyncMock(), session_factory=factory, sender=sender)
+    service.get_users_for_reminders = AsyncMock(return_value={
+        'promo': [(1, 'a'), (2, 'b')], 'inactive': [(3, 'c')]})
+    service.get_reminder_text = AsyncMock(return_value=None)
+    service.record_outcomes = AsyncMock()
+
+    results = await service.send_reminders()
+
+    assert results == {'promo': 1, 'inactive': 1}
+    # Первый сеанс закрыт до первой отправки
+    assert events[:3] == ['open', 'close', 'send']
+    outcomes = service.record_outcomes.await_args.args[0]
+    assert outcomes['promo']['blocked'] == [2]
+
+
+@pytest.mark.asyncio
+async def test_record_outcomes_updates_in_chunks():
+    from core.services.reminder_service import ReminderService
+
+    factory, session = _session_factory([])
+    service = ReminderService(AsyncMock(), session_factory=factory, sender=FakeSender())
+    outcomes = {
+        'promo': {'sent': list(range(5)), 'blocked': [10], 'failed': [11]},
+        'inactive': {'sent': list(range(5, 8)), 'blocked': [], 'failed': []}
+    }
+
+    await service.record_outcomes(outcomes, chunk_size=3)
+
+    # 8 отправленных -> 3 запроса, 1 заблокировавший -> 1 запрос
+    assert session.execute.await_count == 4
+    factory.assert_called_once()
+
+
+def test_candidates_stmt_selects_window_without_recent_reminder():
+    from datetime import datetime, timedelta
+    from sqlalchemy import create_engine, insert
+    from core.database.models import User, UserStatus
+    from core.services.reminder_service import ReminderService
+
+    now = datetime(2026, 10, 18, 12, 0)
+    hours = lambda h: now - timedelta(hours=h)
+    engine = create_engine("sqlite://")
+    User.__table__.create(engine)
+    with engine.begin() as conn:
+        rows = [
+            (1, UserStatus.NO_SUB, hours(24), None, None),
+            (2, UserStatus.NO_SUB, hours(24.5), None, None),
+            (3, UserStatus.NO_SUB, hours(26), None, None),
+            (4, UserStatus.ADMIN, hours(24), None, None),
+            # Напоминание уже отправлено в этом окне
+            (5, UserStatus.NO_SUB, hours(24), hours(1), None),
+            # Напоминание было за предыдущий интервал - не мешает
+            (6, UserStatus.NO_SUB, hours(24), hours(20), None),
+            (7, UserStatus.NO_SUB, hours(24), None, hours(2)),
+        ]
+        conn.execute(insert(User), [
+            {'id': user_id, 'status': status, 'last_interaction_time': last_interaction,
+             'last_reminder_time': last_reminder, 'blocked_at': blocked_at}
+            for user_id, status, last_interaction, last_reminder, blocked_at in rows
+        ])
+
+        service = ReminderService(AsyncMock(), session_factory=MagicMock(), sender=FakeSender())
+        ids = {row.id for row in conn.execute(service.candidates_stmt(24, now))}
+
+    assert ids == {1, 2, 6}
+
+
+@pytest.mark.asyncio
+async def test_get_users_for_reminders_queries_each_window():
+    from core.services.reminder_service import ReminderService
+
+    class Stream:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def __aiter__(self):
+            return self._iter()
+
+        async def _iter(self):
+            for row in self.rows:
+                yield row
+
+    service = ReminderService(AsyncMock(), session_factory=MagicMock(), sender=FakeSender())
+    service.REMINDER_INTERVALS = {'promo': [24, 48], 'inactive': [120]}
+    session = MagicMock()
+    session.stream = AsyncMock(side_effect=[
+        Stream([(1, 'a')]), Stream([(2, 'b'), (1, 'a')]), Stream([(3, 'c')])])
+
+    users = await service.get_users_for_reminders(session)
+
+    assert users == {'promo': [(1, 'a'), (2, 'b')], 'inactive': [(3, 'c')]}
+    assert session.stream.await_count == 3
+    assert session.stream.await_args.args[0].get_execution_options()['yield_per'] == 1000
@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+
+from core.utils.scheduler import JobScheduler, JobSpec, LeaderLease
+
+calls = []
+
+
+async def record_job():
+    calls.append(datetime.now(timezone.utc))
+
+
+JOB = JobSpec('record', record_job, {'day_of_week': 'mon', 'hour': 0, 'minute': 0}, 3600)
+
+
+class FakeLease:
+    owner = 'test'
+    renew_interval = 0.01
+
+    def __init__(self, leader=True):
+        self.leader = leader
+        self.release = AsyncMock()
+
+    async def try_acquire(self):
+        return self.leader
+
+
+def make_scheduler(tmp_path, lease=None):
+    store = SQLAlchemyJobStore(url=f"sqlite:///{tmp_path / 'jobs.db'}", tablename='scheduler_jobs')
+    return JobScheduler(MagicMock(), jobstore=store, lease=lease or FakeLease(), jobs=[JOB])
+
+
+@pytest.mark.asyncio
+async def test_restart_keeps_missed_run_and_catches_up(tmp_path):
+    calls.clear()
+    first = make_scheduler(tmp_path)
+    first.scheduler.start(paused=True)
+    first.sync_jobs()
+    # Процесс «проспал» запуск: время следующего запуска уже в прошлом
+    missed = datetime.now(timezone.utc) - timedelta(minutes=5)
+    first.scheduler.get_job('record').modify(next_run_time=missed)
+    await first.stop()
+
+    second = make_scheduler(tmp_path)
+    second.scheduler.start(paused=True)
+    second.sync_jobs()
+    assert second.scheduler.get_job('record').next_run_time == missed
+
+    second.scheduler.resume()
+    second.is_leader = True
+    await asyncio.sleep(0.2)
+    assert len(calls) == 1
+    assert second.scheduler.get_job('record').next_run_time > datetime.now(timezone.utc)
+    await second.stop()
+
+
+@pytest.mark.asyncio
+async def test_only_leader_runs_jobs(tmp_path):
+    lease = FakeLease(leader=False)
+    scheduler = make_scheduler(tmp_path, lease)
+    await scheduler.start()
+    await asyncio.sleep(0.05)
+    assert not scheduler.is_leader
+
+    lease.leader = True
+    await asyncio.sleep(0.05)
+    assert scheduler.is_leader
+    assert scheduler.scheduler.get_job('record') is not None
+
+    lease.leader = False
+    await asyncio.sleep(0.05)
+    assert not scheduler.is_leader
+
+    await scheduler.stop()
+    lease.release.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_sync_jobs_reschedules_changed_trigger_and_drops_obsolete(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    scheduler.activate()
+    scheduler.scheduler.add_job(record_job, 'interval', hours=1, id='obsolete')
+
+    scheduler.jobs = [JobSpec('record', record_job, {'minute': 15}, 3600)]
+    scheduler.sync_jobs()
+
+    assert [job.id for job in scheduler.scheduler.get_jobs()] == ['record']
+    assert scheduler.scheduler.get_job('record').next_run_time.minute == 15
+    await scheduler.stop()
+
+
+def _lease_session(rowcount, existing=None):
+    session = AsyncMock()
+    session.__aenter__.return_value = session
+    session.begin = MagicMock(return_value=AsyncMock())
+    session.execute.return_value = MagicMock(rowcount=rowcount)
+    session.get.return_value = existing
+    session.add = MagicMock()
+    return MagicMock(return_value=session), session
+
+
+@pytest.mark.asyncio
+async def test_lease_acquire_renew_and_conflict():
+    factory, session = _lease_session(rowcount=1)
+    assert await LeaderLease(session_factory=factory, owner='a').try_acquire()
+    session.add.assert_not_called()
+
+    # Записи еще нет - создаем ее
+    factory, session = _lease_session(rowcount=0)
+    assert await LeaderLease(session_factory=factory, owner='a').try_acquire()
+    session.add.assert_called_once()
+
+    # Запись есть, но аренда чужая и не истекла
+    factory, session = _lease_session(rowcount=0, existing=object())
+    assert not await LeaderLease(session_factory=factory, owner='a').try_acquire()
+    session.add.assert_not_called()
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import time
+from datetime import date, datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from core.database.models import Complexity, UserStatus
+from core.services.stats_aggregator import AnswerEvent, StatsAggregator, StatsJournal
+from core.services.stats_service import apply_answer, calculate_points
+
+
+def test_calculate_points():
+    assert calculate_points(Complexity.HIGH, UserStatus.PRO_SUB, True) == 20
+    assert calculate_points(Complexity.BASIC, UserStatus.NO_SUB, True) == 1
+    assert calculate_points(Complexity.ADVANCED, UserStatus.SUB, False) == -2
+    assert calculate_points(None, UserStatus.SUB, True) == 0
+
+
+def test_apply_answer_streak_and_floor():
+    stat = SimpleNamespace(total_attempts=0, correct_answers=0, percentage=0.0)
+    progress = SimpleNamespace(total_points=1, weekly_points=0, current_streak=4,
+                               last_active_day=date(2024, 1, 1), daily_record=0)
+
+    apply_answer(stat, progress, False, -6, today=date(2024, 1, 2))
+    assert (progress.total_points, progress.weekly_points) == (0, 0)
+    assert progress.current_streak == 5
+
+    apply_answer(stat, progress, True, 2, today=date(2024, 1, 2))
+    assert progress.current_streak == 5
+    assert (stat.total_attempts, stat.correct_answers, stat.percentage) == (2, 1, 50.0)
+
+    apply_answer(stat, progress, True, 2, today=date(2024, 1, 5))
+    assert progress.current_streak == 1
+    assert progress.last_active_day == date(2024, 1, 5)
+
+
+def test_apply_answer_reports_changed_metrics():
+    stat = SimpleNamespace(total_attempts=1, correct_answers=0, percentage=0.0)
+    progress = SimpleNamespace(total_points=0, weekly_points=0, current_streak=3,
+                               last_active_day=date(2024, 1, 2), daily_record=1)
+
+    # Неверный ответ в тот же день: очки у нуля, процент 0 -> 0, streak прежний
+    assert apply_answer(stat, progress, False, -1, today=date(2024, 1, 2)) == {'solved_tasks'}
+
+    assert apply_answer(stat, progress, True, 2, today=date(2024, 1, 3)) == {
+        'solved_tasks', 'correct_answers', 'correct_percentage', 'total_points', 'daily_streak'}
+
+
+def test_journal_replays_only_unflushed(tmp_path):
+    path = tmp_path / "journal.log"
+    aggregator = StatsAggregator(journal=StatsJournal(str(path)))
+    for i in range(5):
+        aggregator.enqueue(1, 100 + i, i % 2 == 0, datetime(2024, 1, 1, 12, i))
+    aggregator.journal.mark_flushed(3)
+    aggregator.journal.close()
+
+    with open(path, "a") as file:
+        file.write('{"seq": 6, "user_id": 1')  # Оборванная при падении запись
+
+    replayed = StatsJournal(str(path)).replay()
+    assert [e.seq for e in replayed] == [4, 5]
+    assert replayed[0].answered_at == datetime(2024, 1, 1, 12, 3)
+
+
+def test_journal_truncated_when_everything_flushed(tmp_path):
+    path = tmp_path / "journal.log"
+    journal = StatsJournal(str(path))
+    aggregator = StatsAggregator(journal=journal)
+    aggregator.enqueue(1, 1, True)
+    aggregator.enqueue(2, 1, False)
+    journal.mark_flushed(2)
+    assert path.read_text() == ""
+    assert journal.replay() == []
+
+
+@pytest.mark.asyncio
+async def test_flush_batches_and_requeues_on_failure(tmp_path):
+    aggregator = StatsAggregator(
+        journal=StatsJournal(str(tmp_path / "journal.log")),
+        flush_interval_ms=10_000,
+        max_events=3,
+        retry_backoff_ms=10
+    )
+    batches = []
+    fail = [True]
+
+    async def write(batch):
+        if fail[0]:
+            fail[0] = False
+            raise RuntimeError("db down")
+        batches.append([e.seq for e in batch])
+        return {}
+
+    aggregator._write = write
+    await aggregator.start()
+    try:
+        aggregator.enqueue(1, 10, True)
+        aggregator.enqueue(2, 11, True)
+        assert await aggregator.flush() == 0
+        assert aggregator.queue_depth == 2
+        assert aggregator.metrics.failed_flushes == 1
+
+        # Третье событие достигает max_events и будит фоновую задачу
+        aggregator.enqueue(1, 12, False)
+        for _ in range(50):
+            if batches:
+                break
+            await asyncio.sleep(0.01)
+
+        assert batches == [[1, 2, 3]]
+        assert aggregator.queue_depth == 0
+        assert aggregator.metrics.events_flushed == 3
+    finally:
+        await aggregator.stop()
+
+    assert StatsJournal(str(tmp_path / "journal.log")).replay() == []
+
+
+@pytest.mark.asyncio
+async def test_restart_replays_journal(tmp_path):
+    path = str(tmp_path / "journal.log")
+    first = StatsAggregator(journal=StatsJournal(path))
+    first.enqueue(1, 10, True)
+    first.enqueue(1, 11, False)
+    first.journal.close()  # Процесс упал до записи в БД
+
+    second = StatsAggregator(journal=StatsJournal(path), flush_interval_ms=10_000)
+    written = []
+
+    async def write(batch):
+        written.extend(batch)
+        return {}
+
+    second._write = write
+    await second.start()
+    assert second.queue_depth == 2
+    assert second.enqueue(2, 12, True).seq == 3
+    await second.stop()
+
+    assert [e.task_id for e in written] == [10, 11, 12]
+
+
+def make_aggregator(tmp_path, **kwargs):
+    return StatsAggregator(journal=StatsJournal(str(tmp_path / "journal.log")),
+                           flush_interval_ms=10_000, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_flush_takes_at_most_max_batch(tmp_path):
+    aggregator = make_aggregator(tmp_path, max_batch=2)
+    batches = []
+
+    async def write(batch):
+        batches.append([e.seq for e in batch])
+        return {}
+
+    aggregator._write = write
+    for i in range(5):
+        aggregator.enqueue(1, 10 + i, True)
+
+    assert await aggregator.flush() == 2
+    assert await aggregator.flush() == 2
+    assert batches == [[1, 2], [3, 4]]
+    assert aggregator.queue_depth == 1
+    # В журнале остается только незаписанное
+    assert [e.seq for e in StatsJournal(str(tmp_path / "journal.log")).replay()] == [5]
+
+
+@pytest.mark.asyncio
+async def test_failures_back_off_exponentially(tmp_path):
+    aggregator = make_aggregator(tmp_path, retry_backoff_ms=1000, max_backoff_ms=3000, max_retries=10)
+
+    async def write(batch):
+        raise RuntimeError("db down")
+
+    aggregator._write = write
+    aggregator.enqueue(1, 10, True)
+    delays = []
+    for _ in range(4):
+        started = time.monotonic()
+        assert await aggregator.flush() == 0
+        delays.append(round(aggregator._retry_at - started))
+
+    assert delays == [1, 2, 3, 3]
+    assert aggregator.queue_depth == 1
+
+
+@pytest.mark.asyncio
+async def test_poisoned_user_is_dead_lettered(tmp_path):
+    aggregator = make_aggregator(tmp_path, max_retries=2)
+    written = []
+
+    async def write(batch):
+        if any(e.user_id == 2 for e in batch):
+            raise RuntimeError("broken row")
+        written.extend(e.seq for e in batch)
+        return {}
+
+    aggregator._write = write
+    aggregator.enqueue(1, 10, True)
+    aggregator.enqueue(2, 11, True)
+    aggregator.enqueue(1, 12, False)
+
+    assert await aggregator.flush() == 0
+    # Вторая неудача подряд: пачка пишется по пользователям
+    assert await aggregator.flush() == 2
+    assert written == [1, 3]
+    assert aggregator.queue_depth == 0
+    assert aggregator.metrics.events_dead_lettered == 1
+
+    failed = (tmp_path / "journal.log.failed").read_text().splitlines()
+    assert [AnswerEvent.from_dict(json.loads(line)).seq for line in failed] == [2]
+    assert StatsJournal(str(tmp_path / "journal.log")).replay() == []
+
+
+@pytest.mark.asyncio
+async def test_single_poisoned_user_is_dead_lettered_once(tmp_path):
+    session = AsyncMock()
+    session.__aenter__.return_value = session
+    aggregator = make_aggregator(tmp_path, max_retries=1)
+    aggregator.session_factory = MagicMock(return_value=session)
+
+    async def write(batch):
+        raise RuntimeError("broken row")
+
+    aggregator._write = write
+    aggregator.enqueue(2, 11, True)
+
+    # БД отвечает - значит, дело в данных пользователя
+    assert await aggregator.flush() == 0
+    assert aggregator.queue_depth == 0
+    assert len((tmp_path / "journal.log.failed").read_text().splitlines()) == 1
+    assert await aggregator.flush() == 0
+
+
+@pytest.mark.asyncio
+async def test_database_outage_is_not_dead_lettered(tmp_path):
+    session = AsyncMock()
+    session.__aenter__.side_effect = ConnectionError("db down")
+    aggregator = make_aggregator(tmp_path, max_retries=1)
+    aggregator.session_factory = MagicMock(return_value=session)
+
+    async def write(batch):
+        raise ConnectionError("db down")
+
+    aggregator._write = write
+    aggregator.enqueue(1, 10, True)
+
+    assert await aggregator.flush() == 0
+    assert aggregator.queue_depth == 1
+    assert not (tmp_path / "journal.log.failed").exists()
+
+
+def test_journal_is_owned_by_one_process(tmp_path):
+    path = str(tmp_path / "journal.log")
+    first, second = StatsJournal(path), StatsJournal(path)
+    first.acquire()
+    with pytest.raises(RuntimeError):
+        second.acquire()
+    first.release()
+    second.acquire()
+    second.release()
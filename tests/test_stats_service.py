@@ -0,0 +1,159 @@
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from core.database.models import UserStatus
+from core.services import stats_service
+from core.services.stats_service import (
+    get_user_stats,
+    invalidate_user_stats
+)
+from core.services.achievement_rules import (
+    AchievementRuleBook,
+    UnlockedAchievementsCache
+)
+
+
+@pytest.fixture(autouse=True)
+def achievement_caches(monkeypatch):
+    """Правила и разблокированные достижения уже в памяти - запросов к БД за ними нет"""
+    book = AchievementRuleBook()
+    book.build([
+        SimpleNamespace(id=i, name="", description="", reward_points=0,
+                        conditions=f"solved_tasks >= {i}")
+        for i in range(1, 11)
+    ])
+    unlocked = UnlockedAchievementsCache()
+    for user_id in (1, 42):
+        unlocked._cache.set(user_id, {1: datetime(2024, 1, 1), 2: datetime(2024, 1, 2)})
+    monkeypatch.setattr(stats_service, "achievement_rules", book)
+    monkeypatch.setattr(stats_service, "unlocked_achievements", unlocked)
+
+
+def make_session(status=UserStatus.NO_SUB):
+    row = SimpleNamespace(
+        status=status,
+        global_rank=3,
+        weekly_rank=7,
+        best_subtopic_id=1,
+        best_subtopic_accuracy=75.0,
+        worst_subtopic_id=2,
+        worst_subtopic_accuracy=0.0
+    )
+    stat = SimpleNamespace(
+        total_attempts=6,
+        percentage=50.0
+    )
+    progress = SimpleNamespace(
+        total_points=650, weekly_points=40, current_streak=2)
+
+    result = MagicMock()
+    result.one_or_none.return_value = MagicMock(
+        __getitem__=lambda self, i: (stat, progress)[i],
+        **vars(row)
+    )
+    session = MagicMock()
+    session.execute = AsyncMock(return_value=result)
+    return session
+
+
+@pytest.mark.asyncio
+async def test_get_user_stats_single_query_and_cache():
+    stats_service._stats_cache.clear()
+    session = make_session()
+
+    stats = await get_user_stats(session, 42)
+    assert stats.total_xp == 650
+    assert stats.level[0] == 7
+    assert (stats.global_rank, stats.weekly_rank) == (3, 7)
+    assert (stats.best_topic_accuracy, stats.worst_topic_accuracy) == (75.0, 0.0)
+    assert (stats.achievements_unlocked, stats.achievements_total) == (2, 10)
+
+    # Повторный просмотр берется из кэша
+    await get_user_stats(session, 42)
+    assert session.execute.await_count == 1
+
+    invalidate_user_stats(42)
+    await get_user_stats(session, 42)
+    assert session.execute.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_staff_is_not_ranked():
+    stats_service._stats_cache.clear()
+    stats = await get_user_stats(make_session(UserStatus.ADMIN), 1)
+    assert (stats.global_rank, stats.weekly_rank) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_close_week_snapshots_once(monkeypatch):
+    from datetime import date
+    reset = MagicMock()
+    monkeypatch.setattr(stats_service.leaderboard, "reset_weekly", reset)
+
+    session = AsyncMock()
+    session.scalar.return_value = None
+    session.execute.side_effect = [MagicMock(), MagicMock(rowcount=5)]
+    assert await stats_service.close_week(session, date(2026, 10, 12)) == 5
+    # Снимок в WeeklyXP, затем обнуление
+    assert session.execute.await_count == 2
+    session.commit.assert_awaited_once()
+    reset.assert_called_once()
+
+    # Неделя уже закрыта - повторный запуск (догон пропуска) ничего не меняет
+    session = AsyncMock()
+    session.scalar.return_value = 1
+    assert await stats_service.close_week(session, date(2026, 10, 12)) == 0
+    session.execute.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_is_updated_after_commit(monkeypatch):
+    from core.database.hooks import discard_after_rollback, run_after_commit
+    from core.database.models import Complexity, User, UserProgress, UserStat
+    update = MagicMock()
+    monkeypatch.setattr(stats_service.leaderboard, "update", update)
+
+    rows = {
+        User: SimpleNamespace(status=UserStatus.NO_SUB),
+        UserStat: UserStat(user_id=7, correct_answers=0, total_attempts=0, percentage=0.0),
+        UserProgress: UserProgress(user_id=7, daily_record=0, weekly_points=0,
+                                   total_points=0, current_streak=0),
+    }
+    session = MagicMock(info={})
+    session.get = AsyncMock(side_effect=lambda model, pk, **kwargs: rows[model])
+    session.flush = AsyncMock()
+    task = SimpleNamespace(id=1, complexity=Complexity.BASIC, subtopic_id=None)
+
+    assert await stats_service.update_user_stats(session, 7, 1, True, task=task)
+    update.assert_not_called()
+    run_after_commit(session)
+    update.assert_called_once_with(7, rows[UserProgress].total_points,
+                                   rows[UserProgress].weekly_points, UserStatus.NO_SUB)
+
+    # Откат - индекс рейтинга не трогаем
+    update.reset_mock()
+    assert await stats_service.update_user_stats(session, 7, 1, False, task=task)
+    discard_after_rollback(session)
+    update.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_close_week_default_uses_scheduler_timezone(monkeypatch):
+    from datetime import date, timezone
+
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            # Понедельник 00:30 в Москве - в UTC еще воскресенье
+            return datetime(2026, 10, 18, 21, 30, tzinfo=timezone.utc).astimezone(tz)
+
+    monkeypatch.setattr(stats_service, "datetime", Clock)
+    monkeypatch.setattr(stats_service, "SCHEDULER_TIMEZONE", "Europe/Moscow")
+    session = AsyncMock()
+    session.scalar.return_value = 1
+
+    await stats_service.close_week(session)
+    where = session.scalar.await_args.args[0].whereclause
+    assert where.right.value == date(2026, 10, 12)
@@ -0,0 +1,48 @@
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.dialects import mysql
+
+from core.database.models import UserSubtopicStat
+from core.services.subtopic_stats import (
+    _upsert_stmt,
+    best_and_worst_columns,
+    rows_from_json
+)
+
+
+def test_upsert_increments_existing_counters():
+    sql = str(_upsert_stmt([
+        {'user_id': 1, 'subtopic_id': 2, 'correct': 1, 'wrong': 0}
+    ]).compile(dialect=mysql.dialect()))
+    assert "ON DUPLICATE KEY UPDATE" in sql
+    assert "correct = (user_subtopic_stats.correct + VALUES(correct))" in sql
+    assert "wrong = (user_subtopic_stats.wrong + VALUES(wrong))" in sql
+
+
+def test_rows_from_json_skips_empty_and_broken_entries():
+    rows = rows_from_json(7, {
+        "1": {"correct": 3, "wrong": 1},
+        "2": {"correct": 0, "wrong": 0},
+        "x": {"correct": 1},
+        "3": "broken",
+    })
+    assert rows == [{'user_id': 7, 'subtopic_id': 1, 'correct': 3, 'wrong': 1}]
+    assert rows_from_json(7, None) == []
+
+
+def test_best_and_worst_in_sql():
+    engine = create_engine("sqlite://")
+    UserSubtopicStat.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(UserSubtopicStat), [
+            {'user_id': 1, 'subtopic_id': 1, 'correct': 3, 'wrong': 1},
+            {'user_id': 1, 'subtopic_id': 2, 'correct': 0, 'wrong': 2},
+            {'user_id': 1, 'subtopic_id': 3, 'correct': 1, 'wrong': 1},
+            {'user_id': 2, 'subtopic_id': 4, 'correct': 9, 'wrong': 0},
+        ])
+
+        row = conn.execute(select(*best_and_worst_columns(1))).one()
+        assert (row.best_subtopic_id, row.best_subtopic_accuracy) == (1, 75.0)
+        assert (row.worst_subtopic_id, row.worst_subtopic_accuracy) == (2, 0.0)
+
+        empty = conn.execute(select(*best_and_worst_columns(3))).one()
+        assert empty.best_subtopic_id is None
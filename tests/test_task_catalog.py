@@ -0,0 +1,150 @@
+import datetime
+import random
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from core.database.models import PartNumber, Complexity
+from core.services.task_catalog import TaskCatalog
+from core.services.task_utils import build_variants
+
+T0 = datetime.datetime(2026, 1, 1)
+
+
+def make_task(id, type_number, part, subtopic_id=None, complexity=Complexity.BASIC, topic_id=1):
+    return SimpleNamespace(
+        id=id,
+        type_number=type_number,
+        topic_id=topic_id,
+        subtopic_id=subtopic_id,
+        part_number=part,
+        complexity=complexity,
+        correct_answer="1",
+        answer_options=["1", "2", "3", "4"]
+    )
+
+
+@pytest.fixture
+def catalog():
+    catalog = TaskCatalog(session_factory=None)
+    catalog.build(
+        [
+            make_task(1, 1, PartNumber.PART_ONE, subtopic_id=10),
+            make_task(2, 1, PartNumber.PART_ONE, subtopic_id=11),
+            make_task(3, 2, PartNumber.PART_ONE, subtopic_id=10,
+                      complexity=Complexity.HIGH),
+            make_task(4, 21, PartNumber.PART_TWO, subtopic_id=10,
+                      complexity=Complexity.HIGH),
+        ],
+        topics=[SimpleNamespace(id=1, name="mechanics", title_ru="Механика")],
+        subtopics=[
+            SimpleNamespace(id=10, topic_id=1, name="kinematics",
+                            title_ru="Кинематика"),
+            SimpleNamespace(id=11, topic_id=1, name="dynamics",
+                            title_ru="Динамика"),
+        ],
+        version=(4, 4, T0, 2, 11, T0, 1, 1, T0, T0)
+    )
+    return catalog
+
+
+def test_lookup_by_single_index(catalog):
+    assert catalog.lookup(task_type=1) == (1, 2)
+    assert catalog.lookup(part_number=PartNumber.PART_TWO) == (4,)
+    assert catalog.lookup(subtopic_id=10) == (1, 3, 4)
+    assert catalog.lookup() == (1, 2, 3, 4)
+
+
+def test_lookup_intersects_filters(catalog):
+    assert catalog.lookup(subtopic_id=10, complexity=Complexity.HIGH) == (3, 4)
+    assert catalog.lookup(
+        task_type=1, part_number=PartNumber.PART_TWO) == ()
+    assert catalog.lookup(task_type=99) == ()
+
+
+def test_task_ids_returns_independent_list(catalog):
+    ids = catalog.task_ids(task_type=1)
+    ids.append(100)
+    assert catalog.lookup(task_type=1) == (1, 2)
+
+
+def test_type_numbers(catalog):
+    assert catalog.type_numbers() == [1, 2, 21]
+    assert catalog.type_numbers(PartNumber.PART_ONE) == [1, 2]
+    assert catalog.type_numbers(PartNumber.PART_TWO) == [21]
+
+
+def test_subtopics_are_exposed(catalog):
+    assert catalog.get_subtopic(11).title_ru == "Динамика"
+    assert catalog.get(3).complexity == Complexity.HIGH
+
+
+@pytest.mark.asyncio
+async def test_ensure_fresh_reloads_only_on_version_change(catalog):
+    catalog.check_interval = 0
+    catalog.load = AsyncMock()
+
+    result = AsyncMock()
+    result.one = lambda: catalog.version
+    session = AsyncMock()
+    session.execute = AsyncMock(return_value=result)
+    session.__aenter__.return_value = session
+    catalog.session_factory = lambda: session
+
+    await catalog.ensure_fresh()
+    catalog.load.assert_not_called()
+
+    result.one = lambda: (5, 5, T0, 2, 11, T0, 1, 1, T0, T0)
+    await catalog.ensure_fresh()
+    catalog.load.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_ensure_fresh_reloads_on_in_place_edit(catalog):
+    catalog.check_interval = 0
+    catalog.load = AsyncMock()
+
+    # Правка ответа задания: количество и max(id) прежние, меняется только updated_at
+    edited = T0 + datetime.timedelta(seconds=1)
+    result = AsyncMock()
+    result.one = lambda: (4, 4, edited, 2, 11, T0, 1, 1, T0, T0)
+    session = AsyncMock()
+    session.execute = AsyncMock(return_value=result)
+    session.__aenter__.return_value = session
+    catalog.session_factory = lambda: session
+
+    await catalog.ensure_fresh()
+    catalog.load.assert_awaited_once()
+
+
+def test_version_stmt_tracks_updated_at():
+    sql = str(TaskCatalog._version_stmt())
+    for table in ('tasks', 'subtopics', 'topics', 'theories'):
+        assert f"max({table}.updated_at)" in sql
+
+
+def test_build_variants_one_task_per_type(catalog):
+    variants = build_variants(catalog, 3, rng=random.Random(1))
+
+    assert len(variants) == 3
+    for variant in variants:
+        assert [catalog.get(task_id).type_number for task_id in variant] == [1, 2, 21]
+
+
+def test_build_variants_spreads_pool_between_variants(catalog):
+    variants = build_variants(catalog, 2, rng=random.Random(7))
+
+    # У типа 1 два задания - в двух вариантах они не должны повторяться
+    assert {variants[0][0], variants[1][0]} == {1, 2}
+
+
+def test_updated_at_is_set_by_database_clock():
+    from sqlalchemy.dialects import mysql
+    from sqlalchemy.schema import CreateTable
+    from core.database.models import Task
+
+    column = Task.__table__.c.updated_at
+    # Значение ставит только БД - те же часы, что у max(updated_at) в отпечатке
+    assert column.default is None and column.onupdate is None
+    ddl = str(CreateTable(Task.__table__).compile(dialect=mysql.dialect()))
+    assert "updated_at DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)" in ddl
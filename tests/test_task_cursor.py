@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from core.database.models import Complexity, PartNumber
+from core.fsm.storage import pack_data
+from core.services.task_catalog import TaskCatalog
+from core.services.task_cursor import TaskCursor, permute
+from tests.test_task_catalog import make_task
+
+
+@pytest.fixture
+def catalog():
+    catalog = TaskCatalog(session_factory=None)
+    catalog.build([
+        make_task(i, type_number=i % 25 + 1,
+                  part=PartNumber.PART_ONE if i % 25 < 20 else PartNumber.PART_TWO,
+                  subtopic_id=i % 7,
+                  complexity=Complexity.HIGH if i % 3 == 0 else Complexity.BASIC)
+        for i in range(1, 5001)
+    ])
+    return catalog
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 65, 1000, 4097])
+def test_permute_is_a_bijection(size):
+    for seed in (0, 1, 123456789):
+        assert sorted(permute(i, size, seed) for i in range(size)) == list(range(size))
+
+
+def test_permute_depends_on_seed():
+    first = [permute(i, 1000, 1) for i in range(20)]
+    second = [permute(i, 1000, 2) for i in range(20)]
+    assert first != second
+    assert first != list(range(20))
+
+
+def walk(cursor, catalog):
+    ids = []
+    while (task_id := cursor.task_id(catalog)) is not None:
+        ids.append(task_id)
+        # Как в next_task: курсор проходит через состояние FSM
+        cursor = TaskCursor.from_state(json.loads(json.dumps(cursor.advance().to_state())))
+    return ids
+
+
+def test_cursor_visits_every_matching_task_once(catalog):
+    cursor = TaskCursor.new(subtopic_id=3, complexity=Complexity.HIGH)
+    ids = walk(cursor, catalog)
+    assert sorted(ids) == list(catalog.lookup(subtopic_id=3, complexity=Complexity.HIGH))
+    # Тот же seed - тот же порядок
+    assert walk(cursor, catalog) == ids
+
+
+def test_cursor_limit_and_part_filter(catalog):
+    cursor = TaskCursor.new(task_type=21, part_number=PartNumber.PART_TWO, limit=20)
+    ids = walk(cursor, catalog)
+    assert len(ids) == len(set(ids)) == 20
+    assert all(catalog.get(task_id).type_number == 21 for task_id in ids)
+
+
+def test_variant_takes_one_task_per_type(catalog):
+    ids = walk(TaskCursor.new(variant=True), catalog)
+    assert [catalog.get(task_id).type_number for task_id in ids] == list(range(1, 26))
+
+
+def test_state_size_does_not_depend_on_bank_size(catalog):
+    state = TaskCursor.new(part_number=PartNumber.PART_ONE, limit=None).to_state()
+    assert len(catalog.lookup(part_number=PartNumber.PART_ONE)) == 4000
+    assert len(pack_data({'TASK_CURSOR': state})) < 80
+    assert TaskCursor.from_state(state).part_number == PartNumber.PART_ONE.value
+    assert TaskCursor.from_state(None) is None
+    assert TaskCursor.from_state({'unknown': 1}) is None
+
+
+def test_rebuilt_catalog_ends_stamped_session(catalog):
+    cursor = TaskCursor.new(subtopic_id=3).stamped(catalog)
+    first = cursor.task_id(catalog)
+    assert not cursor.is_stale(catalog)
+    assert len(pack_data({'TASK_CURSOR': cursor.to_state()})) < 80
+
+    # Пересборка с тем же набором заданий сессию не прерывает
+    catalog.build([catalog.tasks[task_id] for task_id in catalog.lookup()])
+    assert not cursor.is_stale(catalog)
+    assert cursor.task_id(catalog) == first
+
+    # Новое задание в пуле меняет перестановку - продолжать нельзя
+    catalog.build([*catalog.tasks.values(), make_task(5001, type_number=1, part=PartNumber.PART_ONE, subtopic_id=3)])
+    restored = TaskCursor.from_state(json.loads(json.dumps(cursor.to_state())))
+    assert restored.is_stale(catalog)
+    assert restored.task_id(catalog) is None
+    # Фильтр другой сессии не задет
+    other = TaskCursor.new(subtopic_id=4).stamped(catalog)
+    catalog.build([*catalog.tasks.values(), make_task(5002, type_number=1, part=PartNumber.PART_ONE, subtopic_id=3)])
+    assert not other.is_stale(catalog)
@@ -0,0 +1,200 @@
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import EditMessageMedia, EditMessageText, SendMessage, SendPhoto
+from aiogram.types import Chat, Message, PhotoSize, User
+
+from core.database.models import Complexity, PartNumber, Task
+from core.fsm.states import TaskStates
+from core.handlers import reply_handlers
+from core.services import task_display
+from core.services.media_cache import MediaCache
+from core.services.task_catalog import TaskCatalog
+from core.services.task_cursor import TaskCursor
+from core.services.task_prefetch import TaskPrefetcher
+from core.services.task_render import TaskRenderCache, render_task
+from tests.test_task_catalog import make_task
+
+TOKEN = '123456789:AAHjKLMNopQRsTuVWXyZ-1234567890_abcDE'
+CHAT = Chat(id=42, type='private')
+
+
+class CountingSession(BaseSession):
+    """Сессия бота без сети: считает вызовы Bot API и отвечает правдоподобными сообщениями"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+        self.fail = set()
+        self.next_message_id = 100
+
+    async def make_request(self, bot, method, timeout=None):
+        name = type(method).__name__
+        self.calls[name] += 1
+        if name in self.fail:
+            raise TelegramBadRequest(method=method, message='message to edit not found')
+        if isinstance(method, (SendMessage, SendPhoto)):
+            self.next_message_id += 1
+            message_id = self.next_message_id
+        elif isinstance(method, (EditMessageText, EditMessageMedia)):
+            message_id = method.message_id
+        else:
+            return True
+        photo = None
+        if isinstance(method, (SendPhoto, EditMessageMedia)):
+            photo = [PhotoSize(file_id='file-id', file_unique_id='u', width=1, height=1)]
+        return Message(message_id=message_id, date=0, chat=CHAT, photo=photo)
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+        yield
+
+    async def close(self):
+        pass
+
+
+def make_db_task(task_id, image=None, text='Найдите скорость'):
+    return Task(
+        id=task_id, type_number=1, part_number=PartNumber.PART_ONE, complexity=Complexity.BASIC,
+        task_content={'text': text, 'image': image}, answer_options=['1', '2', '3', '4']
+    )
+
+
+@pytest.fixture
+def env(monkeypatch):
+    session = CountingSession()
+    bot = Bot(TOKEN, session=session)
+    Bot.set_current(bot)
+
+    # Задания берутся из подставной БД, file_id - из кэша без БД
+    db = AsyncMock()
+    db.__aenter__.return_value = db
+    db.get.side_effect = lambda model, task_id, **kwargs: make_db_task(task_id, image=env.image)
+    # Предзагрузка: select(Task).where(Task.id.in_(ids))
+    db.execute.side_effect = lambda stmt: MagicMock(scalars=MagicMock(return_value=MagicMock(
+        all=MagicMock(return_value=[make_db_task(i, image=env.image) for i in stmt.whereclause.right.value])
+    )))
+    monkeypatch.setattr(task_display, 'AsyncSessionLocal', MagicMock(return_value=db))
+    media = MediaCache(session_factory=MagicMock())
+    media.loaded = True
+    media.remember = AsyncMock()
+    monkeypatch.setattr(task_display, 'media_cache', media)
+
+    catalog = TaskCatalog(session_factory=None)
+    catalog.build([make_task(i, 1, PartNumber.PART_ONE) for i in range(1, 11)])
+    catalog.ensure_fresh = AsyncMock()
+    monkeypatch.setattr(reply_handlers, 'task_catalog', catalog)
+    renders = TaskRenderCache(catalog=catalog)
+    monkeypatch.setattr(task_display, 'task_renders', renders)
+    prefetcher = TaskPrefetcher(renders=renders, session_factory=MagicMock(return_value=db), depth=2)
+    monkeypatch.setattr(task_display, 'task_prefetcher', prefetcher)
+    # Курсор по умолчанию читает общий каталог процесса
+    monkeypatch.setattr(TaskCursor.task_id, '__defaults__', (catalog,))
+    monkeypatch.setattr(TaskCursor.size, '__defaults__', (catalog,))
+    monkeypatch.setattr(TaskCursor.is_stale, '__defaults__', (catalog,))
+
+    state = FSMContext(bot=bot, storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=42, user_id=42))
+    user_message = Message(message_id=1, date=0, chat=CHAT, from_user=User(id=42, is_bot=False, first_name='U'),
+                           text='▶️ Следующее задание')
+    env = SimpleNamespace(session=session, bot=bot, state=state, message=user_message,
+                          catalog=catalog, image=None, db=db, prefetcher=prefetcher)
+    return env
+
+
+async def start_session(env):
+    cursor = TaskCursor.new().stamped(env.catalog)
+    await env.state.update_data(TASK_CURSOR=cursor.to_state())
+    await task_display.display_cursor_task(env.message, cursor, env.state, bot=env.bot)
+    # Пользователь ответил на задание
+    await env.state.set_state(TaskStates.SHOWING_RESULT)
+    env.session.calls.clear()
+
+
+async def press_next(env):
+    env.session.calls.clear()
+    await reply_handlers.next_task(env.message, env.state, env.bot)
+    await env.state.set_state(TaskStates.SHOWING_RESULT)
+    return sum(env.session.calls.values())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('image', [None, 'https://example.com/task.png'])
+async def test_next_task_is_one_api_call(env, image):
+    env.image = image
+    await start_session(env)
+
+    data = await env.state.get_data()
+    first_message_id = data['task_message_id']
+    for _ in range(3):
+        assert await press_next(env) == 1
+    edit = 'EditMessageMedia' if image else 'EditMessageText'
+    assert env.session.calls == Counter({edit: 1})
+
+    data = await env.state.get_data()
+    # Все задания сессии показаны в одном и том же сообщении
+    assert data['task_message_id'] == first_message_id
+    assert TaskCursor.from_state(data['TASK_CURSOR']).position == 3
+
+
+@pytest.mark.asyncio
+async def test_catalog_rebuild_ends_session(env):
+    await start_session(env)
+    await press_next(env)
+    env.catalog.build([*env.catalog.tasks.values(), make_task(11, 1, PartNumber.PART_ONE)])
+
+    await press_next(env)
+    # Старое задание убрано, вместо следующего - сообщение о конце сессии
+    assert env.session.calls == Counter({'DeleteMessage': 1, 'SendMessage': 1})
+    assert await env.state.get_data() == {}
+
+
+@pytest.mark.asyncio
+async def test_first_task_sends_navigation_once(env):
+    cursor = TaskCursor.new()
+    await task_display.display_task_by_id(env.message, cursor.task_id(), env.state, bot=env.bot)
+    # Задание с кнопками ответов и клавиатура навигации
+    assert env.session.calls == Counter({'SendMessage': 2})
+
+
+@pytest.mark.asyncio
+async def test_failed_edit_sends_new_message_and_drops_old(env):
+    await start_session(env)
+    env.session.fail.add('EditMessageText')
+
+    await press_next(env)
+    assert env.session.calls == Counter({'EditMessageText': 1, 'SendMessage': 1, 'DeleteMessage': 1})
+
+
+def test_long_caption_is_sent_as_text_with_preview():
+    rendered = render_task(make_db_task(1, image='https://example.com/a.png', text='x' * 2000))
+    assert rendered.kind == 'text'
+    assert rendered.body.startswith('<a href="https://example.com/a.png">')
+    assert render_task(make_db_task(2, image='https://example.com/a.png')).kind == 'photo'
+
+
+@pytest.mark.asyncio
+async def test_next_task_is_prefetched_while_user_answers(env):
+    await start_session(env)
+    await env.prefetcher.wait()
+    assert env.db.get.await_count == 1
+    # Два следующих задания одним запросом
+    assert env.db.execute.await_count == 1
+
+    for _ in range(4):
+        await press_next(env)
+        await env.prefetcher.wait()
+
+    # Задания после первого показаны из кэша, без session.get
+    assert env.db.get.await_count == 1
+    assert env.prefetcher.prefetched == 6
+    data = await env.state.get_data()
+    cursor = TaskCursor.from_state(data['TASK_CURSOR'])
+    assert data['current_task_id'] == cursor.task_id()
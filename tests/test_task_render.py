@@ -0,0 +1,54 @@
+import dataclasses
+
+import pytest
+
+from core.database.models import Complexity, PartNumber, Task
+from core.services.task_catalog import TaskCatalog
+from core.services.task_render import TaskRenderCache
+from tests.test_task_catalog import make_task
+
+
+def db_task(task_id, text='Найдите массу'):
+    return Task(id=task_id, type_number=3, part_number=PartNumber.PART_ONE, complexity=Complexity.HIGH,
+                task_content={'text': text}, answer_options=['1', '2'])
+
+
+@pytest.fixture
+def catalog():
+    catalog = TaskCatalog(session_factory=None)
+    catalog.build([make_task(i, 3, PartNumber.PART_ONE) for i in range(1, 4)])
+    return catalog
+
+
+def test_render_is_frozen_and_reused(catalog):
+    renders = TaskRenderCache(catalog=catalog)
+    assert renders.get(1) is None
+
+    render = renders.task(db_task(1))
+    assert render.text.startswith("📌 Номер задания: 1 🔥")
+    assert [button.callback_data for row in render.reply_markup.inline_keyboard for button in row] == \
+        ['answer:1:0', 'answer:1:1']
+    assert renders.get(1) is render
+    assert renders.task(db_task(1, text='другой')) is render
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        render.text = 'x'
+
+
+def test_catalog_rebuild_drops_renders(catalog):
+    renders = TaskRenderCache(catalog=catalog)
+    renders.task(db_task(1))
+    catalog.build([make_task(1, 3, PartNumber.PART_ONE)])
+
+    assert renders.get(1) is None
+    assert 'другой' in renders.task(db_task(1, text='другой')).text
+
+
+def test_least_recently_used_render_is_evicted(catalog):
+    renders = TaskRenderCache(maxsize=2, catalog=catalog)
+    renders.task(db_task(1))
+    renders.task(db_task(2))
+    renders.get(1)
+    renders.task(db_task(3))
+
+    assert renders.get(2) is None
+    assert renders.get(1) is not None and renders.get(3) is not None
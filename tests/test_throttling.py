@@ -0,0 +1,115 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram import Router
+from aiogram.dispatcher.event.handler import HandlerObject
+
+from core.middlewares.throttling_middleware import ThrottlingMiddleware
+from core.utils.debounce import throttle
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@throttle(2.0)
+async def next_task(event):
+    await asyncio.sleep(0)
+    return event.from_user.id
+
+
+@throttle(2.0)
+async def show_stats(event):
+    return 'stats'
+
+
+async def plain(event):
+    return 'plain'
+
+
+class Event:
+    """Легче AsyncMock: в нагрузочном тесте событий тысячи"""
+
+    def __init__(self, user_id, chat_id=None):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.chat = SimpleNamespace(id=chat_id or user_id)
+        self.answers = []
+
+    async def answer(self, text):
+        self.answers.append(text)
+
+
+_handlers = {}
+OTHER = Router(name='other')
+
+
+async def call(middleware, callback, event, router=OTHER):
+    if callback not in _handlers:
+        _handlers[callback] = HandlerObject(callback=callback)
+    data = {'handler': _handlers[callback], 'event_router': router}
+    return await middleware(lambda e, d: callback(e), event, data)
+
+
+@pytest.mark.asyncio
+async def test_thousand_users_are_throttled_independently():
+    clock = Clock()
+    middleware = ThrottlingMiddleware(router_rates={}, clock=clock)
+    events = [Event(user_id) for user_id in range(1, 1001)]
+
+    # Все пользователи нажимают одновременно: никто не мешает другим
+    results = await asyncio.gather(*(call(middleware, next_task, event) for event in events))
+    assert results == list(range(1, 1001))
+
+    # Повторное нажатие каждого в течение 2 секунд отклоняется, предупреждение - одно
+    results = await asyncio.gather(*(call(middleware, next_task, event) for event in events))
+    assert results == [None] * 1000
+    await asyncio.gather(*(call(middleware, next_task, event) for event in events))
+    assert all(len(event.answers) == 1 for event in events)
+
+    # Другой обработчик тем же пользователям доступен
+    results = await asyncio.gather(*(call(middleware, show_stats, event) for event in events))
+    assert results == ['stats'] * 1000
+
+    clock.now += 2.0
+    results = await asyncio.gather(*(call(middleware, next_task, event) for event in events))
+    assert results == list(range(1, 1001))
+
+
+@pytest.mark.asyncio
+async def test_buckets_are_bounded():
+    middleware = ThrottlingMiddleware(router_rates={}, maxsize=100, clock=Clock())
+    await asyncio.gather(*(call(middleware, next_task, Event(user_id)) for user_id in range(1000)))
+    assert all(len(limiter) <= 100 for limiter in middleware._limiters.values())
+
+
+@pytest.mark.asyncio
+async def test_router_rate_applies_to_handlers_without_flag():
+    clock = Clock()
+    middleware = ThrottlingMiddleware(router_rates={'inline': 0.5}, clock=clock)
+    inline, other = Router(name='inline'), OTHER
+    event = Event(1)
+
+    assert await call(middleware, plain, event, inline) == 'plain'
+    assert await call(middleware, plain, event, inline) is None
+    # У роутера без лимита обработчики не ограничены
+    assert await call(middleware, plain, event, other) == 'plain'
+    assert await call(middleware, plain, event, other) == 'plain'
+
+    clock.now += 0.5
+    assert await call(middleware, plain, event, inline) == 'plain'
+
+
+@pytest.mark.asyncio
+async def test_chat_scope_shares_limit_between_users():
+    @throttle(1.0, scope='chat')
+    async def group_command(event):
+        return 'ok'
+
+    middleware = ThrottlingMiddleware(router_rates={}, clock=Clock())
+    assert await call(middleware, group_command, Event(1, chat_id=-100)) == 'ok'
+    assert await call(middleware, group_command, Event(2, chat_id=-100)) is None
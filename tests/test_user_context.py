@@ -0,0 +1,100 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from core.database.models import UserStatus
+from core.filters.admin import IsAdminFilter, IsModeratorFilter, IsTeacherFilter
+from core.services import user_context as user_context_module
+from core.services import user_service
+from core.services.user_context import UserContext, UserContextCache, normalize_status
+
+
+class FakeSessionFactory:
+    def __init__(self):
+        self.opened = 0
+        self.session = MagicMock()
+        self.session.execute = AsyncMock()
+        self.session.flush = AsyncMock()
+        self.session.commit = AsyncMock()
+
+    def __call__(self):
+        self.opened += 1
+        return self
+
+    async def __aenter__(self):
+        return self.session
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.fixture(autouse=True)
+def fresh_interaction_throttle(monkeypatch):
+    user_service._interaction_writes.clear()
+    yield
+    user_service._interaction_writes.clear()
+
+
+@pytest.mark.asyncio
+async def test_resolve_caches_and_throttles_interaction_writes(monkeypatch):
+    calls = []
+
+    async def get_or_create_user(session, user_id, username=None, touch=True):
+        calls.append(touch)
+        if touch:
+            user_service.mark_interaction_written(user_id)
+        return SimpleNamespace(id=user_id, username=username, status='no_sub')
+
+    monkeypatch.setattr(user_context_module, "get_or_create_user", get_or_create_user)
+    factory = FakeSessionFactory()
+    cache = UserContextCache(session_factory=factory)
+
+    first = await cache.resolve(5, "pupil")
+    assert first.status == UserStatus.NO_SUB
+    for _ in range(10):
+        assert await cache.resolve(5, "pupil") is first
+
+    # Один поход в БД на создание/чтение, повторные апдейты - без записи активности
+    assert calls == [True]
+    assert factory.opened == 1
+    factory.session.execute.assert_not_awaited()
+
+    # Сменился username - перечитываем, но активность уже записана недавно
+    await cache.resolve(5, "renamed")
+    assert calls == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_invalidate_picks_up_new_status():
+    factory = FakeSessionFactory()
+    factory.session.get = AsyncMock(side_effect=[
+        SimpleNamespace(id=1, username=None, status=UserStatus.TEACHER),
+        SimpleNamespace(id=1, username=None, status=UserStatus.ADMIN),
+    ])
+    cache = UserContextCache(session_factory=factory)
+
+    assert (await cache.get(1)).status == UserStatus.TEACHER
+    assert (await cache.get(1)).status == UserStatus.TEACHER
+    cache.invalidate(1)
+    assert (await cache.get(1)).is_admin
+    assert factory.session.get.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_filters_use_context_from_middleware(monkeypatch):
+    lookup = AsyncMock()
+    monkeypatch.setattr("core.filters.admin.user_contexts", SimpleNamespace(get=lookup))
+    message = SimpleNamespace(from_user=SimpleNamespace(id=3))
+    moderator = UserContext(id=3, username=None, status=UserStatus.MODERATOR)
+
+    assert not await IsAdminFilter()(message, user_context=moderator)
+    assert await IsModeratorFilter()(message, user_context=moderator)
+    assert await IsTeacherFilter()(message, user_context=moderator)
+    lookup.assert_not_awaited()
+
+
+def test_normalize_status():
+    assert normalize_status('NO_SUB') == UserStatus.NO_SUB
+    assert normalize_status('admin') == UserStatus.ADMIN
+    assert normalize_status(UserStatus.SUB) == UserStatus.SUB
+    assert normalize_status(None) == UserStatus.NO_SUB
@@ -0,0 +1,143 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from core import webhook
+from core.webhook import SECRET_HEADER, WebhookServer, update_routing_key
+
+TOKEN = '123456789:AAHjKLMNopQRsTuVWXyZ-1234567890_abcDE'
+SECRET = 'test-secret'
+
+
+def captured_updates(count: int, users: int) -> list:
+    """Поток апдейтов, как его присылает Telegram: сообщения вперемешку от разных пользователей"""
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = 1000 + update_id % users
+        updates.append({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': 1700000000,
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+                'text': f"{update_id}"
+            }
+        })
+    return updates
+
+
+def make_dispatcher(handled: list, delay: float = 0.0) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def record(message: Message):
+        # Имитация запроса к БД или Telegram
+        await asyncio.sleep(delay)
+        handled.append((message.from_user.id, int(message.text)))
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+async def start(server: WebhookServer) -> TestClient:
+    client = TestClient(TestServer(server.create_app()))
+    await client.start_server()
+    return client
+
+
+async def post(client: TestClient, update: dict, secret: str = SECRET) -> int:
+    response = await client.post('/webhook', json=update, headers={SECRET_HEADER: secret})
+    return response.status
+
+
+@pytest.mark.asyncio
+async def test_secret_token_is_required():
+    handled = []
+    server = WebhookServer(make_dispatcher(handled), Bot(TOKEN), secret_token=SECRET, workers=2)
+    client = await start(server)
+    update = captured_updates(1, 1)[0]
+
+    assert await post(client, update, secret='wrong') == 401
+    response = await client.post('/webhook', json=update)
+    assert response.status == 401
+    assert await post(client, update) == 200
+
+    await client.close()
+    assert handled == [(1000, 1)]
+    assert server.metrics.rejected == 2
+
+
+def test_server_refuses_to_run_without_secret():
+    with pytest.raises(ValueError):
+        WebhookServer(make_dispatcher([]), Bot(TOKEN), secret_token=None)
+    with pytest.raises(ValueError):
+        WebhookServer(make_dispatcher([]), Bot(TOKEN), secret_token='')
+
+
+def test_run_webhook_requires_secret_for_external_registration(monkeypatch):
+    monkeypatch.setattr(webhook, 'WEBHOOK_SECRET', None)
+    monkeypatch.setattr(webhook, 'WEBHOOK_BASE_URL', '')
+    run_app = MagicMock()
+    monkeypatch.setattr(webhook.web, 'run_app', run_app)
+
+    with pytest.raises(RuntimeError):
+        webhook.run_webhook(make_dispatcher([]), Bot(TOKEN), host='127.0.0.1', port=0)
+    run_app.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_replayed_stream_keeps_per_user_order():
+    handled = []
+    updates = captured_updates(2000, users=50)
+    server = WebhookServer(make_dispatcher(handled, delay=0.001), Bot(TOKEN),
+                           secret_token=SECRET, workers=8)
+    client = await start(server)
+
+    # Апдейты одного чата Telegram доставляет последовательно, разных - параллельно
+    streams = {}
+    for update in updates:
+        streams.setdefault(update_routing_key(update), []).append(update)
+
+    async def replay(stream):
+        return [await post(client, update) for update in stream]
+
+    results = await asyncio.gather(*(replay(stream) for stream in streams.values()))
+    await asyncio.gather(*(queue.join() for queue in server._queues))
+    await client.close()
+
+    assert {status for statuses in results for status in statuses} == {200}
+    assert len(handled) == len(updates)
+    for user_id in {user_id for user_id, _ in handled}:
+        sequence = [number for uid, number in handled if uid == user_id]
+        assert sequence == sorted(sequence)
+
+
+@pytest.mark.asyncio
+async def test_shutdown_drains_accepted_updates():
+    handled = []
+    server = WebhookServer(make_dispatcher(handled, delay=0.01), Bot(TOKEN),
+                           secret_token=SECRET, workers=2)
+    client = await start(server)
+    updates = captured_updates(20, users=4)
+    assert {await post(client, update) for update in updates} == {200}
+    assert len(handled) < len(updates)
+
+    await server.stop()
+    # Все принятые апдейты обработаны, новые отклоняются до выхода из процесса
+    assert len(handled) == len(updates)
+    assert await post(client, updates[0]) == 503
+    await client.close()
+
+
+def test_routing_key_uses_sender():
+    update = captured_updates(1, 1)[0]
+    assert update_routing_key(update) == 1000
+    callback = {'update_id': 5, 'callback_query': {'id': '1', 'from': {'id': 77}}}
+    assert update_routing_key(callback) == 77
+    assert update_routing_key({'update_id': 9}) == 9